@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def lifespan(receive, send):
+    """ASGI lifespan: close the /api/v2/ views' aiobotocore clients on shutdown."""
+    from weather_analysis.async_views import aws_clients
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aws_clients.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    # Django's ASGI handler only serves HTTP; lifespan events are handled here
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "weather_analysis.middleware.CompressionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -67,9 +68,45 @@ CORS_ALLOW_METHODS = [
 CORS_ALLOW_CREDENTIALS = True
 
 ROOT_URLCONF = "config.urls"
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "weather_analysis.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
 # Celery and Redis configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'        
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'    
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/1'
+# Analyses of the same file are routed to one of WEATHER_AFFINITY_QUEUES queues
+# (weather_analysis.affinity.<n>) when it is > 0; start each worker with
+# `-Q celery,weather_analysis.affinity.<n>` so every queue has a consumer.
+CELERY_TASK_ROUTES = ('weather_analysis.dataset_cache.route_analysis_task',)
+WEATHER_AFFINITY_QUEUES = 0
+
+# Per-worker-process cache of parsed, column-projected upload frames, and
+# warm-up of the analysis stack in each new prefork child
+WEATHER_DATASET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+WEATHER_DATASET_CACHE_TTL = 60 * 60
+WEATHER_WORKER_PRELOAD = True
+
+# Opt-in job profiling: uploads with profile=true, plus this share of all jobs,
+# run under a sampling profiler (and tracemalloc for peak memory); the speedscope
+# file is stored at s3://<bucket>/profiles/<job_id>.speedscope.json
+WEATHER_PROFILE_SAMPLE_RATE = 0.0
+WEATHER_PROFILE_INTERVAL = 0.005
+WEATHER_PROFILE_MAX_SAMPLES = 200000
+WEATHER_PROFILE_TRACE_MEMORY = True
+
+# Analysis task retries for throttled/transient AWS and Redis errors:
+# exponential backoff with full jitter, resuming from the last checkpointed stage
+WEATHER_TASK_MAX_RETRIES = 5
+WEATHER_TASK_RETRY_BACKOFF = 2
+WEATHER_TASK_RETRY_BACKOFF_MAX = 300
+WEATHER_CHECKPOINT_TIMEOUT = 86400    
+# Checkpoint directories older than WEATHER_CHECKPOINT_TIMEOUT (abandoned or
+# crashed jobs) are swept from the spool at most this often per worker process
+WEATHER_CHECKPOINT_SWEEP_INTERVAL = 3600
 
 CACHES = {
     "default": {
@@ -81,6 +118,76 @@ CACHES = {
     }
 }
 
+# Worker download spool: concurrent ranged S3 GETs into local files that are
+# kept as an LRU disk cache (None uses a directory under the system temp dir).
+WEATHER_SPOOL_DIR = None
+WEATHER_SPOOL_MAX_BYTES = 2 * 1024 ** 3
+WEATHER_DOWNLOAD_PART_BYTES = 8 * 1024 * 1024
+WEATHER_DOWNLOAD_CONCURRENCY = 8
+
+# Upload admission control: per-client token bucket (stored in the Redis cache)
+# and broker queue-depth thresholds for deferring or rejecting new jobs
+WEATHER_UPLOAD_RATE_PER_MINUTE = 30
+WEATHER_UPLOAD_BURST = 10
+WEATHER_CLIENT_ID_HEADER = None  # e.g. "HTTP_X_FORWARDED_FOR" behind a trusted proxy
+WEATHER_QUEUE_DEFER_DEPTH = 50
+WEATHER_QUEUE_REJECT_DEPTH = 500
+WEATHER_TASK_AVG_SECONDS = 30
+WEATHER_ADMISSION_WORKER_TTL = 15
+
+# Maximum points per resampled/rolling aggregate series in analysis results
+WEATHER_AGGREGATE_MAX_POINTS = 1000
+# Maximum points per group in grouped (group_by) analysis series, and across all groups
+WEATHER_GROUP_MAX_POINTS = 50
+WEATHER_GROUP_MAX_SERIES_POINTS = 2000
+
+# Seasonal z-score anomaly detection (streamed in chunks with online statistics)
+WEATHER_ANOMALY_CHUNK_SIZE = 50000
+WEATHER_ANOMALY_Z_THRESHOLD = 3.0
+WEATHER_ANOMALY_MIN_BASELINE = 10
+WEATHER_ANOMALY_MAX_RESULTS = 100
+
+# KLL sketch size for data-quality quantiles (rank error roughly 1.7 / k)
+WEATHER_QUALITY_SKETCH_K = 200
+
+# Upload-time approximate preview from a bounded sample (CSV: evenly spaced
+# byte blocks; Excel: leading rows), cached until the exact result lands
+WEATHER_PREVIEW_ENABLED = True
+WEATHER_PREVIEW_MIN_BYTES = 512 * 1024
+WEATHER_PREVIEW_BLOCKS = 256
+WEATHER_PREVIEW_BLOCK_BYTES = 4 * 1024
+WEATHER_PREVIEW_MAX_ROWS = 50000
+# Rows streamed from each .xlsx sheet for a preview (~40 µs per row with openpyxl)
+WEATHER_PREVIEW_EXCEL_MAX_ROWS = 2000
+WEATHER_PREVIEW_TIMEOUT = 3600
+
+# In-process result cache tier in front of Redis (per web process)
+WEATHER_LOCAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+WEATHER_LOCAL_CACHE_TTL = 60 * 60
+WEATHER_RESULT_CACHE_CHANNEL = "analysis_result_invalidations"
+
+# Redis result values: zstd/lz4/zlib compressed, summary-only above the cap,
+# refreshed early by a single reader holding the lock to avoid stampedes.
+WEATHER_RESULT_CACHE_TIMEOUT = 60 * 60 * 24
+WEATHER_RESULT_CACHE_CODEC = "zstd"
+WEATHER_RESULT_CACHE_COMPRESS_MIN_BYTES = 1024
+WEATHER_RESULT_CACHE_MAX_VALUE_BYTES = 1024 * 1024
+WEATHER_RESULT_CACHE_LOCK_TIMEOUT = 30
+WEATHER_RESULT_CACHE_LOCK_WAIT = 2.0
+
+# DynamoDB items are capped at 400 KB: encoded results larger than this are
+# stored in S3 under results/ and their JobResults item keeps the key instead
+WEATHER_RESULT_ITEM_MAX_BYTES = 300 * 1024
+
+# HTTP caching of completed results (Cache-Control: public, immutable) and response
+# compression. Jobs can be deleted, so shared caches keep a result for only
+# WEATHER_RESULT_SHARED_MAX_AGE unless WEATHER_CDN_PURGE, the dotted path of a
+# callable taking a list of URLs, purges them on delete.
+WEATHER_RESULT_MAX_AGE = 60 * 60 * 24
+WEATHER_RESULT_SHARED_MAX_AGE = 5 * 60
+WEATHER_CDN_PURGE = None
+WEATHER_COMPRESSION_MIN_BYTES = 1024
+
 # AWS Configuration
 
 AWS_ACCESS_KEY_ID=''
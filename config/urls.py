@@ -21,4 +21,6 @@ from django.urls import path, include
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('weather_analysis.urls')),
+    # ASGI-native endpoints, served by `uvicorn config.asgi:application`
+    path('api/v2/', include('weather_analysis.async_urls')),
 ]
\ No newline at end of file
@@ -0,0 +1,154 @@
+import math
+from dataclasses import dataclass
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from config.celery import app
+
+# Atomic token bucket: refill by elapsed time, then try to take one token.
+# Time comes from the Redis server, so clock skew between app servers sharing
+# a bucket cannot over- or under-refill it. Returns {allowed, tokens_left}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+_broker_client = None
+
+
+@dataclass
+class AdmissionDecision:
+    allowed: bool
+    status: int = 202
+    retry_after: int = 0
+    reason: str = ''
+    queue_depth: int = 0
+    estimated_start_seconds: int = 0
+
+
+def client_identifier(request, user=None) -> str:
+    """Rate-limit key: the authenticated user, else the configured header or the remote address."""
+    if user is None:
+        user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    header = getattr(settings, 'WEATHER_CLIENT_ID_HEADER', None)
+    if header and request.META.get(header):
+        return f"ip:{request.META[header].split(',')[0].strip()}"
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+async def aclient_identifier(request) -> str:
+    """client_identifier for async views: request.user would hit the session store synchronously."""
+    auser = getattr(request, 'auser', None)
+    return client_identifier(request, await auser() if auser is not None else None)
+
+
+def _broker():
+    global _broker_client
+    if _broker_client is None:
+        _broker_client = redis.Redis.from_url(
+            settings.CELERY_BROKER_URL, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return _broker_client
+
+
+def broker_queue_depth(queue: str = None) -> int:
+    """Number of messages waiting in the Celery queue (and any affinity queues) on the Redis broker."""
+    if queue:
+        return int(_broker().llen(queue))
+    from .dataset_cache import affinity_queues
+    queues = [getattr(settings, 'CELERY_TASK_DEFAULT_QUEUE', 'celery')] + affinity_queues()
+    with _broker().pipeline(transaction=False) as pipe:
+        for name in queues:
+            pipe.llen(name)
+        return int(sum(pipe.execute()))
+
+
+def active_worker_count() -> int:
+    """Workers answering a ping, cached briefly because the broadcast is slow."""
+    cache_key = 'admission_active_workers'
+    count = cache.get(cache_key)
+    if count is None:
+        replies = app.control.inspect(timeout=0.5).ping() or {}
+        count = len(replies)
+        cache.set(cache_key, count, timeout=getattr(settings, 'WEATHER_ADMISSION_WORKER_TTL', 15))
+    return count
+
+
+def consume_upload_token(client_id: str) -> AdmissionDecision:
+    """Take one token from the client's bucket; 429 with Retry-After when empty."""
+    per_minute = getattr(settings, 'WEATHER_UPLOAD_RATE_PER_MINUTE', 30)
+    burst = getattr(settings, 'WEATHER_UPLOAD_BURST', 10)
+    rate = per_minute / 60.0
+    try:
+        from django_redis import get_redis_connection
+        connection = get_redis_connection('default')
+        allowed, tokens = connection.eval(
+            TOKEN_BUCKET_SCRIPT, 1, f"upload_tokens:{client_id}", rate, burst
+        )
+    except NotImplementedError:
+        # Not a Redis cache backend: rate limiting is disabled
+        return AdmissionDecision(allowed=True)
+    except Exception as e:
+        print(f"[ADMISSION] Token bucket unavailable, admitting: {type(e).__name__}: {e}")
+        return AdmissionDecision(allowed=True)
+
+    if int(allowed):
+        return AdmissionDecision(allowed=True)
+    retry_after = max(1, math.ceil((1 - float(tokens)) / rate))
+    return AdmissionDecision(
+        allowed=False, status=429, retry_after=retry_after,
+        reason="Upload rate limit exceeded for this client.",
+    )
+
+
+def check_queue_admission() -> AdmissionDecision:
+    """
+    Backpressure on the analysis queue. Below WEATHER_QUEUE_DEFER_DEPTH jobs are
+    admitted outright; up to WEATHER_QUEUE_REJECT_DEPTH they are admitted with
+    an estimated start time; above it (or with no live workers) they get 503
+    with a Retry-After sized to drain the backlog. Fails open if the broker
+    cannot be queried.
+    """
+    defer_depth = getattr(settings, 'WEATHER_QUEUE_DEFER_DEPTH', 50)
+    reject_depth = getattr(settings, 'WEATHER_QUEUE_REJECT_DEPTH', 500)
+    task_seconds = getattr(settings, 'WEATHER_TASK_AVG_SECONDS', 30)
+    try:
+        depth = broker_queue_depth()
+        if depth < defer_depth:
+            return AdmissionDecision(allowed=True, queue_depth=depth)
+        workers = active_worker_count()
+    except Exception as e:
+        print(f"[ADMISSION] Queue metrics unavailable, admitting: {type(e).__name__}: {e}")
+        return AdmissionDecision(allowed=True)
+
+    if workers == 0:
+        return AdmissionDecision(
+            allowed=False, status=503, retry_after=30, queue_depth=depth,
+            reason="No analysis workers are available.",
+        )
+
+    estimated_start = math.ceil(depth / workers * task_seconds)
+    if depth >= reject_depth:
+        return AdmissionDecision(
+            allowed=False, status=503, retry_after=estimated_start, queue_depth=depth,
+            reason="Analysis queue is full. Please retry later.",
+        )
+    return AdmissionDecision(allowed=True, queue_depth=depth, estimated_start_seconds=estimated_start)
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .dates import format_dates
+
+AGGREGATE_COLUMNS = ['mean_temp_C', 'humidity', 'wind_speed']
+# Every period is labelled by its first day: weeks run Monday to Sunday
+RESAMPLE_PERIODS = {
+    'daily': 'D',
+    'weekly': 'W-MON',
+    'monthly': 'MS',
+}
+ROLLING_WINDOWS = {
+    '7d': '7D',
+    '30d': '30D',
+}
+
+
+def _max_points() -> int:
+    return getattr(settings, 'WEATHER_AGGREGATE_MAX_POINTS', 1000)
+
+
+def _sample_stride(length: int) -> int:
+    """Stride that keeps at most WEATHER_AGGREGATE_MAX_POINTS evenly spaced rows."""
+    return max(1, int(np.ceil(length / _max_points())))
+
+
+def _sampled_series(index: pd.DatetimeIndex, stride: int) -> dict:
+    """Dates of every `stride`-th row, flagged when rows were skipped."""
+    return {'date': format_dates(index[::stride]).tolist(), 'downsampled': stride > 1, 'stride': stride}
+
+
+def _column_values(values) -> list:
+    """Round to 2 decimals and turn NaN into None for JSON output."""
+    rounded = np.round(np.asarray(values, dtype='float64'), 2)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+
+def resampled_aggregates(indexed: pd.DataFrame, columns=None, periods=None) -> dict:
+    """
+    Mean/min/max of each column per calendar period, as compact columnar series:
+    {'monthly': {'date': [...], 'downsampled': False, 'stride': 1,
+                 'mean_temp_C': {'mean': [...], 'min': [...], 'max': [...]}}}.
+    Periods are labelled by their first day. `indexed` must have a sorted
+    DatetimeIndex; periods without data are omitted. A series longer than
+    WEATHER_AGGREGATE_MAX_POINTS keeps every `stride`-th period and is marked
+    `downsampled`.
+    """
+    columns = columns or AGGREGATE_COLUMNS
+    periods = periods or RESAMPLE_PERIODS
+    aggregates = {}
+    for name, rule in periods.items():
+        table = indexed[columns].resample(rule, label='left', closed='left').agg(['mean', 'min', 'max'])
+        table = table.dropna(how='all')
+        stride = _sample_stride(len(table))
+        series = _sampled_series(table.index, stride)
+        table = table.iloc[::stride]
+        for column in columns:
+            series[column] = {stat: _column_values(table[(column, stat)]) for stat in ('mean', 'min', 'max')}
+        aggregates[name] = series
+    return aggregates
+
+
+def rolling_statistics(indexed: pd.DataFrame, columns=None, windows=None) -> dict:
+    """
+    Trailing time-window mean and standard deviation of the daily means, e.g.
+    {'7d': {'date': [...], 'mean_temp_C': {'mean': [...], 'std': [...]}}}.
+    Windows are calendar based, so gaps in the data shorten a window rather
+    than stretching it over more days. Long series are strided and flagged as
+    in resampled_aggregates.
+    """
+    columns = columns or AGGREGATE_COLUMNS
+    windows = windows or ROLLING_WINDOWS
+    daily = indexed[columns].resample('D').mean().dropna(how='all')
+    statistics = {}
+    for name, window in windows.items():
+        rolling = daily.rolling(window, min_periods=1)
+        means, stds = rolling.mean(), rolling.std()
+        stride = _sample_stride(len(daily))
+        series = _sampled_series(daily.index, stride)
+        for column in columns:
+            series[column] = {
+                'mean': _column_values(means[column].to_numpy()[::stride]),
+                'std': _column_values(stds[column].to_numpy()[::stride]),
+            }
+        statistics[name] = series
+    return statistics
+
+
+def group_statistics(df: pd.DataFrame, group_by: str, columns=None, regression=None) -> dict:
+    """
+    Per-group summary for multi-station files, computed in one groupby pass.
+
+    Counts, means and date ranges come straight from the aggregation; the
+    regression R² (temperature on humidity unless `regression` gives [x, y]) is
+    derived in closed form from per-group sums (r² = cov² / (var_x · var_y)),
+    so no model is fitted per group. Each group's series is downsampled with a
+    per-group stride to WEATHER_GROUP_MAX_POINTS, or fewer so that all series
+    together stay within WEATHER_GROUP_MAX_SERIES_POINTS; past that many groups,
+    only the first groups (in key order) get a series and it is marked `truncated`.
+    Rows without a group key are left out.
+    `df` needs the `date_dt` column and cleaned numeric columns.
+    """
+    x, y = regression or ('humidity', 'mean_temp_C')
+    columns = [col for col in (columns or AGGREGATE_COLUMNS) if col in df.columns]
+    frame = df[list(dict.fromkeys([group_by, 'date_dt'] + columns + [x, y]))]
+    keys = frame[group_by]
+    if keys.isna().any():
+        frame, keys = frame[keys.notna()], keys[keys.notna()]
+    if keys.dtype == object:
+        # Mixed labels (e.g. 101 and 'A7' from a spreadsheet) cannot be sorted together
+        frame = frame.assign(**{group_by: keys.astype(str)})
+    frame = frame.sort_values([group_by, 'date_dt'], kind='stable')
+
+    # Centre on the global means so the sums of squares keep their precision
+    dx = frame[x] - frame[x].mean()
+    dy = frame[y] - frame[y].mean()
+    frame = frame.assign(_x=dx, _y=dy, _xy=dx * dy, _xx=dx * dx, _yy=dy * dy)
+
+    grouped = frame.groupby(group_by, sort=True, observed=True)
+    named = {
+        'count': (y, 'size'),
+        'start': ('date_dt', 'min'),
+        'end': ('date_dt', 'max'),
+        **{col: (col, 'mean') for col in columns},
+        **{name: (name, 'sum') for name in ('_x', '_y', '_xy', '_xx', '_yy')},
+    }
+    table = grouped.agg(**named)
+
+    n = table['count'].to_numpy(dtype='float64')
+    cov = table['_xy'] - table['_x'] * table['_y'] / n
+    var_x = table['_xx'] - table['_x'] ** 2 / n
+    var_y = table['_yy'] - table['_y'] ** 2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = np.where((n > 1) & (var_x > 0) & (var_y > 0), cov ** 2 / (var_x * var_y), np.nan)
+
+    stations = {
+        'key': table.index.tolist(),
+        'count': table['count'].tolist(),
+        'start_date': format_dates(table['start']).tolist(),
+        'end_date': format_dates(table['end']).tolist(),
+        **{col: _column_values(table[col]) for col in columns},
+        'temp_humidity_r2': np.where(np.isnan(r_squared), None, np.round(r_squared, 4)).tolist(),
+    }
+
+    # Downsample every group at once: keep each row whose position within its
+    # group is a multiple of that group's stride, in the groups the budget covers
+    budget = getattr(settings, 'WEATHER_GROUP_MAX_SERIES_POINTS', 2000)
+    points_per_group = max(1, min(getattr(settings, 'WEATHER_GROUP_MAX_POINTS', 50), budget // max(1, len(table))))
+    position = grouped.cumcount().to_numpy()
+    size = grouped[y].transform('size').to_numpy()
+    stride = np.maximum(1, np.ceil(size / points_per_group)).astype('int64')
+    sampled = frame[(position % stride == 0) & (grouped.ngroup().to_numpy() < budget)]
+    series = {
+        'key': sampled[group_by].tolist(),
+        'date': format_dates(sampled['date_dt']).tolist(),
+        y: _column_values(sampled[y]),
+        'points_per_group': points_per_group,
+        'truncated': len(table) > budget,
+    }
+
+    return {
+        'column': group_by,
+        'num_groups': len(table),
+        'stations': stations,
+        'series': series,
+    }
@@ -0,0 +1,91 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .aggregations import AGGREGATE_COLUMNS
+from .dates import format_dates
+from .stats import GroupedRunningStats
+
+
+def detect_anomalies(indexed: pd.DataFrame, columns=None) -> dict:
+    """
+    Flag readings that deviate from their seasonal (month-of-year) baseline.
+
+    Rows are streamed in date order in chunks of WEATHER_ANOMALY_CHUNK_SIZE.
+    Each chunk is merged into online per-month mean/variance accumulators and
+    then scored against them, so the baseline covers everything seen so far.
+    A reading is an anomaly when its baseline has at least
+    WEATHER_ANOMALY_MIN_BASELINE values and |z| >= WEATHER_ANOMALY_Z_THRESHOLD.
+    Only per-column counts and the WEATHER_ANOMALY_MAX_RESULTS most extreme
+    anomalies are returned, so the section stays small however large the file.
+    `indexed` must have a sorted DatetimeIndex.
+    """
+    columns = [col for col in (columns or AGGREGATE_COLUMNS) if col in indexed.columns]
+    chunk_size = getattr(settings, 'WEATHER_ANOMALY_CHUNK_SIZE', 50000)
+    threshold = getattr(settings, 'WEATHER_ANOMALY_Z_THRESHOLD', 3.0)
+    min_baseline = getattr(settings, 'WEATHER_ANOMALY_MIN_BASELINE', 10)
+    max_results = getattr(settings, 'WEATHER_ANOMALY_MAX_RESULTS', 100)
+
+    baselines = {col: GroupedRunningStats(12) for col in columns}
+    counts = {col: 0 for col in columns}
+    # Min-heap of (|z|, sequence, record) holding the most extreme anomalies
+    top = []
+    sequence = 0
+
+    dates = indexed.index.to_numpy()
+    months = indexed.index.month.to_numpy() - 1
+    # Converted once; chunks are views into these arrays
+    column_values = {col: indexed[col].to_numpy(dtype='float64') for col in columns}
+    for start in range(0, len(indexed), chunk_size):
+        chunk_months = months[start:start + chunk_size]
+        chunk_dates = dates[start:start + chunk_size]
+        for col in columns:
+            values = column_values[col][start:start + chunk_size]
+            baseline = baselines[col]
+            baseline.update(chunk_months, values)
+
+            mean = baseline.mean[chunk_months]
+            std = baseline.std()[chunk_months]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = (values - mean) / std
+            flagged = (baseline.count[chunk_months] >= min_baseline) & (np.abs(z) >= threshold)
+            flagged &= np.isfinite(z)
+            counts[col] += int(flagged.sum())
+
+            # Only this chunk's most extreme readings can enter the global top list
+            candidates = np.flatnonzero(flagged)
+            if len(candidates) > max_results:
+                keep = np.argpartition(-np.abs(z[candidates]), max_results - 1)[:max_results]
+                candidates = candidates[keep]
+            for i in candidates:
+                entry = (abs(float(z[i])), sequence, (chunk_dates[i], col, float(values[i]), float(mean[i]), float(z[i])))
+                sequence += 1
+                if len(top) < max_results:
+                    heapq.heappush(top, entry)
+                elif entry[0] > top[0][0]:
+                    heapq.heapreplace(top, entry)
+
+    records = [entry[2] for entry in sorted(top, reverse=True)]
+    record_dates = format_dates([record[0] for record in records]).tolist() if records else []
+    anomalies = [
+        {
+            'date': date,
+            'column': col,
+            'value': round(value, 2),
+            'baseline_mean': round(mean, 2),
+            'z_score': round(z, 2),
+        }
+        for date, (_, col, value, mean, z) in zip(record_dates, records)
+    ]
+
+    return {
+        'method': 'seasonal_zscore',
+        'baseline': 'month_of_year',
+        'z_threshold': threshold,
+        'counts': counts,
+        'total': sum(counts.values()),
+        'anomalies': anomalies,
+        'truncated': sum(counts.values()) > len(anomalies),
+    }
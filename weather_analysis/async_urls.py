@@ -0,0 +1,13 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    # file upload endpoint
+    path('upload/', async_views.upload, name='async-file-upload'),
+    # task status query endpoint
+    path('status/<str:job_id>/', async_views.analysis_status, name='async-analysis-status'),
+    # job statuses list endpoint
+    path('job-statuses/', async_views.job_statuses, name='async-job-statuses'),
+    # delete job endpoint
+    path('delete/<str:job_id>/', async_views.delete_job, name='async-delete-job'),
+]
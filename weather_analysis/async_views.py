@@ -0,0 +1,476 @@
+"""
+ASGI-native versions of the upload, status, list and delete endpoints.
+
+Served under /api/v2/ when the project runs on an ASGI server
+(`uvicorn config.asgi:application`). AWS calls go through aiobotocore and
+the result cache through redis.asyncio, so a request waiting on S3, DynamoDB
+or Redis does not hold a thread, and independent backend calls are issued
+concurrently with asyncio.gather. Celery and the admission checks have no
+async client and run in worker threads via sync_to_async.
+"""
+import asyncio
+import os
+import sys
+import time
+import traceback
+import uuid
+import weakref
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+
+import orjson
+from aiobotocore.session import get_session
+from asgiref.sync import sync_to_async
+from celery.result import AsyncResult
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .admission import aclient_identifier, consume_upload_token, check_queue_admission
+from .renderers import ORJSONRenderer
+from .params import analysis_key
+from .profiling import should_profile
+from .preview import create_preview
+from .cdn import purge_job_from_cdn
+from .result_cache import result_cache, discard_preview
+from .serializers import FileUploadSerializer, JobStatusSerializer
+from .tasks import run_weather_analysis
+from .views import (
+    UPLOAD_CONTENT_TYPES, get_file_hash, resolve_result_layout, results_from_item, results_projection,
+    results_from_legacy_item, results_pointer, convert_result_payload, stored_job_objects,
+    LEGACY_RESULTS_ATTRIBUTE, RESULTS_ATTRIBUTE_LAYOUT,
+    result_etag, etag_matches, set_result_cache_headers, wants_blocking_status, pending_status_data,
+)
+
+
+class AsyncAWSClients:
+    """
+    aiobotocore S3 and DynamoDB clients, opened once per event loop and shared
+    by every request on it (each client keeps its own connection pool). The
+    ASGI lifespan shutdown in config/asgi.py closes them.
+    """
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+
+    async def get(self):
+        loop = asyncio.get_running_loop()
+        opening = self._clients.get(loop)
+        if opening is None:
+            opening = loop.create_task(self._open())
+            self._clients[loop] = opening
+        try:
+            s3, dynamodb, _ = await opening
+        except Exception:
+            self._clients.pop(loop, None)
+            raise
+        return s3, dynamodb
+
+    async def _open(self):
+        session = get_session()
+        credentials = {
+            'region_name': settings.AWS_REGION,
+            'aws_access_key_id': settings.AWS_ACCESS_KEY_ID,
+            'aws_secret_access_key': settings.AWS_SECRET_ACCESS_KEY,
+        }
+        stack = AsyncExitStack()
+        s3 = await stack.enter_async_context(session.create_client('s3', **credentials))
+        dynamodb = await stack.enter_async_context(session.create_client('dynamodb', **credentials))
+        return s3, dynamodb, stack
+
+    async def close(self):
+        """Close the running event loop's clients and their connection pools."""
+        opening = self._clients.pop(asyncio.get_running_loop(), None)
+        if opening is None:
+            return
+        try:
+            _, _, stack = await opening
+        except Exception:
+            return  # never opened
+        await stack.aclose()
+
+
+aws_clients = AsyncAWSClients()
+
+
+def json_response(data, status=200):
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(message, status=500, **extra):
+    return json_response({"error": message, **extra}, status=status)
+
+
+def admission_denied_response(decision):
+    response = error_response(
+        decision.reason, status=decision.status,
+        retry_after=decision.retry_after, queue_depth=decision.queue_depth,
+    )
+    response['Retry-After'] = str(decision.retry_after)
+    return response
+
+
+def request_layout(request) -> str:
+    """Layout from the query/form data, or from an Accept entry carrying a `layout` parameter."""
+    accepted = next(
+        (part for part in request.headers.get('Accept', '').split(',') if 'layout=' in part), None
+    )
+    return resolve_result_layout(request.GET.get('layout') or request.POST.get('layout'), accepted)
+
+
+def invalid_job_id_response(job_id):
+    job_serializer = JobStatusSerializer(data={'job_id': job_id, 'status': 'PENDING', 'timestamp': 0})
+    if job_serializer.is_valid():
+        return None
+    return error_response("Invalid job ID format.", status=400, details=job_serializer.errors)
+
+
+def success_response(request, job_id, payload, etag, message):
+    if etag_matches(request.headers.get('If-None-Match'), etag, result_exists=True):
+        return set_result_cache_headers(HttpResponse(status=304), etag)
+    response = json_response({
+        "status": "SUCCESS",
+        "job_id": job_id,
+        "message": message,
+        "results": orjson.Fragment(payload),
+    })
+    return set_result_cache_headers(response, etag)
+
+
+async def discard_unpublished_job(dynamodb, job_id, celery_id):
+    """Remove a metadata item whose task was never published (unless a later upload replaced it)."""
+    try:
+        await dynamodb.delete_item(
+            TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+            Key={'job_id': {'S': job_id}},
+            ConditionExpression='celery_id = :celery_id',
+            ExpressionAttributeValues={':celery_id': {'S': celery_id}},
+        )
+    except Exception as e:
+        print(f"[FileUpload ERROR] Could not remove metadata of unpublished job {job_id}: {type(e).__name__}: {e}")
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def upload(request):
+    """
+    Async FileUploadView: the S3 upload and the JobMetadata write run
+    concurrently, then the Celery task is published under a pre-generated id.
+    If either write or the publish fails, the metadata item is removed again so
+    no PENDING job is left pointing at a task that will never run.
+    """
+    try:
+        s3, dynamodb = await aws_clients.get()
+    except Exception as e:
+        print(f"[AWS CLIENT INIT ERROR] {type(e).__name__}: {e}")
+        return error_response("AWS clients are not initialized. Check server settings.")
+
+    try:
+        serializer = FileUploadSerializer(data={**request.POST.dict(), 'file': request.FILES.get('file')})
+        if not serializer.is_valid():
+            return error_response("File validation failed.", status=400, details=serializer.errors)
+
+        try:
+            layout = request_layout(request)
+        except ValueError as e:
+            return error_response(str(e), status=400)
+
+        # Per-client token bucket, charged only for valid uploads and before any real work
+        rate_decision = await sync_to_async(consume_upload_token, thread_sensitive=False)(
+            await aclient_identifier(request)
+        )
+        if not rate_decision.allowed:
+            return admission_denied_response(rate_decision)
+
+        file_obj = serializer.validated_data['file']
+        params = serializer.validated_data['params']
+        file_content = file_obj.read()
+        file_extension = os.path.splitext(file_obj.name)[1].lower()
+
+        # hashlib releases the GIL on large inputs, so hash off the event loop
+        content_hash = await sync_to_async(get_file_hash, thread_sensitive=False)(file_content)
+        job_id = analysis_key(content_hash, params)
+        s3_key = f"uploads/{content_hash}{file_extension}"
+
+        cached_result = await result_cache.aget(job_id, layout, allow_summary=True)
+        if cached_result:
+            return json_response({
+                "job_id": job_id,
+                "content_hash": content_hash,
+                "params": params,
+                "status": "SUCCESS",
+                "message": "📋 File already analyzed within 24 hours. Results retrieved from cache.",
+                "results": orjson.Fragment(cached_result),
+                "from_cache": True,
+            })
+
+        # Backpressure: refuse new work when the analysis queue is saturated
+        queue_decision = await sync_to_async(check_queue_admission, thread_sensitive=False)()
+        if not queue_decision.allowed:
+            return admission_denied_response(queue_decision)
+
+        content_type = UPLOAD_CONTENT_TYPES.get(file_extension, file_obj.content_type or "application/octet-stream")
+        # Choosing the task id up front lets the metadata write overlap the upload;
+        # the task itself is only published once the file is in S3.
+        celery_id = str(uuid.uuid4())
+        profile = should_profile(serializer.validated_data['profile'])
+        # The sampled preview is CPU work, so it runs in a thread alongside the uploads
+        preview_payloads, uploaded, recorded = await asyncio.gather(
+            sync_to_async(create_preview, thread_sensitive=False)(job_id, file_content, file_extension, params),
+            s3.put_object(
+                Bucket=settings.AWS_S3_BUCKET_NAME,
+                Key=s3_key,
+                Body=file_content,
+                ContentType=content_type,
+            ),
+            dynamodb.put_item(
+                TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+                Item={
+                    'job_id': {'S': job_id},
+                    'celery_id': {'S': celery_id},
+                    'status': {'S': 'PENDING'},
+                    'timestamp': {'S': str(int(time.time()))},
+                    's3_key': {'S': s3_key},
+                    'content_hash': {'S': content_hash},
+                    'params': {'S': orjson.dumps(params).decode()},
+                },
+            ),
+            return_exceptions=True,
+        )
+        if isinstance(preview_payloads, Exception):
+            preview_payloads = None
+        try:
+            for outcome in (uploaded, recorded):
+                if isinstance(outcome, BaseException):
+                    raise outcome
+            task = await sync_to_async(run_weather_analysis.apply_async, thread_sensitive=False)(
+                args=(job_id, s3_key, params['group_by'], params, profile), task_id=celery_id
+            )
+        except Exception:
+            if not isinstance(recorded, BaseException):
+                await discard_unpublished_job(dynamodb, job_id, celery_id)
+            raise
+
+        response_data = {
+            "job_id": job_id,
+            "content_hash": content_hash,
+            "params": params,
+            "celery_id": task.id,
+            "status": "PENDING",
+            "message": "✅ File uploaded to S3 and Celery job started successfully.",
+            "from_cache": False,
+            "profile": profile,
+        }
+        if queue_decision.estimated_start_seconds:
+            response_data.update({
+                "queue_depth": queue_decision.queue_depth,
+                "estimated_start_seconds": queue_decision.estimated_start_seconds,
+            })
+        if preview_payloads:
+            response_data["preview"] = orjson.Fragment(preview_payloads[layout])
+        return json_response(response_data, status=202)
+
+    except Exception as e:
+        print(f"[FileUpload ERROR] {type(e).__name__}: {e}")
+        traceback.print_exc(file=sys.stdout)
+        return error_response(f"Failed to process file or start job: {str(e)}")
+
+
+@require_http_methods(['GET'])
+async def analysis_status(request, job_id):
+    """
+    Async AnalysisStatusView. The JobMetadata and JobResults lookups run
+    concurrently, so a finished job is answered without consulting Celery;
+    otherwise the task is polled without blocking the event loop.
+    """
+    invalid = invalid_job_id_response(job_id)
+    if invalid is not None:
+        return invalid
+
+    try:
+        layout = request_layout(request)
+    except ValueError as e:
+        return error_response(str(e), status=400)
+
+    # A client holding this ETag already has the result, which never changes
+    etag = result_etag(job_id, layout)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return set_result_cache_headers(HttpResponse(status=304), etag)
+
+    cached_result = await result_cache.aget(job_id, layout)
+    if cached_result:
+        return success_response(request, job_id, cached_result, etag, "Analysis completed successfully (Fetched from cache).")
+
+    try:
+        s3, dynamodb = await aws_clients.get()
+    except Exception as e:
+        print(f"[AWS CLIENT INIT ERROR] {type(e).__name__}: {e}")
+        return error_response("AWS DynamoDB client not initialized.")
+
+    async def fetch_results():
+        response = await dynamodb.get_item(
+            TableName=settings.DYNAMODB_RESULTS_TABLE_NAME,
+            Key={'job_id': {'S': job_id}},
+            ProjectionExpression=results_projection(),
+        )
+        return response.get('Item')
+
+    async def store_and_respond(results_item):
+        s3_key = results_pointer(results_item)
+        if s3_key:
+            stored = await s3.get_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=s3_key)
+            async with stored['Body'] as body:
+                encoded = (await body.read()).decode()
+            # Converting between layouts decodes the result, so it runs off the event loop
+            payload = await sync_to_async(convert_result_payload, thread_sensitive=False)(
+                encoded, RESULTS_ATTRIBUTE_LAYOUT, layout,
+            )
+        else:
+            payload = await sync_to_async(results_from_item, thread_sensitive=False)(results_item, layout)
+        if payload is None:
+            # Fall back to the records layout only for items that predate the stored one
+            legacy = await dynamodb.get_item(
+                TableName=settings.DYNAMODB_RESULTS_TABLE_NAME,
+                Key={'job_id': {'S': job_id}},
+                ProjectionExpression=LEGACY_RESULTS_ATTRIBUTE,
+            )
+            payload = await sync_to_async(results_from_legacy_item, thread_sensitive=False)(
+                legacy.get('Item') or {}, layout,
+            )
+        await sync_to_async(result_cache.set, thread_sensitive=False)(job_id, {layout: payload}, local=True)
+        return success_response(request, job_id, payload, etag, "Analysis completed successfully (Fetched from JobResults).")
+
+    try:
+        metadata, results_item = await asyncio.gather(
+            dynamodb.get_item(
+                TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+                Key={'job_id': {'S': job_id}},
+                ProjectionExpression='celery_id',
+            ),
+            fetch_results(),
+        )
+        if results_item:
+            return await store_and_respond(results_item)
+
+        item = metadata.get('Item')
+        if not item:
+            return error_response(f"Job ID {job_id} not found.", status=404)
+
+        celery_id = item.get('celery_id', {}).get('S')
+        if not celery_id:
+            raise ValueError("Celery ID missing for this job in metadata.")
+
+        celery_task_result = AsyncResult(celery_id)
+        ready = sync_to_async(celery_task_result.ready, thread_sensitive=False)
+        if not wants_blocking_status(request.GET.get('wait')) and not await ready():
+            current_status = await sync_to_async(lambda: celery_task_result.status, thread_sensitive=False)()
+            data = await sync_to_async(pending_status_data, thread_sensitive=False)(job_id, current_status, layout)
+            return json_response(data)
+        while not await ready():
+            await asyncio.sleep(1)
+
+        current_status = await sync_to_async(lambda: celery_task_result.status, thread_sensitive=False)()
+        response_data = {"status": current_status, "job_id": job_id}
+
+        if current_status == 'SUCCESS':
+            results_item = await fetch_results()
+            if not results_item:
+                raise ValueError("Analysis results not found in JobResults table.")
+            return await store_and_respond(results_item)
+
+        if current_status == 'FAILURE':
+            response_data.update({
+                "message": "Analysis failed.",
+                "error": str(await sync_to_async(lambda: celery_task_result.result, thread_sensitive=False)()),
+            })
+            return json_response(response_data, status=500)
+
+        return json_response(response_data)
+
+    except Exception as e:
+        print(f"[STATUS FETCH ERROR] {type(e).__name__}: {e}")
+        traceback.print_exc(file=sys.stdout)
+        return json_response(
+            {"error": f"Failed to retrieve job status or result: {str(e)}", "status": "FAILURE"}, status=500
+        )
+
+
+@require_http_methods(['GET'])
+async def job_statuses(request):
+    """Async ListJobStatusesView: jobs from the past 24 hours, newest first."""
+    try:
+        _, dynamodb = await aws_clients.get()
+    except Exception as e:
+        print(f"[AWS CLIENT INIT ERROR] {type(e).__name__}: {e}")
+        return error_response("AWS DynamoDB client not initialized.")
+
+    try:
+        time_24_hours_ago_str = str(int((datetime.now() - timedelta(hours=24)).timestamp()))
+        response = await dynamodb.scan(
+            TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+            FilterExpression='#t >= :cutoff',
+            ProjectionExpression='job_id, #s, #t',
+            ExpressionAttributeNames={'#t': 'timestamp', '#s': 'status'},
+            ExpressionAttributeValues={':cutoff': {'S': time_24_hours_ago_str}},
+        )
+
+        job_statuses = [
+            {
+                'job_id': item.get('job_id', {}).get('S', 'N/A'),
+                'status': item.get('status', {}).get('S', 'UNKNOWN'),
+                'timestamp': int(item.get('timestamp', {}).get('S', '0')),
+            }
+            for item in response.get('Items', [])
+        ]
+        job_statuses.sort(key=lambda x: x['timestamp'], reverse=True)
+        return json_response(job_statuses)
+
+    except Exception as e:
+        print(f"[LIST STATUSES ERROR] {type(e).__name__}: {e}")
+        traceback.print_exc(file=sys.stdout)
+        return error_response(f"Failed to list job statuses: {str(e)}")
+
+
+@csrf_exempt
+@require_http_methods(['DELETE'])
+async def delete_job(request, job_id):
+    """Async DeleteJobView: the DynamoDB and cache deletes run concurrently, then the profile's."""
+    invalid = invalid_job_id_response(job_id)
+    if invalid is not None:
+        return invalid
+
+    try:
+        s3, dynamodb = await aws_clients.get()
+    except Exception as e:
+        print(f"[AWS CLIENT INIT ERROR] {type(e).__name__}: {e}")
+        return error_response("AWS DynamoDB client not initialized.")
+
+    try:
+        deleted_metadata, *_ = await asyncio.gather(
+            dynamodb.delete_item(
+                TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+                Key={'job_id': {'S': job_id}},
+                ReturnValues='ALL_OLD',
+            ),
+            dynamodb.delete_item(
+                TableName=settings.DYNAMODB_RESULTS_TABLE_NAME,
+                Key={'job_id': {'S': job_id}},
+            ),
+            result_cache.ainvalidate(job_id),
+            sync_to_async(discard_preview, thread_sensitive=False)(job_id),
+        )
+        # Only once the result is gone, so the CDN cannot refetch it
+        await sync_to_async(purge_job_from_cdn, thread_sensitive=False)(job_id)
+
+        # Delete the job's profile and offloaded result, if any; the job is gone either way
+        for name, s3_key in stored_job_objects(job_id, deleted_metadata.get('Attributes', {})):
+            try:
+                await s3.delete_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=s3_key)
+            except Exception as e:
+                print(f"[DELETE JOB] Failed to delete {name} of {job_id}: {type(e).__name__}: {e}")
+        return json_response({"message": f"Job {job_id} deleted successfully."})
+
+    except Exception as e:
+        print(f"[DELETE JOB ERROR] {type(e).__name__}: {e}")
+        traceback.print_exc(file=sys.stdout)
+        return error_response(f"Failed to delete job: {str(e)}")
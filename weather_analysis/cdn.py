@@ -0,0 +1,41 @@
+from itertools import product
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .result_cache import RESULT_LAYOUTS
+
+# Status endpoints whose completed-result responses shared caches may hold
+RESULT_URL_NAMES = ('analysis-status', 'async-analysis-status')
+
+
+def result_urls(job_id: str) -> list:
+    """Every URL a CDN may hold a job's result under: both API versions, each layout, with and without ?wait=false."""
+    queries = [
+        '&'.join(part for part in parts if part)
+        for parts in product([''] + [f'layout={layout}' for layout in RESULT_LAYOUTS], ['', 'wait=false'])
+    ]
+    urls = []
+    for name in RESULT_URL_NAMES:
+        path = reverse(name, args=[job_id])
+        urls += [f"{path}?{query}" if query else path for query in queries]
+    return urls
+
+
+def purge_job_from_cdn(job_id: str) -> bool:
+    """
+    Ask the CDN to drop a deleted job's cached results through WEATHER_CDN_PURGE,
+    the dotted path of a callable that takes the list of URLs. Without one,
+    shared caches serve a deleted result for at most WEATHER_RESULT_SHARED_MAX_AGE.
+    Failures are logged; they never fail the delete.
+    """
+    purge = getattr(settings, 'WEATHER_CDN_PURGE', None)
+    if not purge:
+        return False
+    try:
+        import_string(purge)(result_urls(job_id))
+        return True
+    except Exception as e:
+        print(f"[CDN] Purge of job {job_id} failed: {type(e).__name__}: {e}")
+        return False
@@ -0,0 +1,128 @@
+import os
+import threading
+import shutil
+import time
+
+import orjson
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+from .readers import spool_dir
+
+# Stages of run_weather_analysis, in order. A retry resumes after the last one reached.
+STAGES = ('downloaded', 'parsed', 'analyzed', 'persisted')
+
+_last_sweep = 0.0
+
+
+class JobCheckpoint:
+    """
+    Progress of one analysis job, so a retried task skips completed stages.
+
+    The stage reached is recorded in the cache under the job_id. Intermediate
+    artifacts (the parsed frame and the encoded results) are written next to
+    the spooled upload on the worker's disk; a stage whose artifact is not on
+    this worker (e.g. the retry landed elsewhere) is simply redone. Cache errors
+    only lose the checkpoint, they never fail the job.
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.key = f"analysis_checkpoint_{job_id}"
+        self.directory = os.path.join(checkpoints_dir(), job_id)
+
+    @property
+    def stage(self):
+        try:
+            state = cache.get(self.key)
+        except Exception as e:
+            print(f"[CHECKPOINT] Read failed for {self.job_id}: {type(e).__name__}: {e}")
+            return None
+        return state.get('stage') if state else None
+
+    def reached(self, stage: str) -> bool:
+        current = self.stage
+        return current is not None and STAGES.index(current) >= STAGES.index(stage)
+
+    def mark(self, stage: str):
+        try:
+            cache.set(
+                self.key,
+                {'stage': stage, 'updated': time.time()},
+                timeout=getattr(settings, 'WEATHER_CHECKPOINT_TIMEOUT', 86400),
+            )
+        except Exception as e:
+            print(f"[CHECKPOINT] Write failed for {self.job_id} at {stage}: {type(e).__name__}: {e}")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write(self, name: str, write):
+        """Write an artifact atomically, so a crash never leaves a truncated file behind."""
+        os.makedirs(self.directory, exist_ok=True)
+        partial = f"{self._path(name)}.part-{os.getpid()}-{threading.get_ident()}"
+        write(partial)
+        os.replace(partial, self._path(name))
+
+    def save_frame(self, df: pd.DataFrame):
+        self._write('parsed.pkl', df.to_pickle)
+        self.mark('parsed')
+
+    def load_frame(self):
+        """The parsed frame if the job got past parsing on this worker, else None."""
+        if not self.reached('parsed') or not os.path.exists(self._path('parsed.pkl')):
+            return None
+        return pd.read_pickle(self._path('parsed.pkl'))
+
+    def save_results(self, payloads: dict):
+        def write(path):
+            with open(path, 'wb') as f:
+                f.write(orjson.dumps(payloads))
+        self._write('analyzed.json', write)
+        self.mark('analyzed')
+
+    def load_results(self):
+        """Encoded results by layout if the job got past analysis on this worker, else None."""
+        if not self.reached('analyzed') or not os.path.exists(self._path('analyzed.json')):
+            return None
+        with open(self._path('analyzed.json'), 'rb') as f:
+            return orjson.loads(f.read())
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        try:
+            cache.delete(self.key)
+        except Exception as e:
+            print(f"[CHECKPOINT] Delete failed for {self.job_id}: {type(e).__name__}: {e}")
+
+
+def checkpoints_dir() -> str:
+    return os.path.join(spool_dir(), 'checkpoints')
+
+
+def sweep_stale_checkpoints(force: bool = False) -> int:
+    """
+    Remove checkpoint directories untouched for WEATHER_CHECKPOINT_TIMEOUT. By
+    then their stage record has expired from the cache, so nothing can resume
+    from them: the job was abandoned or its worker died before clearing them.
+    Runs at most once per WEATHER_CHECKPOINT_SWEEP_INTERVAL unless forced, and
+    returns the number of directories removed.
+    """
+    global _last_sweep
+    now = time.time()
+    if not force and now - _last_sweep < getattr(settings, 'WEATHER_CHECKPOINT_SWEEP_INTERVAL', 3600):
+        return 0
+    _last_sweep = now
+    cutoff = now - getattr(settings, 'WEATHER_CHECKPOINT_TIMEOUT', 86400)
+    removed = 0
+    try:
+        with os.scandir(checkpoints_dir()) as it:
+            for entry in it:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[CHECKPOINT] Sweep failed: {type(e).__name__}: {e}")
+    return removed
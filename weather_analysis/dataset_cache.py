@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .result_cache import ByteBudgetLRU
+
+# Queue name prefix for job affinity; queue i serves content hashes that map to i
+AFFINITY_QUEUE_PREFIX = 'weather_analysis.affinity'
+
+
+def content_hash_from_key(s3_key: str) -> str:
+    """Uploads are stored as uploads/<content_hash>.<ext>, so the key names the data."""
+    return os.path.splitext(os.path.basename(s3_key))[0]
+
+
+def frame_size(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetCache:
+    """
+    Parsed, column-projected DataFrames kept in the worker process between tasks.
+
+    Entries are keyed by content hash (params.dataset_key, which adds the Excel
+    sheet choice) rather than job_id: every parameter set analyzed on the same
+    file and sheets shares one parsed frame. A frame holds the union
+    of the columns read for it so far; a request for columns it lacks is a miss
+    and the re-read frame (with the union of columns) replaces it. The cached
+    frame itself is never handed out: get() returns df[columns], a new frame,
+    so a caller cannot modify the cached entry.
+    """
+    def __init__(self):
+        self._lru = None
+
+    @property
+    def lru(self) -> ByteBudgetLRU:
+        # Created on first use, so each prefork child gets its own
+        if self._lru is None:
+            self._lru = ByteBudgetLRU(
+                max_bytes=getattr(settings, 'WEATHER_DATASET_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+                ttl=getattr(settings, 'WEATHER_DATASET_CACHE_TTL', 60 * 60),
+            )
+        return self._lru
+
+    def get(self, content_hash: str, columns: list):
+        """The cached frame projected to `columns`, or None."""
+        df = self.lru.get(content_hash)
+        if df is None or not set(columns) <= set(df.columns):
+            return None
+        return df[columns]
+
+    def columns_to_read(self, content_hash: str, columns: list) -> list:
+        """`columns` plus those of a cached frame it is about to replace, so the new frame covers both."""
+        df = self.lru.get(content_hash)
+        if df is None:
+            return list(columns)
+        return list(dict.fromkeys(list(columns) + list(df.columns)))
+
+    def set(self, content_hash: str, df: pd.DataFrame):
+        return self.lru.set(content_hash, df, size=frame_size(df))
+
+    def discard(self, content_hash: str):
+        self.lru.delete(content_hash)
+
+    def clear(self):
+        self.lru.clear()
+
+    def stats(self) -> dict:
+        return self.lru.stats()
+
+
+dataset_cache = DatasetCache()
+
+
+def affinity_queue(content_hash: str):
+    """Queue a job on this file should go to, or None when affinity routing is off."""
+    queues = getattr(settings, 'WEATHER_AFFINITY_QUEUES', 0)
+    if not queues:
+        return None
+    return f"{AFFINITY_QUEUE_PREFIX}.{int(content_hash[:16], 16) % queues}"
+
+
+def affinity_queues() -> list:
+    return [f"{AFFINITY_QUEUE_PREFIX}.{i}" for i in range(getattr(settings, 'WEATHER_AFFINITY_QUEUES', 0))]
+
+
+def route_analysis_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router (CELERY_TASK_ROUTES): analyses of the same file always go to
+    the same affinity queue, so repeat work lands on the worker that already
+    holds the parsed frame in its dataset cache.
+    """
+    if name != 'weather_analysis.tasks.run_weather_analysis':
+        return None
+    s3_key = args[1] if args and len(args) > 1 else (kwargs or {}).get('s3_key')
+    if not s3_key:
+        return None
+    try:
+        queue = affinity_queue(content_hash_from_key(s3_key))
+    except ValueError:
+        return None  # not a content-addressed key
+    return {'queue': queue} if queue else None
+
+
+def preload_analysis_stack():
+    """
+    Pay the analysis stack's first-use costs (lazy imports in pandas/sklearn,
+    BLAS start-up) with a few trivial calls, so the first real task in a fresh
+    worker process does not. It runs in worker_process_init, which Celery
+    bounds by worker_proc_alive_timeout (4s by default), so it stays well
+    under a second; a heavier warm-up would need that timeout raised.
+    """
+    from sklearn.linear_model import LinearRegression
+
+    x = np.arange(8, dtype='float64')
+    LinearRegression().fit(x.reshape(-1, 1), 2 * x).score(x.reshape(-1, 1), 2 * x)
+    series = pd.Series(x, index=pd.date_range('2024-01-01', periods=len(x)))
+    series.resample('MS').agg(['mean', 'count'])
+    series.rolling(3).mean()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# Candidate date formats, tried in order against a sample of the column.
+# Month-first precedes day-first to match pandas' own inference.
+DATE_FORMATS = [
+    'ISO8601',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%Y/%m/%d',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    '%Y%m%d',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+]
+DATE_SAMPLE_SIZE = 200
+DATE_MATCH_RATIO = 0.9
+
+
+def detect_date_format(values: pd.Series, sample_size: int = DATE_SAMPLE_SIZE):
+    """
+    Return the first format in DATE_FORMATS that parses a sample of `values`.
+    A format qualifies when it parses at least DATE_MATCH_RATIO of the sample,
+    so a few malformed cells do not disable the fast path; returns None otherwise.
+    """
+    sample = values.dropna().head(sample_size).astype(str)
+    if sample.empty:
+        return None
+    best_fmt, best_ratio = None, 0.0
+    for fmt in DATE_FORMATS:
+        try:
+            ratio = pd.to_datetime(sample, format=fmt, errors='coerce').notna().mean()
+        except (ValueError, TypeError):
+            continue
+        if ratio == 1.0:
+            return fmt
+        if ratio > best_ratio:
+            best_fmt, best_ratio = fmt, ratio
+    return best_fmt if best_ratio >= DATE_MATCH_RATIO else None
+
+
+def wall_time(parsed: pd.Series) -> pd.Series:
+    """
+    Drop UTC offsets, keeping each timestamp's local wall time, so
+    '2024-01-01T00:00:00+02:00' stays on 2024-01-01 rather than moving to UTC.
+    Mixed offsets parse to an object column of Timestamps; they are handled per value.
+    """
+    if isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        return parsed.dt.tz_localize(None)
+    if parsed.dtype == object:
+        naive = parsed.map(lambda ts: ts.tz_localize(None) if isinstance(ts, pd.Timestamp) and ts.tzinfo else ts)
+        return pd.to_datetime(naive, errors='coerce')
+    return parsed
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Parse a date column to naive datetime64 with a format detected once from a
+    sample, falling back to pandas' per-element inference only when no format
+    matches. Timestamps with a UTC offset keep their local wall time.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return wall_time(values)
+    fmt = detect_date_format(values)
+    if fmt is None:
+        return wall_time(pd.to_datetime(values, errors='coerce'))
+    return wall_time(pd.to_datetime(values, format=fmt, errors='coerce'))
+
+
+def format_dates(values) -> np.ndarray:
+    """Render datetime64 values as 'YYYY-MM-DD' strings in a single vectorized call."""
+    if isinstance(getattr(values, 'dtype', None), pd.DatetimeTZDtype):
+        # Casting tz-aware values to datetime64 converts them to UTC; keep the wall time
+        values = values.tz_localize(None) if isinstance(values, pd.DatetimeIndex) else values.dt.tz_localize(None)
+    days = np.asarray(values, dtype='datetime64[ns]').astype('datetime64[D]')
+    return np.datetime_as_string(days, unit='D')
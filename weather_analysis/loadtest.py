@@ -0,0 +1,398 @@
+"""
+Offline load-testing harness for the v1 HTTP API and the analysis task.
+
+The Django app runs in-process against local stand-ins: moto for S3 and
+DynamoDB, fakeredis (or a local Redis) for the cache and broker, and an
+in-process pool running run_weather_analysis on threads. Virtual users drive
+upload -> status -> job-statuses -> delete through the full middleware stack
+with django.test.Client, and every S3, DynamoDB and Redis call is counted
+against the endpoint (or the worker) that made it.
+
+Used by `python manage.py loadtest`.
+"""
+import contextvars
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from unittest.mock import patch
+
+import boto3
+import numpy as np
+import pandas as pd
+import redis
+from celery.backends.cache import CacheBackend
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+
+from config.celery import app
+from . import admission, tasks, views
+from .dataset_cache import dataset_cache
+from .result_cache import result_cache
+
+ENDPOINTS = ('upload', 'status', 'job-statuses', 'delete')
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+DEFAULT_SIZE_MIX = '64KB:6,512KB:3,2MB:1'
+LOADTEST_BUCKET = 'weather-analysis-loadtest'
+LOADTEST_CREDENTIALS = {'aws_access_key_id': 'loadtest', 'aws_secret_access_key': 'loadtest'}
+
+
+def parse_size(text: str) -> int:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*', text.upper())
+    if not match:
+        raise ValueError(f"Invalid file size '{text}'. Use e.g. 64KB or 2MB.")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2) or 'B'])
+
+
+def parse_size_mix(text: str) -> list:
+    """'16KB:6,2MB:1' -> [('16KB', 16384, 6.0), ('2MB', 2097152, 1.0)]; weights default to 1."""
+    mix = []
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        label, _, weight = part.partition(':')
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError(f"Weight of '{label}' must be positive.")
+        mix.append((label.strip().upper(), parse_size(label), weight))
+    if not mix:
+        raise ValueError("The file size mix is empty.")
+    return mix
+
+
+def weather_csv(target_bytes: int, seed: int) -> bytes:
+    """Synthetic upload of roughly `target_bytes`, distinct for every seed."""
+    rows = max(30, target_bytes // 26)
+    rng = np.random.default_rng(seed)
+    # Dates repeat every 100000 days (~274 years), within pandas' nanosecond range
+    dates = pd.Timestamp('1800-01-01') + pd.to_timedelta(np.arange(rows) % 100000, unit='D')
+    df = pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'mean_temp_C': rng.normal(15, 8, rows).round(2),
+        'humidity': rng.uniform(20, 100, rows).round(1),
+        'wind_speed': rng.gamma(2, 3, rows).round(1),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def latency_summary(samples) -> dict:
+    """Latency percentiles, mean and max in milliseconds for samples in seconds."""
+    if not len(samples):
+        return {**{f'p{p}': None for p in LATENCY_PERCENTILES}, 'mean': None, 'max': None}
+    millis = np.asarray(samples, dtype='float64') * 1000
+    summary = {f'p{p}': round(float(v), 2) for p, v in zip(LATENCY_PERCENTILES, np.percentile(millis, LATENCY_PERCENTILES))}
+    summary.update({'mean': round(float(millis.mean()), 2), 'max': round(float(millis.max()), 2)})
+    return summary
+
+
+class BackendCallCounter:
+    """
+    Counts backend calls per endpoint. The endpoint is a context-local label set
+    around each request (or task); the app makes its backend calls on the thread
+    serving the request or on pools that run in a copy of its context (e.g.
+    download_to_spool's ranged GETs). Unlabelled calls (e.g. the result cache's
+    invalidation listener) are counted as 'background'.
+    """
+    def __init__(self):
+        self._counts = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._endpoint = contextvars.ContextVar(f'loadtest_endpoint_{id(self)}', default=None)
+
+    @contextmanager
+    def label(self, endpoint: str):
+        token = self._endpoint.set(endpoint)
+        try:
+            yield
+        finally:
+            self._endpoint.reset(token)
+
+    def record(self, call: str):
+        endpoint = self._endpoint.get() or 'background'
+        with self._lock:
+            self._counts[endpoint][call] += 1
+
+    def attach(self, client):
+        """Count every API call a boto3 client makes, e.g. 'dynamodb.GetItem'."""
+        service = client.meta.service_model.service_name
+
+        def before_call(model, **kwargs):
+            self.record(f"{service}.{model.name}")
+        client.meta.events.register('before-call', before_call)
+        return client
+
+    def counts(self) -> dict:
+        with self._lock:
+            return {endpoint: dict(calls) for endpoint, calls in self._counts.items()}
+
+
+def counting_connection_class(base, counter: BackendCallCounter):
+    """A redis-py connection class that reports each command (pipelined ones included) to `counter`."""
+    def command_name(args):
+        name = args[0]
+        return (name.decode() if isinstance(name, bytes) else str(name)).split(' ')[0].upper()
+
+    class CountingConnection(base):
+        def send_command(self, *args, **kwargs):
+            counter.record(f"redis.{command_name(args)}")
+            return super().send_command(*args, **kwargs)
+
+        def pack_commands(self, commands):
+            for args in commands:
+                counter.record(f"redis.{command_name(args)}")
+            return super().pack_commands(commands)
+
+    return CountingConnection
+
+
+class InProcessWorkerPool:
+    """
+    Stands in for `run_weather_analysis.delay`: runs the task with Task.apply on
+    a thread pool (or inline when eager), storing results in the app's result
+    backend so the status endpoint's AsyncResult sees them as it would in production.
+    """
+    def __init__(self, task, workers: int, counter: BackendCallCounter, eager: bool = False):
+        self.task = task
+        self.counter = counter
+        self.eager = eager
+        self._executor = None if eager else ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loadtest-worker')
+        self._lock = threading.Lock()
+        self.durations = []
+        self.failures = 0
+
+    def delay(self, *args):
+        task_id = str(uuid.uuid4())
+        if self.eager:
+            self._run(task_id, args)
+        else:
+            self._executor.submit(self._run, task_id, args)
+        return self.task.AsyncResult(task_id)
+
+    def _run(self, task_id, args):
+        started = time.perf_counter()
+        with self.counter.label('worker'):
+            result = self.task.apply(args=args, task_id=task_id)
+            if result.failed():
+                # Task.apply stores eager successes but not failures; a worker would
+                self.task.backend.mark_as_failure(task_id, result.result, traceback=result.traceback)
+        with self._lock:
+            self.durations.append(time.perf_counter() - started)
+            self.failures += int(result.failed())
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+@contextmanager
+def offline_backends(counter: BackendCallCounter, workers: int = 4, eager: bool = False,
+                     redis_url: str = None, rate_limit: bool = True):
+    """
+    Point the app at moto, fakeredis (or `redis_url`) and an in-process worker
+    pool for the duration of the block; yields the worker pool.
+    """
+    try:
+        from moto import mock_aws
+        from moto.core.botocore_stubber import BotocoreStubber
+    except ImportError as e:
+        raise ImportError("Load testing needs moto: pip install 'moto[s3,dynamodb]'") from e
+
+    # moto's in-memory backends are not thread-safe (concurrent PUTs of one key
+    # race), so requests to the stand-in AWS are served one at a time
+    moto_lock = threading.Lock()
+    process_request = BotocoreStubber.process_request
+
+    def serialized_process_request(stubber, request):
+        with moto_lock:
+            return process_request(stubber, request)
+
+    if redis_url:
+        connection_class = counting_connection_class(redis.Connection, counter)
+        pool_kwargs = {'connection_class': connection_class}
+    else:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        connection_class = counting_connection_class(fakeredis.FakeRedisConnection, counter)
+        pool_kwargs = {'connection_class': connection_class, 'server': server}
+        # django-redis keeps one connection pool per URL for the life of the
+        # process, so each run gets its own host name and therefore its own pool
+        redis_url = f'redis://loadtest-{uuid.uuid4().hex[:8]}:6379'
+
+    with ExitStack() as stack:
+        spool = stack.enter_context(tempfile.TemporaryDirectory(prefix='weather-loadtest-'))
+        stack.enter_context(mock_aws())
+        stack.enter_context(patch.object(BotocoreStubber, 'process_request', serialized_process_request))
+        stack.enter_context(override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            AWS_S3_BUCKET_NAME=LOADTEST_BUCKET,
+            CACHES={'default': {
+                'BACKEND': 'django_redis.cache.RedisCache',
+                'LOCATION': f"{redis_url.rstrip('/')}/2",
+                'OPTIONS': {
+                    'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                    'CONNECTION_POOL_KWARGS': pool_kwargs,
+                },
+            }},
+            WEATHER_SPOOL_DIR=spool,
+            **({} if rate_limit else {'WEATHER_UPLOAD_RATE_PER_MINUTE': 10 ** 9, 'WEATHER_UPLOAD_BURST': 10 ** 9}),
+        ))
+
+        s3 = counter.attach(boto3.client('s3', region_name=settings.AWS_REGION, **LOADTEST_CREDENTIALS))
+        dynamodb = counter.attach(boto3.client('dynamodb', region_name=settings.AWS_REGION, **LOADTEST_CREDENTIALS))
+        s3.create_bucket(Bucket=LOADTEST_BUCKET)
+        for table in (settings.DYNAMODB_METADATA_TABLE_NAME, settings.DYNAMODB_RESULTS_TABLE_NAME):
+            dynamodb.create_table(
+                TableName=table,
+                KeySchema=[{'AttributeName': 'job_id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'job_id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST',
+            )
+
+        broker = redis.Redis.from_url(f"{redis_url.rstrip('/')}/0", **pool_kwargs)
+        pool = InProcessWorkerPool(tasks.run_weather_analysis, workers, counter, eager=eager)
+        for target, attribute, value in (
+            (views, 's3_client', s3), (views, 'dynamodb_client', dynamodb),
+            (tasks, 's3_client', s3), (tasks, 'dynamodb_client', dynamodb),
+            (views, 'run_weather_analysis', pool),
+            (admission, '_broker_client', broker),
+            (app, '_backend_cache', CacheBackend(app=app, url='memory://')),
+            (tasks.run_weather_analysis, 'store_eager_result', True),
+            # One process: invalidate() already drops the local copy, so no pub/sub listener
+            (result_cache, '_listener', False),
+        ):
+            stack.enter_context(patch.object(target, attribute, value))
+        # Start from cold in-process caches; neither outlives the run
+        result_cache.clear_local()
+        dataset_cache.clear()
+        stack.callback(result_cache.clear_local)
+        stack.callback(dataset_cache.clear)
+        try:
+            yield pool
+        finally:
+            pool.shutdown()
+
+
+class VirtualUser:
+    """One client running upload -> status -> (job-statuses) -> (delete) journeys."""
+    def __init__(self, index: int, files: dict, size_mix: list, counter: BackendCallCounter, samples: dict,
+                 seed: int, list_every: int, delete_ratio: float, poll_interval: float):
+        self.client = Client(REMOTE_ADDR=f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}")
+        self.rng = random.Random(seed + index)
+        self.files = files
+        self.size_mix = size_mix
+        self.counter = counter
+        self.samples = samples
+        self.list_every = list_every
+        self.delete_ratio = delete_ratio
+        self.poll_interval = poll_interval
+
+    def request(self, endpoint: str, method: str, path: str, data=None, **extra):
+        started = time.perf_counter()
+        with self.counter.label(endpoint):
+            response = getattr(self.client, method)(path, data, **extra)
+        self.samples[endpoint].append((time.perf_counter() - started, response.status_code))
+        return response
+
+    def run(self, iterations: int):
+        labels = [label for label, _, _ in self.size_mix]
+        weights = [weight for _, _, weight in self.size_mix]
+        for iteration in range(1, iterations + 1):
+            name, content = self.rng.choice(self.files[self.rng.choices(labels, weights)[0]])
+            response = self.request('upload', 'post', '/api/v1/upload/', {
+                'file': SimpleUploadedFile(name, content, content_type='text/csv'),
+            })
+            if response.status_code not in (200, 202):
+                continue
+            job_id = response.json()['job_id']
+
+            if self.poll_interval:
+                # Non-blocking polling, as the front-end does with ?wait=false
+                while True:
+                    response = self.request('status', 'get', f'/api/v1/status/{job_id}/', {'wait': 'false'})
+                    if response.status_code != 200 or response.json().get('status') in ('SUCCESS', 'FAILURE'):
+                        break
+                    time.sleep(self.poll_interval)
+            else:
+                self.request('status', 'get', f'/api/v1/status/{job_id}/')
+
+            if self.list_every and iteration % self.list_every == 0:
+                self.request('job-statuses', 'get', '/api/v1/job-statuses/')
+            if self.rng.random() < self.delete_ratio:
+                self.request('delete', 'delete', f'/api/v1/delete/{job_id}/')
+
+
+def run_load_test(users: int = 8, iterations: int = 10, size_mix: str = DEFAULT_SIZE_MIX, file_pool: int = 5,
+                  workers: int = 4, eager: bool = False, list_every: int = 5, delete_ratio: float = 0.1,
+                  poll_interval: float = 0.0, redis_url: str = None, rate_limit: bool = False, seed: int = 0) -> dict:
+    """
+    Run the load test and return its report: per-endpoint request counts, status
+    codes, requests/sec and latency percentiles, backend calls per endpoint (and
+    per request), and analysis task counts and durations.
+
+    Each size class gets `file_pool` distinct files, so the first upload of a
+    file is analyzed and later ones are served from the result cache until a
+    virtual user deletes that job.
+    """
+    mix = parse_size_mix(size_mix)
+    files = {
+        label: [(f"loadtest-{label.lower()}-{n}.csv", weather_csv(size, seed * 1000 + i * 100 + n))
+                for n in range(file_pool)]
+        for i, (label, size, _) in enumerate(mix)
+    }
+    counter = BackendCallCounter()
+    samples = defaultdict(list)
+
+    with offline_backends(counter, workers=workers, eager=eager, redis_url=redis_url, rate_limit=rate_limit) as pool:
+        virtual_users = [
+            VirtualUser(index, files, mix, counter, samples, seed, list_every, delete_ratio, poll_interval)
+            for index in range(users)
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users, thread_name_prefix='loadtest-user') as executor:
+            for future in [executor.submit(user.run, iterations) for user in virtual_users]:
+                future.result()
+        wall_seconds = time.perf_counter() - started
+        pool.shutdown()
+
+    calls = counter.counts()
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        latencies = [latency for latency, _ in samples[endpoint]]
+        codes = Counter(str(code) for _, code in samples[endpoint])
+        endpoint_calls = calls.get(endpoint, {})
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+            'latency_ms': latency_summary(latencies),
+            'status_codes': dict(sorted(codes.items())),
+            'errors': sum(count for code, count in codes.items() if int(code) >= 500),
+            'backend_calls': dict(sorted(endpoint_calls.items())),
+            'backend_calls_per_request': {
+                call: round(count / len(latencies), 2) for call, count in sorted(endpoint_calls.items())
+            } if latencies else {},
+        }
+
+    total_requests = sum(stats['requests'] for stats in endpoints.values())
+    return {
+        'config': {
+            'users': users, 'iterations': iterations, 'size_mix': [[label, size, weight] for label, size, weight in mix],
+            'file_pool': file_pool, 'workers': workers, 'eager': eager, 'list_every': list_every,
+            'delete_ratio': delete_ratio, 'poll_interval': poll_interval, 'redis': 'url' if redis_url else 'fakeredis',
+            'rate_limit': rate_limit, 'seed': seed,
+        },
+        'wall_seconds': round(wall_seconds, 3),
+        'requests': total_requests,
+        'rps': round(total_requests / wall_seconds, 2) if wall_seconds else None,
+        'endpoints': endpoints,
+        'tasks': {
+            'count': len(pool.durations),
+            'failures': pool.failures,
+            'duration_ms': latency_summary(pool.durations),
+            'backend_calls': dict(sorted(calls.get('worker', {}).items())),
+        },
+        'background_calls': dict(sorted(calls.get('background', {}).items())),
+    }
@@ -0,0 +1,109 @@
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+
+from weather_analysis.loadtest import DEFAULT_SIZE_MIX, ENDPOINTS, LATENCY_PERCENTILES, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the upload/status/job-statuses/delete API offline (moto, fakeredis and an "
+        "in-process worker pool) and report requests/sec, latency percentiles and backend calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8, help="Concurrent virtual users.")
+        parser.add_argument('--iterations', type=int, default=10, help="Upload journeys per user.")
+        parser.add_argument('--sizes', default=DEFAULT_SIZE_MIX,
+                            help="Weighted file size mix, e.g. '16KB:6,256KB:3,2MB:1'.")
+        parser.add_argument('--file-pool', type=int, default=5,
+                            help="Distinct files per size; repeats of a file are served from the result cache.")
+        parser.add_argument('--workers', type=int, default=4, help="Analysis task threads.")
+        parser.add_argument('--eager', action='store_true',
+                            help="Run analyses inline in the upload request instead of on the worker threads.")
+        parser.add_argument('--list-every', type=int, default=5,
+                            help="Request job-statuses every N journeys per user (0 disables).")
+        parser.add_argument('--delete-ratio', type=float, default=0.1,
+                            help="Fraction of journeys that delete their job at the end.")
+        parser.add_argument('--poll-interval', type=float, default=0.0,
+                            help="Poll status with ?wait=false every N seconds instead of one blocking request.")
+        parser.add_argument('--redis-url', default=None,
+                            help="Use this Redis server instead of fakeredis (databases 0 and 2 are written).")
+        parser.add_argument('--rate-limit', action='store_true',
+                            help="Apply the per-client upload token bucket (each virtual user is one client).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--max-p95', action='append', default=[], metavar='ENDPOINT=MS',
+                            help="Fail if an endpoint's p95 latency exceeds MS (repeatable), for CI gates.")
+        parser.add_argument('--json', action='store_true', help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        thresholds = {}
+        for spec in options['max_p95']:
+            endpoint, _, millis = spec.partition('=')
+            if endpoint not in ENDPOINTS or not millis:
+                raise CommandError(f"Invalid --max-p95 '{spec}'. Use ENDPOINT=MS with one of: {', '.join(ENDPOINTS)}")
+            thresholds[endpoint] = float(millis)
+
+        try:
+            report = run_load_test(
+                users=options['users'],
+                iterations=options['iterations'],
+                size_mix=options['sizes'],
+                file_pool=options['file_pool'],
+                workers=options['workers'],
+                eager=options['eager'],
+                list_every=options['list_every'],
+                delete_ratio=options['delete_ratio'],
+                poll_interval=options['poll_interval'],
+                redis_url=options['redis_url'],
+                rate_limit=options['rate_limit'],
+                seed=options['seed'],
+            )
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+        else:
+            self.write_report(report)
+
+        exceeded = [
+            f"{endpoint} p95 {report['endpoints'][endpoint]['latency_ms']['p95']} ms > {limit} ms"
+            for endpoint, limit in thresholds.items()
+            if (report['endpoints'][endpoint]['latency_ms']['p95'] or 0) > limit
+        ]
+        if exceeded:
+            raise CommandError("Latency thresholds exceeded: " + "; ".join(exceeded))
+
+    def write_report(self, report):
+        config = report['config']
+        self.stdout.write(
+            f"{config['users']} users x {config['iterations']} journeys, "
+            f"{'eager' if config['eager'] else config['workers']} workers, {config['redis']}: "
+            f"{report['requests']} requests in {report['wall_seconds']}s ({report['rps']} req/s)\n"
+        )
+
+        percentiles = [f'p{p}' for p in LATENCY_PERCENTILES]
+        header = f"{'endpoint':<14}{'requests':>9}{'req/s':>9}" + "".join(f"{p + ' ms':>10}" for p in percentiles)
+        self.stdout.write(header + f"{'max ms':>10}  status codes")
+        for endpoint, stats in report['endpoints'].items():
+            latency = stats['latency_ms']
+            cells = "".join(f"{latency[p] if latency[p] is not None else '-':>10}" for p in percentiles + ['max'])
+            codes = ", ".join(f"{code}: {count}" for code, count in stats['status_codes'].items())
+            self.stdout.write(f"{endpoint:<14}{stats['requests']:>9}{stats['rps']:>9}{cells}  {codes}")
+
+        self.stdout.write("\nBackend calls per request")
+        for endpoint, stats in report['endpoints'].items():
+            calls = ", ".join(f"{call} {count}" for call, count in stats['backend_calls_per_request'].items())
+            self.stdout.write(f"  {endpoint:<14}{calls or '-'}")
+
+        tasks = report['tasks']
+        duration = tasks['duration_ms']
+        self.stdout.write(
+            f"\nAnalysis tasks: {tasks['count']} run, {tasks['failures']} failed, "
+            f"p50 {duration['p50']} ms, p95 {duration['p95']} ms, max {duration['max']} ms"
+        )
+        calls = ", ".join(f"{call} {count}" for call, count in tasks['backend_calls'].items())
+        self.stdout.write(f"  backend calls: {calls or '-'}")
+        # Calls made outside any request or task, e.g. by listener threads
+        calls = ", ".join(f"{call} {count}" for call, count in report['background_calls'].items())
+        self.stdout.write(f"Background backend calls: {calls or '-'}")
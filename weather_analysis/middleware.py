@@ -0,0 +1,74 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Suffix appended inside a strong ETag for each compressed representation,
+# e.g. "<job_id>" becomes "<job_id>-br" (each encoding is a distinct entity).
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def strip_encoding_suffix(etag: str) -> str:
+    """Return the ETag of the uncompressed representation."""
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress large responses with brotli when the client accepts it (and the
+    brotli package is installed), otherwise gzip. Small bodies are left alone.
+    Strong ETags stay strong by gaining an encoding suffix.
+    """
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        min_bytes = getattr(settings, 'WEATHER_COMPRESSION_MIN_BYTES', 1024)
+        if len(response.content) < min_bytes:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=5)
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+            compressed = gzip.compress(response.content, compresslevel=6, mtime=0)
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'{etag[:-1]}-{encoding}"'
+        return response
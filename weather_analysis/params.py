@@ -0,0 +1,109 @@
+import hashlib
+
+import orjson
+
+# Bump whenever perform_analysis changes its output for the same input, so
+# results computed by an older engine are never served for a new request.
+ENGINE_VERSION = '6'
+
+# Optional result sections; everything else is always computed
+ANALYSIS_SECTIONS = ('aggregates', 'rolling', 'anomalies', 'data_quality', 'groups')
+# Sections computed when a request does not choose: the period and rolling
+# series are opt-in, since they add up to ~250 KB to every result
+DEFAULT_SECTIONS = ('anomalies', 'data_quality', 'groups')
+
+DEFAULT_ANALYSIS_PARAMS = {
+    # Numeric columns that are cleaned, profiled, aggregated and scanned for anomalies
+    'columns': ['mean_temp_C', 'humidity', 'wind_speed'],
+    # Simple regression reported as temp_humidity_r2: [x, y]
+    'regression': ['humidity', 'mean_temp_C'],
+    # Maximum charted points; None keeps every point up to 1000 records, then every third
+    'chart_max_points': None,
+    # Inclusive 'YYYY-MM-DD' bounds on the analyzed records
+    'start_date': None,
+    'end_date': None,
+    'sections': list(DEFAULT_SECTIONS),
+    'group_by': None,
+    # Excel sheets analyzed, by name and in order; None reads the first sheet and
+    # ['*'] every sheet that has the required columns. Ignored for CSV files.
+    'sheets': None,
+}
+
+ANALYSIS_PARAM_FIELDS = tuple(DEFAULT_ANALYSIS_PARAMS)
+
+LEGACY_CHART_THRESHOLD = 1000
+LEGACY_CHART_STRIDE = 3
+
+
+def canonical_params(params: dict = None) -> dict:
+    """
+    Fill in defaults and normalise a parameter set, so requests that mean the
+    same analysis produce the same dict (and therefore the same analysis key).
+    """
+    # An empty list is an explicit choice (sections=[] asks for no optional sections)
+    merged = {**DEFAULT_ANALYSIS_PARAMS, **{k: v for k, v in (params or {}).items() if v is not None and v != ''}}
+    unknown = set(merged) - set(DEFAULT_ANALYSIS_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown analysis parameters: {', '.join(sorted(unknown))}")
+    if not merged['columns']:
+        raise ValueError("columns must name at least one column.")
+    if len(merged['regression']) != 2:
+        raise ValueError("regression must name exactly two columns: [x, y].")
+
+    sections = sorted(set(merged['sections']))
+    invalid = [section for section in sections if section not in ANALYSIS_SECTIONS]
+    if invalid:
+        raise ValueError(f"Unknown sections: {', '.join(invalid)}. Allowed: {', '.join(ANALYSIS_SECTIONS)}")
+
+    # Dates and the analyzed numeric columns are measurements, not station labels
+    group_by = merged['group_by'] or None
+    if group_by in {'date', 'date_dt', CHART_COLUMN, *merged['columns'], *merged['regression']}:
+        raise ValueError(f"Cannot group by '{group_by}': it is the date or an analyzed numeric column.")
+
+    sheets = merged['sheets']
+    if sheets is not None:
+        sheets = list(dict.fromkeys(str(sheet) for sheet in ([sheets] if isinstance(sheets, str) else sheets)))
+    if sheets is not None and (not sheets or ('*' in sheets and len(sheets) > 1)):
+        raise ValueError("sheets must name at least one sheet, or be '*' alone for every sheet.")
+
+    return {
+        # Order is kept: it is the order of the columns in every result section
+        'columns': list(dict.fromkeys(merged['columns'])),
+        'regression': list(merged['regression']),
+        'chart_max_points': int(merged['chart_max_points']) if merged['chart_max_points'] else None,
+        'start_date': str(merged['start_date']) if merged['start_date'] else None,
+        'end_date': str(merged['end_date']) if merged['end_date'] else None,
+        'sections': sections,
+        'group_by': group_by,
+        'sheets': sheets,
+    }
+
+
+# Charted and summarised in every analysis, whatever `columns` holds
+CHART_COLUMN = 'mean_temp_C'
+
+
+def numeric_columns(params: dict) -> list:
+    """Columns converted to numbers; a row is analyzed only if all of them are valid."""
+    return list(dict.fromkeys([CHART_COLUMN] + params['columns'] + params['regression']))
+
+
+def required_columns(params: dict) -> list:
+    """Columns a file must provide for an analysis with `params` (canonical)."""
+    return ['date'] + numeric_columns(params) + ([params['group_by']] if params['group_by'] else [])
+
+
+def dataset_key(content_hash: str, params: dict) -> str:
+    """Key of the parsed frame an analysis reads: the file, narrowed to the chosen Excel sheets."""
+    if params['sheets'] is None:
+        return content_hash
+    return f"{content_hash}:{','.join(params['sheets'])}"
+
+
+def analysis_key(content_hash: str, params: dict) -> str:
+    """
+    Job ID of an analysis: SHA-256 over the file's content hash, the canonical
+    parameters and ENGINE_VERSION. Identical requests share one job and result.
+    """
+    canonical = orjson.dumps(canonical_params(params), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(b'|'.join([content_hash.encode(), canonical, ENGINE_VERSION.encode()])).hexdigest()
@@ -0,0 +1,169 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+from .aggregations import _column_values
+from .dates import format_dates, parse_dates
+from .readers import SAMPLED_EXTENSIONS, read_weather_sample
+from .result_cache import preview_cache_key
+from .params import CHART_COLUMN, canonical_params, numeric_columns, required_columns
+from .tasks import perform_analysis, columnar_to_records, encode_results
+
+logger = logging.getLogger(__name__)
+
+# Two-sided 95% normal quantile used for every preview interval
+Z_95 = 1.96
+
+
+def mean_interval(values: np.ndarray, fraction=None):
+    """Mean and 95% half-width, with the finite population correction when the sampled fraction is known."""
+    n = len(values)
+    mean = float(values.mean())
+    if n < 2:
+        return mean, None
+    half_width = Z_95 * values.std(ddof=1) / np.sqrt(n)
+    if fraction is not None:
+        half_width *= np.sqrt(max(0.0, 1.0 - fraction))
+    return mean, float(half_width)
+
+
+def r_squared_interval(x: np.ndarray, y: np.ndarray):
+    """95% interval for R² of a simple regression, via the Fisher z-transform of r."""
+    n = len(x)
+    if n < 4 or x.std() == 0 or y.std() == 0:
+        return None
+    r = np.clip(np.corrcoef(x, y)[0, 1], -0.999999, 0.999999)
+    spread = Z_95 / np.sqrt(n - 3)
+    low, high = np.tanh(np.arctanh(r) - spread), np.tanh(np.arctanh(r) + spread)
+    if low <= 0 <= high:
+        return [0.0, round(float(max(low ** 2, high ** 2)), 4)]
+    return sorted([round(float(low ** 2), 4), round(float(high ** 2), 4)])
+
+
+def chart_with_bounds(dates: pd.Series, temps: pd.Series) -> dict:
+    """
+    Sampled temperatures bucketed by day, week or month (depending on the span),
+    as columnar series with a 95% interval around each bucket mean.
+    """
+    span_days = (dates.max() - dates.min()).days
+    rule = 'D' if span_days <= 120 else 'W-MON' if span_days <= 3 * 365 else 'MS'
+    # Buckets are labelled by their first day, like the exact result's aggregates
+    table = temps.set_axis(dates).sort_index().resample(rule, label='left', closed='left').agg(['mean', 'std', 'count'])
+    table = table[table['count'] > 0]
+    half_width = Z_95 * table['std'] / np.sqrt(table['count'])
+    return {
+        'date': format_dates(table.index).tolist(),
+        'mean_temp_C': _column_values(table['mean']),
+        'lower': _column_values(table['mean'] - half_width),
+        'upper': _column_values(table['mean'] + half_width),
+    }
+
+
+def build_preview(content: bytes, file_extension: str, params: dict = None) -> dict:
+    """
+    Approximate analysis of a bounded sample of an upload, in the columnar layout.
+
+    The sample goes through perform_analysis with no optional sections, since
+    the preview runs in the upload request: it covers the summary, regression
+    and chart only. The preview adds 95% intervals for the average temperature
+    and R², an estimated record count and a bucketed chart with per-point
+    bounds. Intervals treat sampled rows as
+    independent, which is why CSV samples use many small blocks rather than a
+    few large ones. The preview is marked `approximate` and is superseded by
+    the exact result once the analysis task finishes.
+    """
+    params = canonical_params(params)
+    sample, fraction = read_weather_sample(
+        content, file_extension, columns=required_columns(params), sheets=params['sheets'],
+    )
+    results = perform_analysis(sample, layout='columnar', params={**params, 'sections': []})
+
+    preview = {
+        'status': results['status'],
+        'approximate': True,
+        'report_summary': results['report_summary'],
+        'regression_analysis': dict(results['regression_analysis']),
+        'num_records': results['num_records'],
+        'time_series_data': results['time_series_data'],
+        'sample': {
+            'rows': len(sample),
+            'fraction': round(fraction, 4) if fraction is not None else None,
+            'method': 'csv_blocks' if fraction is not None else 'prefix',
+            'confidence': 0.95,
+        },
+    }
+    if results['status'] != 'SUCCESS':
+        return preview
+
+    # Same rows perform_analysis keeps
+    numeric = {col: pd.to_numeric(sample[col], errors='coerce') for col in numeric_columns(params)}
+    dates = parse_dates(sample['date'])
+    valid = dates.notna()
+    for converted in numeric.values():
+        valid &= converted.notna()
+    if params['start_date']:
+        valid &= dates >= pd.Timestamp(params['start_date'])
+    if params['end_date']:
+        valid &= dates < pd.Timestamp(params['end_date']) + pd.Timedelta(days=1)
+    regression_x, regression_y = params['regression']
+    temps, dates = numeric[CHART_COLUMN][valid], dates[valid]
+    x, y = numeric[regression_x][valid], numeric[regression_y][valid]
+
+    avg_temp, temp_half_width = mean_interval(temps.to_numpy(dtype='float64'), fraction)
+    r2_interval = r_squared_interval(x.to_numpy(dtype='float64'), y.to_numpy(dtype='float64'))
+    sampled_records = results['num_records']
+    estimated_records = int(round(sampled_records / fraction)) if fraction else None
+
+    margin = f" ± {temp_half_width:.2f}" if temp_half_width is not None else ""
+    coverage = (f"about {estimated_records} records ({fraction:.1%} sampled)" if estimated_records
+                else "the start of the file")
+    preview.update({
+        'report_summary': (
+            f"Preview from {sampled_records} sampled records covering {coverage}. "
+            f"The estimated average temperature is {avg_temp:.2f}{margin}°C (95% interval). "
+            f"Exact results replace this preview when the analysis completes."
+        ),
+        'num_records': estimated_records or sampled_records,
+        'time_series_data': chart_with_bounds(dates, temps),
+        'error_bounds': {
+            'avg_temp_C': [round(avg_temp - (temp_half_width or 0), 2), round(avg_temp + (temp_half_width or 0), 2)],
+            'temp_humidity_r2': r2_interval,
+        },
+    })
+    return preview
+
+
+def create_preview(job_id: str, content: bytes, file_extension: str, params: dict = None):
+    """
+    Build and cache the preview of an upload in every layout; returns the
+    encoded payloads by layout, or None when previews are disabled, the file
+    is small enough for the full analysis to be quick, its format cannot be
+    sampled without a full parse (.xls), or the sample fails.
+    """
+    if not getattr(settings, 'WEATHER_PREVIEW_ENABLED', True):
+        return None
+    if file_extension.lower().lstrip('.') not in SAMPLED_EXTENSIONS:
+        return None
+    if len(content) < getattr(settings, 'WEATHER_PREVIEW_MIN_BYTES', 512 * 1024):
+        return None
+    try:
+        preview = build_preview(content, file_extension, params)
+    except Exception:
+        logger.exception("Preview of job %s failed; the upload continues without one", job_id)
+        return None
+
+    payloads = {
+        'columnar': encode_results(preview),
+        'records': encode_results(columnar_to_records(preview)),
+    }
+    try:
+        cache.set_many(
+            {preview_cache_key(job_id, layout): payload for layout, payload in payloads.items()},
+            timeout=getattr(settings, 'WEATHER_PREVIEW_TIMEOUT', 3600),
+        )
+    except Exception:
+        logger.exception("Caching the preview of job %s failed", job_id)
+    return payloads
@@ -0,0 +1,252 @@
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import orjson
+from django.conf import settings
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# tracemalloc is process-wide: profiles tracing memory are registered here, so
+# thread-pool workers running several profiled jobs at once share one tracer
+_memory_lock = threading.Lock()
+_memory_profiles = set()
+_owns_tracemalloc = False
+
+
+def profile_s3_key(job_id: str) -> str:
+    """Profiles are stored next to the uploads, one speedscope file per job."""
+    return f"profiles/{job_id}.speedscope.json"
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Profile a job when the client asked for it, or for a WEATHER_PROFILE_SAMPLE_RATE share of jobs."""
+    return bool(requested) or random.random() < getattr(settings, 'WEATHER_PROFILE_SAMPLE_RATE', 0.0)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread: a daemon thread wakes every `interval`
+    seconds, reads the target thread's stack from sys._current_frames() and
+    records it weighted by the time since the previous sample. The profiled
+    code is not instrumented, so overhead stays at one stack walk per interval.
+    Consecutive identical stacks are merged into one weighted sample.
+    """
+    def __init__(self, thread_id: int = None, interval: float = 0.005, max_samples: int = 200000):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_samples = max_samples
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self.sample_count = 0
+        self.truncated = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = self.stopped = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='job-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return index
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000, now
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.sample_count += 1
+            if self.samples and self.samples[-1] == stack:
+                self.weights[-1] += weight
+            elif len(self.samples) < self.max_samples:
+                self.samples.append(stack)
+                self.weights.append(weight)
+            else:
+                self.truncated = True
+
+    def speedscope(self, name: str) -> dict:
+        """The samples as a speedscope file (https://www.speedscope.app), in milliseconds."""
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'weather_analysis.profiling',
+            'activeProfileIndex': 0,
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(sum(self.weights), 3),
+                'samples': self.samples,
+                'weights': [round(weight, 3) for weight in self.weights],
+            }],
+        }
+
+
+class JobProfile:
+    """
+    Optional profile of one run_weather_analysis attempt: a sampling profile of
+    the task thread plus tracemalloc peak memory, overall and per stage. Disabled
+    instances do nothing, so the task can call them unconditionally.
+
+    The traced peak covers the whole process, so a stage that overlapped with
+    another profiled job in the same process reports no peak (None), and
+    neither does the profile as a whole.
+    """
+    def __init__(self, job_id: str, enabled: bool = False):
+        self.job_id = job_id
+        self.enabled = enabled
+        self.profiler = None
+        self.stages = []
+        self.peak_memory = 0
+        self.memory_shared = False
+        self._traces_memory = False
+        self._stage_shared = False
+        self._stage_started = None
+
+    def _start_memory(self):
+        global _owns_tracemalloc
+        with _memory_lock:
+            if not _memory_profiles:
+                # Leave tracemalloc running if someone else started it
+                _owns_tracemalloc = not tracemalloc.is_tracing()
+                if _owns_tracemalloc:
+                    tracemalloc.start()
+            for other in _memory_profiles:
+                other._stage_shared = True
+            self._stage_shared = bool(_memory_profiles)
+            if not self._stage_shared:
+                tracemalloc.reset_peak()
+            _memory_profiles.add(self)
+            self._traces_memory = True
+
+    def _stage_peak(self):
+        """Peak traced since the previous mark, or None when another profile shared the stage."""
+        with _memory_lock:
+            peak = None if self._stage_shared else tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            self._stage_shared = len(_memory_profiles) > 1
+        return peak
+
+    def _stop_memory(self):
+        global _owns_tracemalloc
+        with _memory_lock:
+            _memory_profiles.discard(self)
+            self._traces_memory = False
+            # The others' current stage included this job's allocations
+            for other in _memory_profiles:
+                other._stage_shared = True
+            if not _memory_profiles and _owns_tracemalloc:
+                tracemalloc.stop()
+                _owns_tracemalloc = False
+
+    def start(self):
+        if not self.enabled:
+            return self
+        if getattr(settings, 'WEATHER_PROFILE_TRACE_MEMORY', True):
+            self._start_memory()
+        self.profiler = SamplingProfiler(
+            interval=getattr(settings, 'WEATHER_PROFILE_INTERVAL', 0.005),
+            max_samples=getattr(settings, 'WEATHER_PROFILE_MAX_SAMPLES', 200000),
+        )
+        self.profiler.start()
+        self._stage_started = time.perf_counter()
+        return self
+
+    def mark(self, stage: str):
+        """Close a stage: its duration and the peak memory traced since the previous mark."""
+        if not self.enabled or self.profiler is None:
+            return
+        now = time.perf_counter()
+        peak = None
+        if self._traces_memory:
+            peak = self._stage_peak()
+            if peak is None:
+                self.memory_shared = True
+            else:
+                self.peak_memory = max(self.peak_memory, peak)
+        self.stages.append({
+            'stage': stage,
+            'seconds': round(now - self._stage_started, 4),
+            'peak_memory_bytes': peak,
+        })
+        self._stage_started = now
+
+    def stop(self):
+        if not self.enabled or self.profiler is None or self.profiler.stopped is not None:
+            return
+        self.mark('finished')
+        self.profiler.stop()
+        if self._traces_memory:
+            self._stop_memory()
+
+    def summary(self) -> dict:
+        profiler = self.profiler
+        return {
+            's3_key': profile_s3_key(self.job_id),
+            'format': 'speedscope',
+            'duration_seconds': round(profiler.stopped - profiler.started, 4),
+            'peak_memory_bytes': (
+                self.peak_memory
+                if getattr(settings, 'WEATHER_PROFILE_TRACE_MEMORY', True) and not self.memory_shared else None
+            ),
+            'stages': self.stages,
+            'samples': profiler.sample_count,
+            'interval_seconds': profiler.interval,
+            'truncated': profiler.truncated,
+            'created': int(time.time()),
+        }
+
+    def save(self, s3_client, dynamodb_client):
+        """
+        Stop profiling, write the speedscope file to S3 and its summary to the
+        job's metadata item. Failures are logged; they never fail the job.
+        """
+        if not self.enabled or self.profiler is None:
+            return
+        try:
+            self.stop()
+            summary = self.summary()
+            s3_client.put_object(
+                Bucket=settings.AWS_S3_BUCKET_NAME,
+                Key=summary['s3_key'],
+                Body=orjson.dumps(self.profiler.speedscope(f"run_weather_analysis {self.job_id}")),
+                ContentType='application/json',
+            )
+            dynamodb_client.update_item(
+                TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+                Key={'job_id': {'S': self.job_id}},
+                UpdateExpression="SET #p = :profile",
+                ExpressionAttributeNames={'#p': 'profile'},
+                ExpressionAttributeValues={':profile': {'S': orjson.dumps(summary).decode()}},
+            )
+            print(f"[PROFILE] Job {self.job_id}: {summary['samples']} samples, "
+                  f"peak memory {summary['peak_memory_bytes']} bytes, stored at {summary['s3_key']}")
+        except Exception as e:
+            print(f"[PROFILE] Failed to store profile for {self.job_id}: {type(e).__name__}: {e}")
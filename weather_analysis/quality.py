@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .dates import format_dates
+from .stats import KLLSketch
+
+# Fixed, so the sketch's compaction offsets, and with them the reported quantiles,
+# are the same every time a file is analyzed with the same parameters
+QUALITY_SKETCH_SEED = 0
+
+QUALITY_QUANTILES = {
+    'p01': 0.01,
+    'p05': 0.05,
+    'p25': 0.25,
+    'p50': 0.5,
+    'p75': 0.75,
+    'p95': 0.95,
+    'p99': 0.99,
+}
+
+
+def _rounded(value):
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+
+def numeric_column_profile(raw: pd.Series, numeric: pd.Series) -> dict:
+    """
+    Profile one numeric column from its raw values and their to_numeric(errors='coerce')
+    conversion: nulls, values that failed conversion, range and sketched quantiles.
+    """
+    null_mask = raw.isna().to_numpy()
+    valid = numeric.to_numpy(dtype='float64')
+    valid_mask = ~np.isnan(valid)
+    values = valid[valid_mask]
+
+    sketch = KLLSketch(k=getattr(settings, 'WEATHER_QUALITY_SKETCH_K', 200), seed=QUALITY_SKETCH_SEED)
+    sketch.update(values)
+    quantiles = sketch.quantiles(list(QUALITY_QUANTILES.values()))
+    return {
+        'nulls': int(null_mask.sum()),
+        'invalid': int((~null_mask & ~valid_mask).sum()),
+        'valid': int(valid_mask.sum()),
+        'min': _rounded(values.min()) if len(values) else None,
+        'max': _rounded(values.max()) if len(values) else None,
+        'quantiles': {name: _rounded(q) for name, q in zip(QUALITY_QUANTILES, quantiles)},
+    }
+
+
+def date_column_profile(raw: pd.Series, parsed: pd.Series) -> dict:
+    """Profile the date column: nulls, unparseable values and the parsed range."""
+    null_mask = raw.isna().to_numpy()
+    valid = parsed.to_numpy(dtype='datetime64[ns]')
+    valid_mask = ~np.isnat(valid)
+    start, end = (format_dates([valid[valid_mask].min(), valid[valid_mask].max()]).tolist()
+                  if valid_mask.any() else (None, None))
+    return {
+        'nulls': int(null_mask.sum()),
+        'unparseable': int((~null_mask & ~valid_mask).sum()),
+        'valid': int(valid_mask.sum()),
+        'min': start,
+        'max': end,
+    }
+
+
+def data_quality_profile(df: pd.DataFrame, numeric: dict, dates: pd.Series, valid_rows: np.ndarray) -> dict:
+    """
+    Data-quality section of an analysis, built from the conversions perform_analysis
+    already made (`numeric` maps column -> coerced Series, `dates` is the parsed
+    date column, `valid_rows` the mask of rows kept), so the data is read once.
+    Rows are attributed to the first reason they were dropped for.
+    """
+    missing = df['date'].isna().to_numpy()
+    invalid_number = np.zeros(len(df), dtype=bool)
+    for col, converted in numeric.items():
+        col_null = df[col].isna().to_numpy()
+        missing |= col_null
+        invalid_number |= ~col_null & converted.isna().to_numpy()
+    invalid_number &= ~missing
+    invalid_date = ~valid_rows & ~missing & ~invalid_number
+
+    columns = {col: numeric_column_profile(df[col], converted) for col, converted in numeric.items()}
+    columns['date'] = date_column_profile(df['date'], dates)
+
+    return {
+        'rows': len(df),
+        'valid_rows': int(valid_rows.sum()),
+        'dropped_rows': {
+            'total': int((~valid_rows).sum()),
+            'missing_values': int(missing.sum()),
+            'invalid_numbers': int(invalid_number.sum()),
+            'invalid_dates': int(invalid_date.sum()),
+        },
+        'duplicate_rows': int(df.duplicated().sum()),
+        'duplicate_dates': int(dates[valid_rows].duplicated().sum()),
+        'columns': columns,
+        'quantile_method': 'kll_sketch',
+    }
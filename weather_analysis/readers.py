@@ -0,0 +1,314 @@
+import contextvars
+import os
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+from operator import itemgetter
+
+import pandas as pd
+from django.conf import settings
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # pragma: no cover - optional fast path
+    CalamineWorkbook = None
+
+EXCEL_EXTENSIONS = ('xlsx', 'xls')
+# Formats read_weather_sample can sample without parsing the whole file
+SAMPLED_EXTENSIONS = ('csv', 'xlsx')
+
+
+def spool_dir() -> str:
+    path = getattr(settings, 'WEATHER_SPOOL_DIR', None) or os.path.join(tempfile.gettempdir(), 'weather_analysis_spool')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _evict_spool(keep: str):
+    """Drop least recently used spool files until the directory fits WEATHER_SPOOL_MAX_BYTES."""
+    max_bytes = getattr(settings, 'WEATHER_SPOOL_MAX_BYTES', 2 * 1024 ** 3)
+    entries = []
+    with os.scandir(spool_dir()) as it:
+        for entry in it:
+            if entry.is_file() and '.part-' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+def _download_range(s3_client, bucket, s3_key, fd, start, end):
+    body = s3_client.get_object(Bucket=bucket, Key=s3_key, Range=f"bytes={start}-{end}")['Body']
+    offset = start
+    while True:
+        chunk = body.read(1024 * 1024)
+        if not chunk:
+            break
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+    if offset != end + 1:
+        raise IOError(f"Short read for bytes {start}-{end} of {s3_key}: got {offset - start} bytes.")
+
+
+def download_to_spool(s3_client, bucket: str, s3_key: str) -> str:
+    """
+    Download an S3 object into the local spool directory and return its path.
+
+    Large objects are fetched with concurrent byte-range GETs written straight
+    into place in a preallocated file, so the content is never held in memory.
+    Files are named after the (content-addressed) key, so the spool doubles as a
+    per-worker LRU disk cache: retries and re-analyses reuse the local copy.
+    """
+    path = os.path.join(spool_dir(), os.path.basename(s3_key))
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used
+        return path
+
+    part_bytes = getattr(settings, 'WEATHER_DOWNLOAD_PART_BYTES', 8 * 1024 * 1024)
+    concurrency = getattr(settings, 'WEATHER_DOWNLOAD_CONCURRENCY', 8)
+    size = s3_client.head_object(Bucket=bucket, Key=s3_key)['ContentLength']
+
+    partial = f"{path}.part-{os.getpid()}-{threading.get_ident()}"
+    fd = os.open(partial, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.ftruncate(fd, size)
+        ranges = [(start, min(start + part_bytes, size) - 1) for start in range(0, size, part_bytes)]
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(ranges)))) as executor:
+            # Each part runs in a copy of the caller's context, so context-local
+            # state (e.g. the load test's call labels) follows the download
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run, _download_range, s3_client, bucket, s3_key, fd, start, end,
+                )
+                for start, end in ranges
+            ]
+            for future in futures:
+                future.result()
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.remove(partial)
+        raise
+    os.close(fd)
+    os.replace(partial, path)
+
+    _evict_spool(keep=path)
+    return path
+
+
+def _as_filelike(source):
+    """Wrap raw bytes so every reader can accept either bytes or a path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)
+    return source
+
+
+def _frame_from_rows(rows, columns=None, max_rows=None):
+    """
+    Build a DataFrame from an iterator of row tuples whose first row is the header.
+    Only the requested columns (and at most `max_rows` rows) are materialised;
+    returns None if any column is missing.
+    """
+    try:
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows)]
+    except StopIteration:
+        return None
+    if max_rows is not None:
+        rows = islice(rows, max_rows)
+
+    wanted = [col for col in (columns or header) if col]
+    if any(col not in header for col in wanted):
+        return None
+
+    indexes = [header.index(col) for col in wanted]
+    getter = itemgetter(*indexes)
+    if len(indexes) == 1:
+        data = [(getter(row),) for row in rows if len(row) > indexes[0]]
+    else:
+        width = max(indexes)
+        data = [getter(row) for row in rows if len(row) > width]
+
+    df = pd.DataFrame.from_records(data, columns=wanted)
+    # Both engines report empty cells as empty strings or None
+    return df.replace('', None).dropna(how='all')
+
+
+def _select_sheets(sheet_names, sheets) -> list:
+    """
+    Names of the sheets `sheets` asks for: None for the first sheet, a name/index
+    or a list of them, or '*' (alone) for every sheet.
+    """
+    if sheets is None:
+        return list(sheet_names[:1])
+    selected = [sheets] if isinstance(sheets, (str, int)) else list(sheets)
+    if selected == ['*']:
+        return list(sheet_names)
+    selected = [sheet_names[s] if isinstance(s, int) else s for s in selected]
+    missing = [name for name in selected if name not in sheet_names]
+    if missing:
+        raise ValueError(f"Workbook has no sheet named: {', '.join(missing)}")
+    return selected
+
+
+def _read_sheets(read_sheet, sheet_names, sheets, columns, max_rows) -> list:
+    """
+    Frames of the selected sheets that hold `columns`, read one after another.
+    When none does, the first selected sheet is read whole so the analysis can
+    report exactly which columns are missing.
+    """
+    selected = _select_sheets(sheet_names, sheets)
+    frames = [frame for frame in (read_sheet(name, columns, max_rows) for name in selected) if frame is not None]
+    if not frames and selected:
+        first = read_sheet(selected[0], None, None)
+        frames = [first] if first is not None else []
+    return frames
+
+
+def _read_calamine_workbook(content, sheets, columns, max_rows=None) -> list:
+    workbook = CalamineWorkbook.from_object(_as_filelike(content))
+    try:
+        return _read_sheets(
+            lambda name, cols, rows: _frame_from_rows(iter(workbook.get_sheet_by_name(name).iter_rows()), cols, rows),
+            list(workbook.sheet_names), sheets, columns, max_rows,
+        )
+    finally:
+        workbook.close()
+
+
+def _read_openpyxl_workbook(content, sheets, columns, max_rows=None) -> list:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(_as_filelike(content), read_only=True, data_only=True)
+    try:
+        return _read_sheets(
+            lambda name, cols, rows: _frame_from_rows(workbook[name].iter_rows(values_only=True), cols, rows),
+            workbook.sheetnames, sheets, columns, max_rows,
+        )
+    finally:
+        workbook.close()
+
+
+def read_excel_fast(content, file_extension='xlsx', columns=None, sheets=None, max_rows=None) -> pd.DataFrame:
+    """
+    Parse an Excel workbook, keeping only `columns` (and, when given, the first
+    `max_rows` rows of each sheet) from the selected sheets.
+
+    Uses the calamine engine when python-calamine is installed, otherwise openpyxl
+    in read-only streaming mode for .xlsx and pandas/xlrd for legacy .xls files.
+    `sheets` is None for the first sheet, a sheet name/index, a list of them, or
+    '*' for every sheet that contains the requested columns. The workbook is
+    opened once and the selected sheets are parsed one after another, then
+    concatenated: parsing holds the GIL in both engines, so sheet threads gave
+    no speedup, and Celery's prefork workers cannot start a process pool.
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = bytes(content)
+
+    if CalamineWorkbook is not None:
+        frames = _read_calamine_workbook(content, sheets, columns, max_rows)
+    elif file_extension == 'xlsx':
+        frames = _read_openpyxl_workbook(content, sheets, columns, max_rows)
+    else:
+        usecols = (lambda col: col in columns) if columns else None
+        selected = [sheets] if isinstance(sheets, (str, int)) else sheets
+        sheet_name = 0 if selected is None else None if list(selected) == ['*'] else list(selected)
+        df = pd.read_excel(_as_filelike(content), sheet_name=sheet_name, usecols=usecols, nrows=max_rows)
+        return pd.concat(df.values(), ignore_index=True) if isinstance(df, dict) else df
+
+    return _concat_frames(frames)
+
+
+def _concat_frames(frames: list) -> pd.DataFrame:
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_weather_file(content, file_extension, columns=None, sheets=None) -> pd.DataFrame:
+    """
+    Parse an uploaded weather file (raw bytes or a local path), projected to
+    `columns` when given; `sheets` selects Excel sheets (see read_excel_fast).
+    CSV files on disk are parsed from a memory map.
+    """
+    file_extension = file_extension.lower().lstrip('.')
+    if file_extension in EXCEL_EXTENSIONS:
+        return read_excel_fast(content, file_extension, columns=columns, sheets=sheets)
+
+    usecols = (lambda col: col in columns) if columns else None
+    if isinstance(content, (str, os.PathLike)):
+        return pd.read_csv(content, usecols=usecols, memory_map=True)
+    return pd.read_csv(_as_filelike(content), usecols=usecols)
+
+
+def sample_csv_blocks(content: bytes, blocks: int, block_bytes: int):
+    """
+    Cut a bounded sample out of raw CSV bytes: the header plus the whole lines
+    of `blocks` windows of `block_bytes` spread evenly over the file, so the
+    sample spans the full date range instead of only its beginning.
+    Returns (sample_bytes, fraction_of_data_bytes_sampled).
+    """
+    header_end = content.find(b'\n') + 1
+    if header_end == 0:
+        return content, 1.0
+    body_size = len(content) - header_end
+    if body_size <= blocks * block_bytes:
+        return content, 1.0
+
+    step = body_size / blocks
+    parts = [content[:header_end]]
+    sampled = 0
+    for i in range(blocks):
+        start = header_end + int(i * step)
+        end = min(start + block_bytes, len(content))
+        # Skip the partial line a window starts in, and stop at its last full line
+        if content[start - 1:start] != b'\n':
+            start = content.find(b'\n', start, end) + 1 or end
+        if end < len(content):
+            end = content.rfind(b'\n', start, end) + 1 or start
+        parts.append(content[start:end])
+        sampled += end - start
+    return b''.join(parts), sampled / body_size
+
+
+def read_weather_sample(content: bytes, file_extension, columns=None, max_rows=None, sheets=None):
+    """
+    Parse a bounded sample of an uploaded file for a quick preview. CSV files are
+    block-sampled across the whole file; .xlsx sheets contribute their first
+    WEATHER_PREVIEW_EXCEL_MAX_ROWS rows, streamed by openpyxl in read-only mode
+    (calamine parses a whole sheet before yielding its first row). Legacy .xls
+    files cannot be sampled (see SAMPLED_EXTENSIONS). Returns (DataFrame,
+    fraction_sampled); the fraction is None when it cannot be known without
+    parsing the whole file.
+    """
+    max_rows = max_rows or getattr(settings, 'WEATHER_PREVIEW_MAX_ROWS', 50000)
+    file_extension = file_extension.lower().lstrip('.')
+    if file_extension not in SAMPLED_EXTENSIONS:
+        raise ValueError(f"Cannot sample .{file_extension} files without parsing them whole.")
+    if file_extension in EXCEL_EXTENSIONS:
+        max_rows = min(max_rows, getattr(settings, 'WEATHER_PREVIEW_EXCEL_MAX_ROWS', 2000))
+        return _concat_frames(_read_openpyxl_workbook(content, sheets, columns, max_rows)), None
+
+    sample, fraction = sample_csv_blocks(
+        bytes(content),
+        blocks=getattr(settings, 'WEATHER_PREVIEW_BLOCKS', 256),
+        block_bytes=getattr(settings, 'WEATHER_PREVIEW_BLOCK_BYTES', 4 * 1024),
+    )
+    usecols = (lambda col: col in columns) if columns else None
+    df = pd.read_csv(BytesIO(sample), usecols=usecols, nrows=max_rows, on_bad_lines='skip')
+    if len(df) >= max_rows:
+        # Truncated by the row cap: the byte fraction no longer describes the sample
+        fraction = None
+    return df, fraction
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import orjson
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer
+
+
+def _default(obj):
+    # Lazy translation strings appear in DRF validation errors
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer backed by orjson.
+    Values wrapped in orjson.Fragment (e.g. result payloads already encoded by the
+    worker) are embedded verbatim instead of being decoded and re-encoded.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_default, option=self.options)
@@ -0,0 +1,503 @@
+import asyncio
+import math
+import random
+import struct
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional, zlib is the fallback
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - lz4 is optional
+    lz4_frame = None
+
+# Time series layouts a client can negotiate: one dict per point ("records")
+# or one array per field ("columnar").
+RESULT_LAYOUTS = ('records', 'columnar')
+DEFAULT_RESULT_LAYOUT = 'records'
+
+
+def result_cache_key(job_id: str, layout: str = DEFAULT_RESULT_LAYOUT) -> str:
+    """Redis key of an encoded result; the records layout keeps the historical key."""
+    if layout == DEFAULT_RESULT_LAYOUT:
+        return f"analysis_result_{job_id}"
+    return f"analysis_result_{job_id}:{layout}"
+
+
+def preview_cache_key(job_id: str, layout: str = DEFAULT_RESULT_LAYOUT) -> str:
+    """Redis key of the approximate preview shown while a job's exact result is pending."""
+    if layout == DEFAULT_RESULT_LAYOUT:
+        return f"analysis_preview_{job_id}"
+    return f"analysis_preview_{job_id}:{layout}"
+
+
+def get_preview(job_id: str, layout: str = DEFAULT_RESULT_LAYOUT):
+    """Cached preview payload for a job still being analyzed, or None."""
+    try:
+        return cache.get(preview_cache_key(job_id, layout))
+    except Exception as e:
+        print(f"[RESULT CACHE] Preview get failed: {type(e).__name__}: {e}")
+        return None
+
+
+def discard_preview(job_id: str):
+    """Drop a job's preview once its exact result is stored (or the job is deleted)."""
+    try:
+        cache.delete_many([preview_cache_key(job_id, layout) for layout in RESULT_LAYOUTS])
+    except Exception as e:
+        print(f"[RESULT CACHE] Preview delete failed: {type(e).__name__}: {e}")
+
+
+# Fields kept when a result is too large to cache in full
+SUMMARY_FIELDS = ('status', 'report_summary', 'regression_analysis', 'num_records', 'data_quality')
+
+# Redis value layout: header followed by the (optionally compressed) JSON payload.
+# The header records the codec, whether only summary fields were kept, how long
+# the value took to produce (delta) and when it expires, for early refreshes.
+ENTRY_MAGIC = b'WRC1'
+ENTRY_HEADER = struct.Struct('!4sBBdd')
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, CODEC_LZ4 = 0, 1, 2, 3
+FLAG_SUMMARY = 1
+
+
+def _compress(data: bytes, codec_name: str):
+    if codec_name == 'zstd' and zstandard is not None:
+        return CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress(data)
+    if codec_name == 'lz4' and lz4_frame is not None:
+        return CODEC_LZ4, lz4_frame.compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 6)
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_LZ4:
+        return lz4_frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def summarize_payload(payload) -> bytes:
+    """Reduce an encoded result to its summary fields, marked as truncated."""
+    results = orjson.loads(payload)
+    summary = {field: results[field] for field in SUMMARY_FIELDS if field in results}
+    summary['truncated'] = True
+    return orjson.dumps(summary)
+
+
+def encode_entry(payload, timeout: int, delta: float = 0.0) -> bytes:
+    """
+    Build the Redis value for an encoded result: compressed with the configured
+    codec, and reduced to summary fields when still above the size cap.
+    """
+    data = payload.encode() if isinstance(payload, str) else bytes(payload)
+    codec_name = getattr(settings, 'WEATHER_RESULT_CACHE_CODEC', 'zstd')
+    min_compress = getattr(settings, 'WEATHER_RESULT_CACHE_COMPRESS_MIN_BYTES', 1024)
+    max_bytes = getattr(settings, 'WEATHER_RESULT_CACHE_MAX_VALUE_BYTES', 1024 * 1024)
+
+    flags = 0
+    codec, body = (_compress(data, codec_name) if len(data) >= min_compress else (CODEC_NONE, data))
+    if len(body) > max_bytes:
+        flags |= FLAG_SUMMARY
+        data = summarize_payload(data)
+        codec, body = CODEC_NONE, data
+
+    header = ENTRY_HEADER.pack(ENTRY_MAGIC, codec, flags, delta, time.time() + timeout)
+    return header + body
+
+
+def decode_entry(raw):
+    """Return (payload, is_summary, delta, expires_at) for a Redis value, or None."""
+    if isinstance(raw, str):
+        # Plain encoded results written before compression was introduced
+        return raw, False, 0.0, None
+    if not isinstance(raw, bytes):
+        return None
+    if not raw.startswith(ENTRY_MAGIC):
+        return raw, False, 0.0, None
+    _, codec, flags, delta, expires_at = ENTRY_HEADER.unpack_from(raw)
+    payload = _decompress(codec, raw[ENTRY_HEADER.size:])
+    return payload, bool(flags & FLAG_SUMMARY), delta, expires_at
+
+
+def should_refresh_early(delta: float, expires_at, beta: float = 1.0) -> bool:
+    """
+    Probabilistic early expiration (XFetch): the closer an entry is to expiring,
+    and the longer it took to produce, the likelier a reader refreshes it now,
+    so a hot key is renewed by one reader before it can expire for all of them.
+    """
+    if not expires_at or delta <= 0:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+class ByteBudgetLRU:
+    """
+    Thread-safe LRU bounded by the total size of its values in bytes rather
+    than by entry count. Values are encoded payloads (bytes or str).
+    """
+    def __init__(self, max_bytes: int, ttl: int = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size: int = None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TwoTierResultCache:
+    """
+    Encoded analysis results cached in a per-process LRU in front of Redis.
+
+    Results are content-addressed by job_id and never change, so the local tier
+    needs no coherence protocol beyond deletion: DeleteJobView publishes the
+    job_id on a Redis pub/sub channel and every process drops its local copy.
+    A TTL on local entries bounds staleness if a message is missed while the
+    subscriber reconnects. Redis errors are treated as cache misses.
+    """
+    def __init__(self):
+        self._local = None
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        # redis.asyncio connections belong to the event loop that opened them
+        self._async_clients = weakref.WeakKeyDictionary()
+        # Updated from request threads, event loops and the listener thread
+        self._stats_lock = threading.Lock()
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    @property
+    def local(self) -> ByteBudgetLRU:
+        if self._local is None:
+            self._local = ByteBudgetLRU(
+                max_bytes=getattr(settings, 'WEATHER_LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+                ttl=getattr(settings, 'WEATHER_LOCAL_CACHE_TTL', 3600),
+            )
+        return self._local
+
+    @property
+    def channel(self) -> str:
+        return getattr(settings, 'WEATHER_RESULT_CACHE_CHANNEL', 'analysis_result_invalidations')
+
+    @property
+    def timeout(self) -> int:
+        return getattr(settings, 'WEATHER_RESULT_CACHE_TIMEOUT', 86400)
+
+    def get(self, job_id: str, layout: str = DEFAULT_RESULT_LAYOUT, allow_summary: bool = False, loader=None):
+        """
+        Return the encoded result for (job_id, layout), or None.
+
+        Entries cached as summary-only count as misses unless `allow_summary`.
+        When `loader` is given, an entry that is due for an early refresh is
+        reloaded by the one reader that wins the refresh lock.
+        """
+        payload, refresh_due = self._lookup(job_id, layout, allow_summary)
+        if payload is not None and refresh_due and loader is not None:
+            return self._refresh(job_id, layout, loader, current=payload)
+        return payload
+
+    def get_or_load(self, job_id: str, layout: str, loader):
+        """
+        Read-through get. On a miss only the reader holding the refresh lock calls
+        `loader` (which returns an encoded result or None); the others wait briefly
+        for it to populate the cache instead of all hitting the backing store.
+        """
+        payload = self.get(job_id, layout, loader=loader)
+        if payload is not None:
+            return payload
+        if self._acquire_lock(job_id, layout):
+            return self._refresh(job_id, layout, loader, locked=True)
+
+        deadline = time.monotonic() + getattr(settings, 'WEATHER_RESULT_CACHE_LOCK_WAIT', 2.0)
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            payload, _ = self._lookup(job_id, layout, False)
+            if payload is not None:
+                return payload
+        return loader()
+
+    def set(self, job_id: str, payloads: dict, timeout: int = None, local: bool = False, delta: float = 0.0):
+        """Store encoded results keyed by layout, e.g. {'records': b'...'}."""
+        timeout = self.timeout if timeout is None else timeout
+        entries = {
+            result_cache_key(job_id, layout): encode_entry(value, timeout, delta)
+            for layout, value in payloads.items()
+        }
+        try:
+            cache.set_many(entries, timeout=timeout)
+        except Exception as e:
+            print(f"[RESULT CACHE] Redis set failed: {type(e).__name__}: {e}")
+        if local:
+            for layout, value in payloads.items():
+                self.local.set(result_cache_key(job_id, layout), value)
+
+    def _lookup(self, job_id, layout, allow_summary):
+        self._ensure_listener()
+        key = result_cache_key(job_id, layout)
+        payload = self.local.get(key)
+        if payload is not None:
+            return payload, False
+
+        try:
+            entry = decode_entry(cache.get(key))
+        except Exception as e:
+            print(f"[RESULT CACHE] Redis get failed: {type(e).__name__}: {e}")
+            entry = None
+        if entry is None or (entry[1] and not allow_summary):
+            self._count_redis(hit=False)
+            return None, False
+
+        payload, is_summary, delta, expires_at = entry
+        self._count_redis(hit=True)
+        if not is_summary:
+            self.local.set(key, payload)
+        return payload, should_refresh_early(delta, expires_at)
+
+    def _count_redis(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.redis_hits += 1
+            else:
+                self.redis_misses += 1
+
+    def _lock_key(self, job_id, layout):
+        return f"{result_cache_key(job_id, layout)}:lock"
+
+    def _acquire_lock(self, job_id, layout) -> bool:
+        timeout = getattr(settings, 'WEATHER_RESULT_CACHE_LOCK_TIMEOUT', 30)
+        try:
+            return cache.add(self._lock_key(job_id, layout), 1, timeout=timeout)
+        except Exception:
+            # Without Redis there is nothing to coordinate on
+            return True
+
+    def _refresh(self, job_id, layout, loader, current=None, locked=False):
+        if not locked and not self._acquire_lock(job_id, layout):
+            return current
+        try:
+            started = time.monotonic()
+            payload = loader()
+            if payload is None:
+                return current
+            self.set(job_id, {layout: payload}, local=True, delta=time.monotonic() - started)
+            return payload
+        finally:
+            try:
+                cache.delete(self._lock_key(job_id, layout))
+            except Exception:
+                pass
+
+    async def aget(self, job_id: str, layout: str = DEFAULT_RESULT_LAYOUT, allow_summary: bool = False):
+        """
+        Async counterpart of get() for ASGI views: local tier first, then a
+        redis.asyncio GET so the event loop is never blocked on Redis. Backends
+        other than django_redis are read in a worker thread.
+        """
+        self._ensure_listener()
+        key = result_cache_key(job_id, layout)
+        payload = self.local.get(key)
+        if payload is not None:
+            return payload
+
+        try:
+            client = self._async_redis()
+            if client is None:
+                raw = await sync_to_async(cache.get, thread_sensitive=False)(key)
+            else:
+                raw = await client.get(cache.make_key(key))
+                raw = cache.client.decode(raw) if raw is not None else None
+            entry = decode_entry(raw)
+        except Exception as e:
+            print(f"[RESULT CACHE] Redis get failed: {type(e).__name__}: {e}")
+            entry = None
+        if entry is None or (entry[1] and not allow_summary):
+            self._count_redis(hit=False)
+            return None
+
+        payload, is_summary, _, _ = entry
+        self._count_redis(hit=True)
+        if not is_summary:
+            self.local.set(key, payload)
+        return payload
+
+    async def ainvalidate(self, job_id: str):
+        """Async counterpart of invalidate(): the key deletes and the publish run concurrently."""
+        keys = [result_cache_key(job_id, layout) for layout in RESULT_LAYOUTS]
+        for key in keys:
+            self.local.delete(key)
+        client = self._async_redis()
+        if client is None:
+            await sync_to_async(cache.delete_many, thread_sensitive=False)(keys)
+            return
+        deleted, published = await asyncio.gather(
+            client.delete(*[cache.make_key(key) for key in keys]),
+            client.publish(self.channel, job_id),
+            return_exceptions=True,
+        )
+        if isinstance(deleted, Exception):
+            raise deleted
+        if isinstance(published, Exception):
+            print(f"[RESULT CACHE] Invalidation publish failed: {type(published).__name__}: {published}")
+
+    def invalidate(self, job_id: str):
+        """Delete a job's results from Redis and from every process' local tier."""
+        keys = [result_cache_key(job_id, layout) for layout in RESULT_LAYOUTS]
+        for key in keys:
+            self.local.delete(key)
+        cache.delete_many(keys)
+        try:
+            self._redis().publish(self.channel, job_id)
+        except NotImplementedError:
+            pass
+        except Exception as e:
+            print(f"[RESULT CACHE] Invalidation publish failed: {type(e).__name__}: {e}")
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            redis_stats = {'hits': self.redis_hits, 'misses': self.redis_misses}
+        return {
+            'local': self.local.stats(),
+            'redis': redis_stats,
+            'invalidation_listener': bool(self._listener and self._listener.is_alive()),
+        }
+
+    def _redis(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def _async_redis(self):
+        """redis.asyncio client for the running loop, or None when the cache is not django_redis."""
+        backend = settings.CACHES['default']['BACKEND']
+        if not backend.startswith('django_redis.'):
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import redis.asyncio
+            location = settings.CACHES['default']['LOCATION']
+            if isinstance(location, (list, tuple)):
+                location = location[0]
+            client = redis.asyncio.Redis.from_url(location)
+            self._async_clients[loop] = client
+        return client
+
+    def _ensure_listener(self):
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            try:
+                self._redis()
+            except (ImportError, NotImplementedError):
+                # Not a Redis cache backend (e.g. local memory in tests): nothing to listen to
+                self._listener = False
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name='result-cache-invalidation', daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                for message in pubsub.listen():
+                    job_id = message.get('data')
+                    if isinstance(job_id, bytes):
+                        job_id = job_id.decode()
+                    for layout in RESULT_LAYOUTS:
+                        self.local.delete(result_cache_key(job_id, layout))
+            except Exception as e:
+                print(f"[RESULT CACHE] Invalidation listener error: {type(e).__name__}: {e}")
+                # Anything published while disconnected was missed
+                self.local.clear()
+                if pubsub is not None:
+                    # Release the dead connection before subscribing on a new one
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+result_cache = TwoTierResultCache()
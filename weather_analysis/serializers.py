@@ -1,9 +1,40 @@
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
 import os
+from .params import ANALYSIS_PARAM_FIELDS, canonical_params
+
+
+class CommaSeparatedListField(serializers.ListField):
+    """List field that also accepts a single comma-separated string (multipart form fields)."""
+    def get_value(self, dictionary):
+        if hasattr(dictionary, 'getlist') and self.field_name in dictionary:
+            values = dictionary.getlist(self.field_name)
+            if len(values) == 1 and isinstance(values[0], str):
+                return [item.strip() for item in values[0].split(',') if item.strip()]
+            return values
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [item.strip() for item in data.split(',') if item.strip()]
+        return super().to_internal_value(data)
+
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
+    group_by = serializers.CharField(required=False, allow_blank=True, max_length=128)
+    # Analysis parameters (see params.DEFAULT_ANALYSIS_PARAMS); part of the job ID
+    columns = CommaSeparatedListField(child=serializers.CharField(max_length=128), required=False, max_length=32)
+    regression = CommaSeparatedListField(
+        child=serializers.CharField(max_length=128), required=False, min_length=2, max_length=2
+    )
+    chart_max_points = serializers.IntegerField(required=False, min_value=10, max_value=100000)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    sections = CommaSeparatedListField(child=serializers.CharField(max_length=32), required=False)
+    sheets = CommaSeparatedListField(child=serializers.CharField(max_length=128), required=False, max_length=32)
+    # Run the analysis under the sampling profiler (not part of the job ID)
+    profile = serializers.BooleanField(required=False, default=False)
 
     def validate_file(self, value):
         max_size = 50 * 1024 * 1024  # 50MB in bytes
@@ -28,8 +59,22 @@ class FileUploadSerializer(serializers.Serializer):
         
         return value
 
+    def validate(self, attrs):
+        if attrs.get('start_date') and attrs.get('end_date') and attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError("start_date must not be after end_date.")
+        try:
+            attrs['params'] = canonical_params(
+                {field: attrs[field] for field in ANALYSIS_PARAM_FIELDS if field in attrs}
+            )
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return attrs
+
     class Meta:
-        fields = ['file']
+        fields = [
+            'file', 'group_by', 'columns', 'regression', 'chart_max_points', 'start_date', 'end_date', 'sections',
+            'sheets', 'profile',
+        ]
 
 
 class JobStatusSerializer(serializers.Serializer):
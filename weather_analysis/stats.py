@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class GroupedRunningStats:
+    """
+    Online count/mean/variance for a fixed number of groups, updated one chunk
+    at a time. Each chunk is summarised with bincount and merged into the running
+    totals with the parallel form of Welford's algorithm (Chan et al.), so memory
+    stays proportional to the number of groups, not the number of rows.
+    """
+    def __init__(self, num_groups: int):
+        self.count = np.zeros(num_groups, dtype='int64')
+        self.mean = np.zeros(num_groups, dtype='float64')
+        self.m2 = np.zeros(num_groups, dtype='float64')
+
+    def update(self, groups: np.ndarray, values: np.ndarray):
+        """Merge a chunk of `values`, with `groups` holding each value's group index."""
+        size = len(self.count)
+        chunk_count = np.bincount(groups, minlength=size)
+        present = chunk_count > 0
+        if not present.any():
+            return
+
+        chunk_sum = np.bincount(groups, weights=values, minlength=size)
+        chunk_mean = np.zeros(size)
+        chunk_mean[present] = chunk_sum[present] / chunk_count[present]
+        chunk_m2 = np.bincount(groups, weights=(values - chunk_mean[groups]) ** 2, minlength=size)
+
+        total = self.count + chunk_count
+        delta = chunk_mean - self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(present, chunk_count / total, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + chunk_m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation per group (NaN for groups with fewer than 2 values)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(np.where(self.count > 1, self.m2 / (self.count - 1), np.nan))
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty). Values enter level 0; when a
+    level outgrows its capacity it is sorted and every other item, from a random
+    offset, is promoted to the next level with twice the weight. Capacities
+    shrink geometrically towards the lower levels, so the sketch holds O(k)
+    items for any input size, with rank error of roughly 1.7/k.
+    """
+    def __init__(self, k: int = 200, seed: int = None):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: np.ndarray):
+        """Add a batch of values; NaNs are ignored."""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        """Fold another sketch (e.g. built over another chunk) into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so no weight is lost
+                keep = items[:1] if len(items) % 2 else items[:0]
+                pairs = items[len(keep):]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # Growing the sketch lowers every capacity, so recheck from the bottom
+                level = 0
+                continue
+            level += 1
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Approximate values at quantiles `qs` (0..1); NaN while the sketch is empty."""
+        qs = np.asarray(qs, dtype='float64')
+        if not self.count:
+            return np.full(qs.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = qs * cumulative[-1]
+        positions = np.searchsorted(cumulative, ranks, side='left')
+        return items[np.minimum(positions, len(items) - 1)]
@@ -1,17 +1,39 @@
+import logging
+import math
 import time
-import json
+import orjson
 import pandas as pd
 import boto3
+import redis
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError,
+)
+from celery.signals import worker_process_init
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
-from django.core.cache import cache
 from config.celery import app
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LinearRegression 
-from io import BytesIO 
 import traceback
 import sys
 
+from .readers import read_weather_file, download_to_spool
+from .dates import parse_dates, format_dates
+from .aggregations import resampled_aggregates, rolling_statistics, group_statistics
+from .anomalies import detect_anomalies
+from .quality import data_quality_profile
+from .checkpoints import JobCheckpoint, sweep_stale_checkpoints
+from .profiling import JobProfile
+from .dataset_cache import dataset_cache, content_hash_from_key, preload_analysis_stack
+from .params import (
+    CHART_COLUMN, LEGACY_CHART_STRIDE, LEGACY_CHART_THRESHOLD, canonical_params, dataset_key, numeric_columns,
+    required_columns,
+)
+from .result_cache import result_cache, discard_preview, DEFAULT_RESULT_LAYOUT
+
+logger = logging.getLogger(__name__)
+
 # AWS client initialization
 try:
     s3_client = boto3.client(
@@ -32,11 +54,62 @@ except Exception as e:
     dynamodb_client = None
 
 
-def perform_analysis(df: pd.DataFrame) -> dict:
+def records_to_columnar(results: dict) -> dict:
+    """Return a copy of `results` whose time_series_data is in the columnar layout."""
+    series = results.get('time_series_data')
+    if not isinstance(series, list):
+        return results
+    columns = {'date': [], 'mean_temp_C': []}
+    for point in series:
+        for key, values in columns.items():
+            values.append(point.get(key))
+    return {**results, 'time_series_data': columns}
+
+
+def columnar_to_records(results: dict) -> dict:
+    """Return a copy of `results` whose time_series_data is in the records layout."""
+    series = results.get('time_series_data')
+    if not isinstance(series, dict):
+        return results
+    keys = list(series)
+    points = [dict(zip(keys, values)) for values in zip(*series.values())]
+    return {**results, 'time_series_data': points}
+
+
+def encode_results(results: dict) -> str:
+    """Serialize analysis results with orjson for storage in DynamoDB."""
+    return orjson.dumps(results, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def results_s3_key(job_id: str) -> str:
+    """Results too large for a JobResults item are stored next to the uploads."""
+    return f"results/{job_id}.json"
+
+
+def results_item(job_id: str, payload: str) -> dict:
+    """
+    JobResults item for an encoded columnar result: the result itself, or the
+    S3 key it is stored under when it exceeds WEATHER_RESULT_ITEM_MAX_BYTES.
+    """
+    if len(payload.encode()) <= getattr(settings, 'WEATHER_RESULT_ITEM_MAX_BYTES', 300 * 1024):
+        return {'job_id': {'S': job_id}, 'results_columnar': {'S': payload}}
+    return {'job_id': {'S': job_id}, 'results_s3_key': {'S': results_s3_key(job_id)}}
+
+
+def perform_analysis(df: pd.DataFrame, layout: str = DEFAULT_RESULT_LAYOUT, group_by: str = None,
+                     params: dict = None) -> dict:
+    """
+    Analyze a parsed weather file. `params` (see params.DEFAULT_ANALYSIS_PARAMS)
+    selects the columns, regression, chart resolution, date range and optional
+    sections; `group_by` is kept as a shorthand for params['group_by'].
+    """
+    params = canonical_params({**(params or {}), **({'group_by': group_by} if group_by else {})})
+    group_by = params['group_by']
+    sections = set(params['sections'])
+    regression_x, regression_y = params['regression']
+
     # Data validation, cleaning and type conversion
-    clustering_features = ['mean_temp_C', 'wind_speed']
-    regression_features = ['mean_temp_C', 'humidity']
-    required_cols = list(set(clustering_features + regression_features + ['date']))
+    required_cols = required_columns(params)
     
     missing_cols = [col for col in required_cols if col not in df.columns]
 
@@ -49,10 +122,11 @@ def perform_analysis(df: pd.DataFrame) -> dict:
             "num_records": 0,
             "time_series_data": [] 
         }
-    df_clean = df.dropna(subset=clustering_features + regression_features)
+    # Convert every analysis column once over the whole frame: the same masks
+    # select the clean rows and feed the data-quality profile.
+    numeric_cols = numeric_columns(params)
     try:
-        for col in clustering_features + regression_features:
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce') 
+        numeric = {col: pd.to_numeric(df[col], errors='coerce') for col in numeric_cols}
     except Exception as e:
         error_msg = f"Data type conversion failed: {str(e)}"
         return {
@@ -63,10 +137,19 @@ def perform_analysis(df: pd.DataFrame) -> dict:
             "time_series_data": [] 
         }
 
-    df_clean = df_clean.dropna(subset=clustering_features + regression_features)
-    df_clean['date_dt'] = pd.to_datetime(df_clean['date'], errors='coerce') 
-    df_clean = df_clean.dropna(subset=['date_dt']).drop(columns=['date']) 
-    df_clean['date_str'] = df_clean['date_dt'].dt.strftime('%Y-%m-%d')
+    dates_parsed = parse_dates(df['date'])
+    valid_rows = dates_parsed.notna().to_numpy()
+    for converted in numeric.values():
+        valid_rows &= converted.notna().to_numpy()
+    # Data quality describes the whole file; the date range only narrows the analysis
+    data_quality = data_quality_profile(df, numeric, dates_parsed, valid_rows) if 'data_quality' in sections else None
+
+    if params['start_date']:
+        valid_rows &= (dates_parsed >= pd.Timestamp(params['start_date'])).to_numpy()
+    if params['end_date']:
+        valid_rows &= (dates_parsed < pd.Timestamp(params['end_date']) + pd.Timedelta(days=1)).to_numpy()
+
+    df_clean = df.drop(columns=['date'] + numeric_cols).assign(**numeric, date_dt=dates_parsed)[valid_rows]
     
     num_records = len(df_clean)
 
@@ -77,14 +160,15 @@ def perform_analysis(df: pd.DataFrame) -> dict:
             "report_summary": summary_text,
             "regression_analysis": {"temp_humidity_r2": "N/A (Empty Data)"},
             "num_records": 0,
-            "time_series_data": []
+            "time_series_data": [],
+            **({"data_quality": data_quality} if data_quality is not None else {}),
         }
 
     # Linear regression R² calculation
     r_squared = 'N/A'
     try:
-        X = df_clean[['humidity']]
-        y = df_clean['mean_temp_C']
+        X = df_clean[[regression_x]]
+        y = df_clean[regression_y]
         
         if len(df_clean) > 1:
             model = LinearRegression()
@@ -96,37 +180,111 @@ def perform_analysis(df: pd.DataFrame) -> dict:
         r_squared = f"Error: {str(e)}"
         
     # Extract time series data and generate report summary
-    if num_records > 1000:
-        df_chart = df_clean.iloc[::3, :]
+    if params['chart_max_points']:
+        df_chart = df_clean.iloc[::max(1, math.ceil(num_records / params['chart_max_points'])), :]
+    elif num_records > LEGACY_CHART_THRESHOLD:
+        df_chart = df_clean.iloc[::LEGACY_CHART_STRIDE, :]
     else:
         df_chart = df_clean
         
-    time_series_data = df_chart[['date_str', 'mean_temp_C']].rename(
-        columns={'date_str': 'date'}
-    ).to_dict('records')
+    # Dates stay datetime64 until here; only the charted points become strings
+    chart_dates = format_dates(df_chart['date_dt']).tolist()
+    chart_temps = df_chart[CHART_COLUMN].to_numpy().tolist()
+    if layout == 'columnar':
+        time_series_data = {'date': chart_dates, 'mean_temp_C': chart_temps}
+    else:
+        time_series_data = [
+            {'date': date, 'mean_temp_C': temp} for date, temp in zip(chart_dates, chart_temps)
+        ]
 
-    start_date = df_clean['date_dt'].min().strftime('%Y-%m-%d')
-    end_date = df_clean['date_dt'].max().strftime('%Y-%m-%d')
-    
-    avg_temp = df_clean['mean_temp_C'].mean() 
+    dates = df_clean['date_dt'].to_numpy()
+    start_date, end_date = format_dates([dates.min(), dates.max()])
+
+    # Period and rolling aggregates share one sorted datetime index
+    indexed = df_clean.set_index('date_dt').sort_index()
+    avg_temp = df_clean[CHART_COLUMN].mean() 
     
     summary_text = (
         f"This report covers {num_records} records from {start_date} to {end_date}. "
         f"The overall average temperature is {avg_temp:.2f}°C. "
     )
-    return {
+    results = {
         "status": "SUCCESS", 
         "report_summary": summary_text,
         "regression_analysis": {
-            "temp_humidity_r2": r_squared
+            "temp_humidity_r2": r_squared,
+            "features": [regression_x, regression_y],
         },
         "num_records": num_records,
-        "time_series_data": time_series_data
+        "time_series_data": time_series_data,
     }
+    columns = params['columns']
+    if 'aggregates' in sections:
+        results["aggregates"] = resampled_aggregates(indexed, columns)
+    if 'rolling' in sections:
+        results["rolling"] = rolling_statistics(indexed, columns)
+    if 'anomalies' in sections:
+        results["anomalies"] = detect_anomalies(indexed, columns)
+    if data_quality is not None:
+        results["data_quality"] = data_quality
+    if group_by and 'groups' in sections:
+        results["groups"] = group_statistics(df_clean, group_by, columns, params['regression'])
+    return results
+
+
+# Error codes AWS uses for throttling and transient server-side failures
+RETRYABLE_AWS_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'Throttling',
+    'RequestLimitExceeded',
+    'SlowDown',
+    'InternalServerError',
+    'InternalError',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'RequestTimeoutException',
+}
+
 
+def is_retryable_error(exc: Exception) -> bool:
+    """Throttling, timeouts and dropped connections to AWS or Redis are worth retrying."""
+    if isinstance(exc, ClientError):
+        error = exc.response.get('Error', {})
+        status_code = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return error.get('Code') in RETRYABLE_AWS_ERROR_CODES or status_code >= 500
+    return isinstance(exc, (
+        EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError,
+        redis.exceptions.ConnectionError, redis.exceptions.TimeoutError,
+    ))
 
-@app.task(bind=True)
-def run_weather_analysis(self, job_id, s3_key):
+
+def retry_countdown(retries: int) -> int:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^retries)]."""
+    return get_exponential_backoff_interval(
+        factor=getattr(settings, 'WEATHER_TASK_RETRY_BACKOFF', 2),
+        retries=retries,
+        maximum=getattr(settings, 'WEATHER_TASK_RETRY_BACKOFF_MAX', 300),
+        full_jitter=True,
+    )
+
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs):
+    """Preload the analysis stack in each new prefork child before it takes a task."""
+    if not getattr(settings, 'WEATHER_WORKER_PRELOAD', True):
+        return
+    started = time.perf_counter()
+    try:
+        preload_analysis_stack()
+    except Exception:
+        logger.exception("Worker preload failed")
+        return
+    logger.info("Analysis stack preloaded in %.2fs", time.perf_counter() - started)
+
+
+@app.task(bind=True, max_retries=getattr(settings, 'WEATHER_TASK_MAX_RETRIES', 5))
+def run_weather_analysis(self, job_id, s3_key, group_by=None, params=None, profile=False):
     
     if not s3_client or not dynamodb_client:
         raise Exception("AWS clients failed to initialize in worker.")
@@ -143,35 +301,75 @@ def run_weather_analysis(self, job_id, s3_key):
         except Exception as e:
              print(f"Failed to update DDB status to FAILURE: {e}")
     
+    checkpoint = None
+    # Opt-in sampling profile and peak memory of this attempt, saved when it ends
+    job_profile = JobProfile(job_id, enabled=profile)
     try:
+        job_profile.start()
+        # How long this result took to produce: the XFetch delta of its cache entries
+        started = time.monotonic()
+        params = canonical_params({**(params or {}), **({'group_by': group_by} if group_by else {})})
+        content_hash = content_hash_from_key(s3_key)
+        # A retry resumes after the last stage this job completed
+        sweep_stale_checkpoints()
+        checkpoint = JobCheckpoint(job_id)
+
         # Process file and store results
-        self.update_state(state='PROGRESS', meta={'progress': 20})
-        s3_object = s3_client.get_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=s3_key)
-        file_content = s3_object['Body'].read()
-        
-        file_extension = s3_key.lower().split('.')[-1]
-        if file_extension == 'csv':
-            df = pd.read_csv(BytesIO(file_content))
-        elif file_extension in ['xlsx', 'xls']:
-            df = pd.read_excel(BytesIO(file_content))
-        else:
-            df = pd.read_csv(BytesIO(file_content))
-        
-        self.update_state(state='PROGRESS', meta={'progress': 50})
-        analysis_results = perform_analysis(df)
-        
-        if analysis_results.get('status') == 'FAILURE':
-             raise Exception(f"Analysis failed during data processing: {analysis_results.get('report_summary')}")
-        self.update_state(state='PROGRESS', meta={'progress': 90})
-        results_json_string = json.dumps(analysis_results)
-        
-        dynamodb_client.put_item(
-            TableName=settings.DYNAMODB_RESULTS_TABLE_NAME, 
-            Item={
-                'job_id': {'S': job_id}, 
-                'results': {'S': results_json_string} 
+        payloads = checkpoint.load_results()
+        if payloads is None:
+            # Parsed frames are shared in memory by every analysis of the same file
+            columns = required_columns(params)
+            frame_key = dataset_key(content_hash, params)
+            df = dataset_cache.get(frame_key, columns)
+            if df is None:
+                df = checkpoint.load_frame()
+            if df is None:
+                self.update_state(state='PROGRESS', meta={'progress': 20})
+                local_path = download_to_spool(s3_client, settings.AWS_S3_BUCKET_NAME, s3_key)
+                checkpoint.mark('downloaded')
+                job_profile.mark('downloaded')
+
+                file_extension = s3_key.lower().split('.')[-1]
+                frame = read_weather_file(
+                    local_path, file_extension, columns=dataset_cache.columns_to_read(frame_key, columns),
+                    sheets=params['sheets'],
+                )
+                dataset_cache.set(frame_key, frame)
+                df = frame[[col for col in columns if col in frame.columns]]
+                checkpoint.save_frame(df)
+            job_profile.mark('parsed')
+            
+            self.update_state(state='PROGRESS', meta={'progress': 50})
+            analysis_results = perform_analysis(df, layout='columnar', params=params)
+            
+            if analysis_results.get('status') == 'FAILURE':
+                 raise Exception(f"Analysis failed during data processing: {analysis_results.get('report_summary')}")
+            # Both layouts are cached pre-encoded so the status endpoint can pass
+            # either one straight through; JobResults stores only the columnar one.
+            payloads = {
+                'records': encode_results(columnar_to_records(analysis_results)),
+                'columnar': encode_results(analysis_results),
             }
-        )
+            checkpoint.save_results(payloads)
+            job_profile.mark('analyzed')
+
+        self.update_state(state='PROGRESS', meta={'progress': 90})
+        item = results_item(job_id, payloads['columnar'])
+        if not checkpoint.reached('persisted'):
+            if 'results_s3_key' in item:
+                # Written before the item that points at it
+                s3_client.put_object(
+                    Bucket=settings.AWS_S3_BUCKET_NAME,
+                    Key=item['results_s3_key']['S'],
+                    Body=payloads['columnar'].encode(),
+                    ContentType='application/json',
+                )
+            dynamodb_client.put_item(
+                TableName=settings.DYNAMODB_RESULTS_TABLE_NAME, 
+                Item=item,
+            )
+            checkpoint.mark('persisted')
+            job_profile.mark('persisted')
         
         dynamodb_client.update_item(
             TableName=settings.DYNAMODB_METADATA_TABLE_NAME, 
@@ -181,8 +379,10 @@ def run_weather_analysis(self, job_id, s3_key):
             ExpressionAttributeValues={':status_val': {'S': 'SUCCESS'}}
         )
         
-        cache_key = f"analysis_result_{job_id}"
-        cache.set(cache_key, analysis_results, timeout=86400)
+        result_cache.set(job_id, payloads, delta=time.monotonic() - started)
+        # The exact result supersedes the upload-time preview
+        discard_preview(job_id)
+        checkpoint.clear()
         
         return {
             'status': 'SUCCESS',
@@ -190,11 +390,24 @@ def run_weather_analysis(self, job_id, s3_key):
         }
         
     except Exception as e:
+        if is_retryable_error(e) and self.request.retries < self.max_retries:
+            countdown = retry_countdown(self.request.retries)
+            print(f"--- TASK {self.request.id} RETRY {self.request.retries + 1}/{self.max_retries} "
+                  f"in {countdown}s after {type(e).__name__}: {e} "
+                  f"(checkpoint: {checkpoint.stage if checkpoint else None}) ---")
+            raise self.retry(exc=e, countdown=countdown)
+
         error_msg = f"Task FAILED: {str(e)}"
         print(f"--- TASK {self.request.id} FAILED: {error_msg} ---")
         traceback.print_exc()
         
         update_ddb_status_failure() # 更新 DDB 状态
+        if checkpoint is not None:
+            checkpoint.clear()
              
         self.update_state(state='FAILURE', meta={'error': error_msg})
-        raise # 必须重新抛出异常，让 Celery 记录失败状态
\ No newline at end of file
+        raise # 必须重新抛出异常，让 Celery 记录失败状态
+
+    finally:
+        # Failed and retried attempts are profiled too; the last attempt's profile is kept
+        job_profile.save(s3_client, dynamodb_client)
\ No newline at end of file
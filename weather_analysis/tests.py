@@ -1,28 +1,70 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, AsyncClient, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from rest_framework import status
-from unittest.mock import patch, MagicMock, Mock
+from unittest.mock import patch, MagicMock, Mock, AsyncMock
 from django.core.cache import cache
 from celery.result import AsyncResult
 import json
+import os
+import time
+import tempfile
+import tracemalloc
+import warnings
+import numpy as np
 import pandas as pd
 from io import BytesIO
+from unittest import skipUnless
+import importlib.util
 
+from . import views
 from .views import FileUploadView, AnalysisStatusView, get_file_hash
-from .tasks import perform_analysis, run_weather_analysis
+from .serializers import FileUploadSerializer
+from .tasks import perform_analysis, run_weather_analysis, is_retryable_error
+from .dates import detect_date_format, format_dates, parse_dates
+from .checkpoints import JobCheckpoint, sweep_stale_checkpoints
+from .dataset_cache import dataset_cache, route_analysis_task
+from .loadtest import BackendCallCounter, latency_summary, offline_backends, parse_size_mix, run_load_test, weather_csv
+from .profiling import JobProfile, SamplingProfiler
+from .preview import create_preview
+from .params import analysis_key, canonical_params
+from botocore.exceptions import ClientError
+import redis
+from .readers import read_weather_file, read_weather_sample, download_to_spool, sample_csv_blocks
+from .stats import GroupedRunningStats, KLLSketch
+from .quality import numeric_column_profile
+from .admission import AdmissionDecision, consume_upload_token
+from asgiref.sync import sync_to_async
+from .result_cache import ByteBudgetLRU, result_cache, result_cache_key, encode_entry, decode_entry
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
+# URLs handed to the WEATHER_CDN_PURGE hook in tests
+purged_urls = []
+
+
+def record_cdn_purge(urls):
+    purged_urls.extend(urls)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class ViewsTestCase(TestCase):
     """Unit tests for views.py"""
     
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
+        result_cache.clear_local()
+        # Empty analysis queue unless a test says otherwise (no live broker in tests)
+        patcher = patch('weather_analysis.admission.broker_queue_depth', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
         
     @patch('weather_analysis.views.s3_client')
     @patch('weather_analysis.views.dynamodb_client')
     @patch('weather_analysis.views.run_weather_analysis')
-    @patch('weather_analysis.views.cache')
+    @patch('weather_analysis.views.result_cache')
     def test_file_upload_view_success(self, mock_cache, mock_task, mock_dynamodb, mock_s3):
         """
         Test FileUploadView - Successfully upload file and start Celery task
@@ -58,7 +100,7 @@ class ViewsTestCase(TestCase):
         
     @patch('weather_analysis.views.s3_client')
     @patch('weather_analysis.views.dynamodb_client')
-    @patch('weather_analysis.views.cache')
+    @patch('weather_analysis.views.result_cache')
     def test_file_upload_view_cached_result(self, mock_cache, mock_dynamodb, mock_s3):
         """
         Test FileUploadView - Return result from cache
@@ -69,7 +111,7 @@ class ViewsTestCase(TestCase):
             'report_summary': 'Test summary',
             'num_records': 100
         }
-        mock_cache.get.return_value = cached_result
+        mock_cache.get.return_value = json.dumps(cached_result)
         
         # Create test file
         csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0"
@@ -83,16 +125,98 @@ class ViewsTestCase(TestCase):
         self.assertIn('job_id', response.data)
         self.assertEqual(response.data['status'], 'SUCCESS')
         self.assertEqual(response.data['from_cache'], True)
-        self.assertEqual(response.data['results'], cached_result)
+        self.assertEqual(json.loads(response.content)['results'], cached_result)
         
         # Verify AWS clients and Celery task are not called (using cache instead)
         # Note: Since s3_client and dynamodb_client are module-level in views.py, no need to verify here
         pass
         
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    @patch('weather_analysis.views.run_weather_analysis')
+    @patch('weather_analysis.admission.active_worker_count', return_value=2)
+    @patch('weather_analysis.admission.broker_queue_depth')
+    def test_file_upload_view_queue_backpressure(self, mock_depth, mock_workers, mock_task, mock_dynamodb, mock_s3):
+        """
+        Test FileUploadView - Deep queues defer with an estimate, full queues return 503 + Retry-After
+        """
+        mock_task.delay.return_value = MagicMock(id='test-celery-id-123', status='PENDING')
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0"
+
+        mock_depth.return_value = 100
+        with self.settings(WEATHER_QUEUE_DEFER_DEPTH=50, WEATHER_QUEUE_REJECT_DEPTH=500, WEATHER_TASK_AVG_SECONDS=30):
+            deferred = self.client.post(
+                '/api/v1/upload/', {'file': SimpleUploadedFile("a.csv", csv_content)}, format='multipart'
+            )
+            mock_depth.return_value = 600
+            rejected = self.client.post(
+                '/api/v1/upload/', {'file': SimpleUploadedFile("b.csv", csv_content + b"\n")}, format='multipart'
+            )
+
+        # Assertions
+        self.assertEqual(deferred.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(deferred.data['estimated_start_seconds'], 1500)
+        self.assertEqual(rejected.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(rejected['Retry-After'], '9000')
+        mock_task.delay.assert_called_once()
+
+    @patch('weather_analysis.views.check_queue_admission', return_value=AdmissionDecision(allowed=True))
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    @patch('weather_analysis.views.run_weather_analysis')
+    def test_file_upload_view_parameterized_analysis(self, mock_task, mock_dynamodb, mock_s3, mock_admission):
+        """
+        Test FileUploadView - Parameters give a distinct job per analysis while the upload stays keyed by content
+        """
+        mock_task.delay.return_value = MagicMock(id='test-celery-id-123', status='PENDING')
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0"
+
+        default = self.client.post(
+            '/api/v1/upload/', {'file': SimpleUploadedFile("a.csv", csv_content)}, format='multipart'
+        )
+        custom = self.client.post('/api/v1/upload/', {
+            'file': SimpleUploadedFile("a.csv", csv_content),
+            'sections': 'rolling,aggregates',
+            'start_date': '2024-01-01',
+            'chart_max_points': '100',
+        }, format='multipart')
+
+        # Assertions
+        self.assertEqual(custom.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(default.data['content_hash'], custom.data['content_hash'])
+        self.assertNotEqual(default.data['job_id'], custom.data['job_id'])
+        self.assertEqual(custom.data['params']['sections'], ['aggregates', 'rolling'])
+        self.assertEqual(custom.data['job_id'], analysis_key(custom.data['content_hash'], {
+            'sections': ['aggregates', 'rolling'], 'start_date': '2024-01-01', 'chart_max_points': 100,
+        }))
+        s3_keys = {call.kwargs['Key'] for call in mock_s3.put_object.call_args_list}
+        self.assertEqual(s3_keys, {f"uploads/{default.data['content_hash']}.csv"})
+        self.assertEqual(mock_task.delay.call_args.args[3], custom.data['params'])
+
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    @patch('weather_analysis.views.consume_upload_token')
+    def test_file_upload_view_rate_limited(self, mock_token, mock_dynamodb, mock_s3):
+        """
+        Test FileUploadView - An empty token bucket returns 429 with Retry-After
+        """
+        mock_token.return_value = AdmissionDecision(
+            allowed=False, status=429, retry_after=4, reason="Upload rate limit exceeded for this client."
+        )
+        test_file = SimpleUploadedFile("test_weather.csv", b"date\n2024-01-01", content_type="text/csv")
+
+        response = self.client.post('/api/v1/upload/', {'file': test_file}, format='multipart', REMOTE_ADDR='10.0.0.7')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '4')
+        mock_token.assert_called_once_with('ip:10.0.0.7')
+        mock_s3.put_object.assert_not_called()
+
     @patch('weather_analysis.views.dynamodb_client')
     def test_analysis_status_view_success(self, mock_dynamodb):
         """
-        Test AnalysisStatusView - Successfully query task status
+        Test AnalysisStatusView - Successfully query task status; the stored columnar result is served as records
         """
         # Setup mocks
         job_id = 'a' * 64  # 64-character SHA256 hash
@@ -101,7 +225,10 @@ class ViewsTestCase(TestCase):
         # Mock DynamoDB response - dynamodb_client is a module-level variable
         mock_dynamodb.get_item.side_effect = [
             {'Item': {'celery_id': {'S': celery_id}}},  # First call - get celery_id
-            {'Item': {'results': {'S': json.dumps({'status': 'SUCCESS', 'report_summary': 'Test'})}}}  # Second call - get results
+            {'Item': {'results_columnar': {'S': json.dumps({  # Second call - get results
+                'status': 'SUCCESS', 'report_summary': 'Test',
+                'time_series_data': {'date': ['2024-01-01'], 'mean_temp_C': [25.5]},
+            })}}}
         ]
         
         # Mock Celery AsyncResult
@@ -116,8 +243,160 @@ class ViewsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'SUCCESS')
         self.assertEqual(response.data['job_id'], job_id)
-        self.assertIn('results', response.data)
+        self.assertEqual(json.loads(response.content)['results']['time_series_data'], [{'date': '2024-01-01', 'mean_temp_C': 25.5}])
         
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_analysis_status_view_columnar_passthrough(self, mock_dynamodb):
+        """
+        Test AnalysisStatusView - Columnar results are returned byte-for-byte as stored
+        """
+        job_id = 'b' * 64
+        stored = '{"status":"SUCCESS","time_series_data":{"date":["2024-01-01"],"mean_temp_C":[25.5]}}'
+        mock_dynamodb.get_item.side_effect = [
+            {'Item': {'celery_id': {'S': 'test-celery-id-123'}}},
+            {'Item': {'results_columnar': {'S': stored}}}
+        ]
+        mock_async_result = MagicMock()
+        mock_async_result.ready.return_value = True
+        mock_async_result.status = 'SUCCESS'
+
+        with patch('weather_analysis.views.AsyncResult', return_value=mock_async_result):
+            response = self.client.get(f'/api/v1/status/{job_id}/?layout=columnar')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'"results":' + stored.encode(), response.content)
+        self.assertEqual(json.loads(response.content)['results']['time_series_data']['mean_temp_C'], [25.5])
+        self.assertEqual(
+            mock_dynamodb.get_item.call_args.kwargs['ProjectionExpression'],
+            'job_id, results_columnar, results_s3_key'
+        )
+
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_analysis_status_view_columnar_from_legacy_item(self, mock_dynamodb):
+        """
+        Test AnalysisStatusView - Items without results_columnar are converted from the records layout
+        """
+        job_id = 'b' * 64
+        legacy = json.dumps({'status': 'SUCCESS', 'time_series_data': [{'date': '2024-01-01', 'mean_temp_C': 25.5}]})
+        mock_dynamodb.get_item.side_effect = [
+            {'Item': {'celery_id': {'S': 'test-celery-id-123'}}},
+            {'Item': {'job_id': {'S': job_id}}},
+            {'Item': {'results': {'S': legacy}}},
+        ]
+        mock_async_result = MagicMock(status='SUCCESS')
+        mock_async_result.ready.return_value = True
+
+        with patch('weather_analysis.views.AsyncResult', return_value=mock_async_result):
+            response = self.client.get(f'/api/v1/status/{job_id}/?layout=columnar')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['results']['time_series_data']['mean_temp_C'], [25.5])
+        projections = [call.kwargs['ProjectionExpression'] for call in mock_dynamodb.get_item.call_args_list]
+        self.assertEqual(projections, ['celery_id', 'job_id, results_columnar, results_s3_key', 'results'])
+
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_analysis_status_view_not_modified(self, mock_dynamodb):
+        """
+        Test AnalysisStatusView - Matching If-None-Match returns 304 without backend lookups
+        """
+        job_id = 'c' * 64
+
+        response = self.client.get(f'/api/v1/status/{job_id}/', HTTP_IF_NONE_MATCH=f'"{job_id}-gzip"')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], f'"{job_id}"')
+        cache_control = set(response['Cache-Control'].split(', '))
+        self.assertTrue({'public', 'immutable', 's-maxage=300', 'max-age=86400'} <= cache_control)
+        mock_dynamodb.get_item.assert_not_called()
+
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_analysis_status_view_wildcard_etag_needs_result(self, mock_dynamodb):
+        """
+        Test AnalysisStatusView - If-None-Match: * only returns 304 for a result that exists
+        """
+        job_id = 'c' * 64
+        mock_dynamodb.get_item.return_value = {}
+
+        missing = self.client.get(f'/api/v1/status/{job_id}/', HTTP_IF_NONE_MATCH='*')
+        result_cache.set(job_id, {'records': '{"status": "SUCCESS"}'}, local=True)
+        found = self.client.get(f'/api/v1/status/{job_id}/', HTTP_IF_NONE_MATCH='*')
+
+        # Assertions
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(found.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(found['ETag'], f'"{job_id}"')
+
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_analysis_status_view_compressed_result(self, mock_dynamodb):
+        """
+        Test AnalysisStatusView - Large results are gzip-compressed and keep a strong ETag
+        """
+        job_id = 'd' * 64
+        series = {'date': ['2024-01-01'] * 200, 'mean_temp_C': [25.5] * 200}
+        mock_dynamodb.get_item.side_effect = [
+            {'Item': {'celery_id': {'S': 'test-celery-id-123'}}},
+            {'Item': {'results_columnar': {'S': json.dumps({'status': 'SUCCESS', 'time_series_data': series})}}}
+        ]
+        mock_async_result = MagicMock()
+        mock_async_result.ready.return_value = True
+        mock_async_result.status = 'SUCCESS'
+
+        with patch('weather_analysis.views.AsyncResult', return_value=mock_async_result):
+            response = self.client.get(f'/api/v1/status/{job_id}/', HTTP_ACCEPT_ENCODING='gzip')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{job_id}-gzip"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @override_settings(WEATHER_PREVIEW_MIN_BYTES=0, WEATHER_PREVIEW_BLOCKS=8, WEATHER_PREVIEW_BLOCK_BYTES=512)
+    @patch('weather_analysis.views.check_queue_admission', return_value=AdmissionDecision(allowed=True))
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    @patch('weather_analysis.views.run_weather_analysis')
+    def test_upload_preview_served_while_pending(self, mock_task, mock_dynamodb, mock_s3, mock_admission):
+        """
+        Test FileUploadView/AnalysisStatusView - An approximate preview is returned at upload and by ?wait=false
+        """
+        mock_task.delay.return_value = MagicMock(id='test-celery-id-123', status='PENDING')
+        dates = pd.date_range('2023-01-01', periods=365)
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'mean_temp_C': np.linspace(0, 30, 365).round(2),
+            'wind_speed': 5.0,
+            'humidity': np.linspace(40, 80, 365).round(2),
+        })
+        csv_content = df.to_csv(index=False).encode()
+        test_file = SimpleUploadedFile("big_weather.csv", csv_content, content_type="text/csv")
+
+        response = self.client.post('/api/v1/upload/', {'file': test_file}, format='multipart')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        preview = json.loads(response.content)['preview']
+        self.assertTrue(preview['approximate'])
+        self.assertNotIn('data_quality', preview)
+        self.assertLess(preview['sample']['fraction'], 1)
+        low, high = preview['error_bounds']['avg_temp_C']
+        self.assertLess(low, high)
+        self.assertEqual(preview['time_series_data'][0].keys(), {'date', 'mean_temp_C', 'lower', 'upper'})
+
+        job_id = json.loads(response.content)['job_id']
+        mock_dynamodb.get_item.return_value = {'Item': {'celery_id': {'S': 'test-celery-id-123'}}}
+        mock_async_result = MagicMock(status='PENDING')
+        mock_async_result.ready.return_value = False
+        with patch('weather_analysis.views.AsyncResult', return_value=mock_async_result):
+            status_response = self.client.get(f'/api/v1/status/{job_id}/?wait=false&layout=columnar')
+
+        self.assertEqual(status_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(status_response.data['status'], 'PENDING')
+        self.assertIn('lower', json.loads(status_response.content)['preview']['time_series_data'])
+        mock_async_result.wait.assert_not_called()
+
     @patch('weather_analysis.views.dynamodb_client')
     def test_analysis_status_view_job_not_found(self, mock_dynamodb):
         """
@@ -134,6 +413,202 @@ class ViewsTestCase(TestCase):
         self.assertIn('error', response.data)
 
 
+@skipUnless(importlib.util.find_spec('fakeredis'), "fakeredis is required")
+class AdmissionTestCase(TestCase):
+    """Unit tests for admission.py, with the token bucket script running on fakeredis"""
+
+    def setUp(self):
+        import fakeredis
+        self.client = APIClient()
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = patch('django_redis.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(WEATHER_UPLOAD_RATE_PER_MINUTE=1, WEATHER_UPLOAD_BURST=2)
+    def test_token_bucket_refills_on_redis_clock(self):
+        """
+        Test consume_upload_token - The burst is spent, then refilled by time elapsed on the Redis server
+        """
+        decisions = [consume_upload_token('ip:10.0.0.8') for _ in range(3)]
+        # Pretend the last refill happened two minutes ago by the server's clock
+        server_now = float(self.redis.time()[0])
+        self.redis.hset('upload_tokens:ip:10.0.0.8', 'ts', server_now - 120)
+        refilled = consume_upload_token('ip:10.0.0.8')
+
+        # Assertions
+        self.assertEqual([d.allowed for d in decisions], [True, True, False])
+        self.assertEqual(decisions[2].status, 429)
+        self.assertEqual(decisions[2].retry_after, 60)
+        self.assertTrue(refilled.allowed)
+
+    @override_settings(WEATHER_UPLOAD_RATE_PER_MINUTE=1, WEATHER_UPLOAD_BURST=1)
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    def test_invalid_upload_does_not_consume_token(self, mock_dynamodb, mock_s3):
+        """
+        Test FileUploadView - Uploads failing validation are rejected without spending the client's budget
+        """
+        bad_file = SimpleUploadedFile("notes.txt", b"not a weather file", content_type="text/plain")
+
+        response = self.client.post('/api/v1/upload/', {'file': bad_file}, format='multipart', REMOTE_ADDR='10.0.0.9')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(consume_upload_token('ip:10.0.0.9').allowed)
+        self.assertFalse(consume_upload_token('ip:10.0.0.9').allowed)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewsTestCase(TestCase):
+    """Unit tests for async_views.py"""
+
+    def setUp(self):
+        self.client = AsyncClient()
+        cache.clear()
+        result_cache.clear_local()
+        self.s3 = MagicMock(put_object=AsyncMock(return_value={}), delete_object=AsyncMock(return_value={}))
+        self.dynamodb = MagicMock(
+            get_item=AsyncMock(), put_item=AsyncMock(return_value={}), delete_item=AsyncMock(return_value={})
+        )
+        aws_clients = MagicMock(get=AsyncMock(return_value=(self.s3, self.dynamodb)))
+        patcher = patch('weather_analysis.async_views.aws_clients', aws_clients)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('weather_analysis.async_views.check_queue_admission', return_value=AdmissionDecision(allowed=True))
+    @patch('weather_analysis.async_views.run_weather_analysis')
+    async def test_async_upload_success(self, mock_task, mock_admission):
+        """
+        Test async upload - File and metadata are written, then the task is published under the stored id
+        """
+        mock_task.apply_async.side_effect = lambda args, task_id: MagicMock(id=task_id)
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0"
+        test_file = SimpleUploadedFile("test_weather.csv", csv_content, content_type="text/csv")
+
+        response = await self.client.post('/api/v2/upload/', {'file': test_file})
+
+        # Assertions
+        data = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(data['content_hash'], get_file_hash(csv_content))
+        self.assertEqual(data['job_id'], analysis_key(get_file_hash(csv_content), {}))
+        self.s3.put_object.assert_awaited_once()
+        stored_item = self.dynamodb.put_item.call_args.kwargs['Item']
+        self.assertEqual(stored_item['celery_id']['S'], data['celery_id'])
+        self.assertEqual(mock_task.apply_async.call_args.kwargs['task_id'], data['celery_id'])
+
+    @patch('weather_analysis.async_views.check_queue_admission', return_value=AdmissionDecision(allowed=True))
+    @patch('weather_analysis.async_views.run_weather_analysis')
+    async def test_async_upload_s3_failure_discards_metadata(self, mock_task, mock_admission):
+        """
+        Test async upload - A failed S3 put removes the concurrently written metadata and publishes no task
+        """
+        self.s3.put_object.side_effect = RuntimeError("S3 unavailable")
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-02,25.5,10.2,65.0"
+        test_file = SimpleUploadedFile("test_weather.csv", csv_content, content_type="text/csv")
+
+        response = await self.client.post('/api/v2/upload/', {'file': test_file})
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        mock_task.apply_async.assert_not_called()
+        stored_item = self.dynamodb.put_item.call_args.kwargs['Item']
+        discarded = self.dynamodb.delete_item.call_args.kwargs
+        self.assertEqual(discarded['Key'], {'job_id': stored_item['job_id']})
+        self.assertEqual(discarded['ExpressionAttributeValues'][':celery_id'], stored_item['celery_id'])
+
+    async def test_async_status_reads_results_without_celery(self):
+        """
+        Test async status - A stored result is returned directly and cached for the next request
+        """
+        job_id = 'e' * 64
+        stored = json.dumps({'status': 'SUCCESS', 'time_series_data': {'date': ['2024-01-01'], 'mean_temp_C': [25.5]}})
+        self.dynamodb.get_item.side_effect = [
+            {'Item': {'celery_id': {'S': 'test-celery-id-123'}}},
+            {'Item': {'results_columnar': {'S': stored}}},
+        ]
+
+        with patch('weather_analysis.async_views.AsyncResult') as mock_async_result:
+            response = await self.client.get(f'/api/v2/status/{job_id}/?layout=columnar')
+            cached = await self.client.get(f'/api/v2/status/{job_id}/?layout=columnar')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'"results":' + stored.encode(), response.content)
+        self.assertEqual(response['ETag'], f'"{job_id}.columnar"')
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.dynamodb.get_item.await_count, 2)
+        mock_async_result.assert_not_called()
+
+    async def test_async_status_reads_offloaded_results(self):
+        """
+        Test async status - A result stored in S3 is fetched through its JobResults pointer and served as records
+        """
+        job_id = 'e' * 64
+        stored = json.dumps({'status': 'SUCCESS', 'time_series_data': {'date': ['2024-01-01'], 'mean_temp_C': [25.5]}})
+        self.dynamodb.get_item.side_effect = [
+            {'Item': {'celery_id': {'S': 'test-celery-id-123'}}},
+            {'Item': {'job_id': {'S': job_id}, 'results_s3_key': {'S': f'results/{job_id}.json'}}},
+        ]
+        body = MagicMock(read=AsyncMock(return_value=stored.encode()))
+        body.__aenter__ = AsyncMock(return_value=body)
+        body.__aexit__ = AsyncMock(return_value=False)
+        self.s3.get_object = AsyncMock(return_value={'Body': body})
+
+        response = await self.client.get(f'/api/v2/status/{job_id}/')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.s3.get_object.call_args.kwargs['Key'], f'results/{job_id}.json')
+        self.assertEqual(
+            json.loads(response.content)['results']['time_series_data'], [{'date': '2024-01-01', 'mean_temp_C': 25.5}],
+        )
+
+    async def test_async_delete_job(self):
+        """
+        Test async delete - Both tables, a recorded profile and any offloaded result are cleared, the cached
+        result is invalidated, and a failed object delete does not fail the request
+        """
+        job_id = 'f' * 64
+        await sync_to_async(result_cache.set)(job_id, {'records': '{"status": "SUCCESS"}'}, local=True)
+        self.dynamodb.delete_item.return_value = {'Attributes': {'job_id': {'S': job_id}, 'profile': {'S': '{}'}}}
+        self.s3.delete_object.side_effect = ClientError({'Error': {'Code': 'InternalError'}}, 'DeleteObject')
+
+        response = await self.client.delete(f'/api/v2/delete/{job_id}/')
+        deleted_keys = [call.kwargs['Key'] for call in self.s3.delete_object.call_args_list]
+
+        self.dynamodb.delete_item.return_value = {}
+        self.s3.delete_object.reset_mock()
+        unprofiled_response = await self.client.delete(f'/api/v2/delete/{"e" * 64}/')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.dynamodb.delete_item.await_count, 4)
+        self.assertEqual(self.dynamodb.delete_item.call_args_list[0].kwargs['ReturnValues'], 'ALL_OLD')
+        self.assertEqual(deleted_keys, [f"profiles/{job_id}.speedscope.json", f"results/{job_id}.json"])
+        self.assertIsNone(await result_cache.aget(job_id))
+        self.assertEqual(unprofiled_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [call.kwargs['Key'] for call in self.s3.delete_object.call_args_list], [f"results/{'e' * 64}.json"],
+        )
+
+    @override_settings(WEATHER_CDN_PURGE='weather_analysis.tests.record_cdn_purge')
+    async def test_async_delete_job_purges_cdn(self):
+        """
+        Test async delete - The configured CDN purge receives every status URL of the deleted job
+        """
+        job_id = 'f' * 64
+        purged_urls.clear()
+
+        response = await self.client.delete(f'/api/v2/delete/{job_id}/')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(f'/api/v1/status/{job_id}/', purged_urls)
+        self.assertIn(f'/api/v2/status/{job_id}/?layout=columnar&wait=false', purged_urls)
+
+
 class TasksTestCase(TestCase):
     """Unit tests for tasks.py"""
     
@@ -183,10 +658,344 @@ class TasksTestCase(TestCase):
         self.assertIn('Missing required columns', result['report_summary'])
         self.assertEqual(result['num_records'], 0)
         
+    def test_perform_analysis_detects_day_first_dates(self):
+        """
+        Test perform_analysis - Date format is detected once and applied to every row
+        """
+        dates = [f'{day:02d}/02/2024' for day in range(1, 21)] + ['not a date']
+        data = {
+            'date': dates,
+            'mean_temp_C': [25.0] * len(dates),
+            'wind_speed': [10.0] * len(dates),
+            'humidity': [65.0] * len(dates)
+        }
+        self.assertEqual(detect_date_format(pd.Series(data['date'])), '%d/%m/%Y')
+
+        result = perform_analysis(pd.DataFrame(data))
+
+        # Assertions
+        self.assertEqual(result['num_records'], 20)
+        self.assertEqual(result['time_series_data'][12]['date'], '2024-02-13')
+        self.assertIn('from 2024-02-01 to 2024-02-20', result['report_summary'])
+
+    def test_perform_analysis_keeps_wall_time_of_offset_dates(self):
+        """
+        Test perform_analysis - Timestamps with a UTC offset are reported on their local calendar day
+        """
+        dates = [f'2024-01-{day:02d}T00:30:00+02:00' for day in range(1, 11)]
+        data = {
+            'date': dates,
+            'mean_temp_C': [25.0] * len(dates),
+            'wind_speed': [10.0] * len(dates),
+            'humidity': [65.0] * len(dates)
+        }
+        mixed = parse_dates(pd.Series(['2024-01-01T00:30:00+02:00', '2024-01-01T23:30:00-05:00']))
+        aware = pd.Series(pd.to_datetime(dates))
+
+        result = perform_analysis(pd.DataFrame(data), params={'sections': ['aggregates']})
+
+        # Assertions
+        self.assertEqual(result['time_series_data'][0]['date'], '2024-01-01')
+        self.assertIn('from 2024-01-01 to 2024-01-10', result['report_summary'])
+        self.assertEqual(result['aggregates']['daily']['date'][0], '2024-01-01')
+        self.assertEqual(format_dates(mixed).tolist(), ['2024-01-01', '2024-01-01'])
+        self.assertEqual(format_dates(aware).tolist()[0], '2024-01-01')
+
+    def test_perform_analysis_resampled_and_rolling_aggregates(self):
+        """
+        Test perform_analysis - Period aggregates and rolling statistics are computed server-side
+        """
+        dates = pd.date_range('2024-01-01', '2024-03-31', freq='12h')
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d %H:%M'),
+            'mean_temp_C': np.arange(len(dates), dtype=float),
+            'wind_speed': 5.0,
+            'humidity': 60.0,
+        })
+
+        result = perform_analysis(df, params={'sections': ['aggregates', 'rolling']})
+        monthly = result['aggregates']['monthly']
+
+        # Assertions
+        self.assertEqual(monthly['date'], ['2024-01-01', '2024-02-01', '2024-03-01'])
+        self.assertEqual(monthly['mean_temp_C']['min'], [0.0, 62.0, 120.0])
+        self.assertEqual(monthly['mean_temp_C']['max'], [61.0, 119.0, 180.0])
+        self.assertEqual(len(result['aggregates']['daily']['date']), 91)
+        self.assertFalse(result['aggregates']['daily']['downsampled'])
+        # Weeks run Monday to Sunday and are labelled by their Monday
+        weekly = result['aggregates']['weekly']
+        self.assertEqual(weekly['date'][:2], ['2024-01-01', '2024-01-08'])
+        self.assertEqual(weekly['mean_temp_C']['min'][:2], [0.0, 14.0])
+        # The 7-day rolling mean of daily means on day 7 covers days 1-7
+        rolling = result['rolling']['7d']
+        self.assertEqual(rolling['date'][6], '2024-01-07')
+        self.assertEqual(rolling['mean_temp_C']['mean'][6], 6.5)
+        self.assertEqual(rolling['humidity']['std'][6], 0.0)
+
+    @override_settings(WEATHER_AGGREGATE_MAX_POINTS=30)
+    def test_perform_analysis_downsampled_aggregates_are_flagged(self):
+        """
+        Test perform_analysis - Daily series longer than WEATHER_AGGREGATE_MAX_POINTS are strided and flagged
+        """
+        dates = pd.date_range('2024-01-01', periods=91)
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'mean_temp_C': np.arange(len(dates), dtype=float),
+            'wind_speed': 5.0,
+            'humidity': 60.0,
+        })
+
+        result = perform_analysis(df, params={'sections': ['aggregates', 'rolling']})
+        daily, monthly = result['aggregates']['daily'], result['aggregates']['monthly']
+
+        # Assertions
+        self.assertTrue(daily['downsampled'])
+        self.assertEqual(daily['stride'], 4)
+        self.assertEqual(daily['date'][:2], ['2024-01-01', '2024-01-05'])
+        self.assertEqual(len(daily['date']), len(daily['mean_temp_C']['mean']))
+        self.assertTrue(result['rolling']['7d']['downsampled'])
+        self.assertFalse(monthly['downsampled'])
+        self.assertEqual(monthly['stride'], 1)
+
+    @override_settings(WEATHER_GROUP_MAX_POINTS=10)
+    def test_perform_analysis_grouped_by_station(self):
+        """
+        Test perform_analysis - Per-station statistics and downsampled series with group_by
+        """
+        rng = np.random.default_rng(0)
+        frames = []
+        for station, size in (('north', 40), ('south', 25), ('east', 5)):
+            humidity = rng.uniform(40, 90, size)
+            frames.append(pd.DataFrame({
+                'date': pd.date_range('2024-01-01', periods=size).strftime('%Y-%m-%d'),
+                'station_id': station,
+                'mean_temp_C': 30 - 0.2 * humidity + rng.normal(0, 1, size),
+                'wind_speed': 5.0,
+                'humidity': humidity,
+            }))
+        df = pd.concat(frames, ignore_index=True).sample(frac=1, random_state=0)
+
+        result = perform_analysis(df, group_by='station_id')
+        groups = result['groups']
+        stations = groups['stations']
+
+        # Assertions
+        self.assertEqual(groups['num_groups'], 3)
+        self.assertEqual(stations['key'], ['east', 'north', 'south'])
+        self.assertEqual(stations['count'], [5, 40, 25])
+        self.assertEqual(stations['end_date'][1], '2024-02-09')
+        north = df[df['station_id'] == 'north']
+        expected_r2 = np.corrcoef(north['humidity'], north['mean_temp_C'])[0, 1] ** 2
+        self.assertAlmostEqual(stations['temp_humidity_r2'][1], expected_r2, places=4)
+        # Each station's series is capped at 10 points
+        keys = groups['series']['key']
+        self.assertEqual([keys.count(k) for k in ('east', 'north', 'south')], [5, 10, 9])
+
+    @override_settings(WEATHER_GROUP_MAX_POINTS=10, WEATHER_GROUP_MAX_SERIES_POINTS=100)
+    def test_group_statistics_skips_nan_keys_and_caps_total_points(self):
+        """
+        Test group_statistics - NaN numeric keys are dropped and all series share one point budget
+        """
+        rng = np.random.default_rng(1)
+        size = 30 * 400
+        df = pd.DataFrame({
+            'date': np.tile(pd.date_range('2024-01-01', periods=30).strftime('%Y-%m-%d'), 400),
+            'station': np.repeat(np.arange(400, dtype=float), 30),
+            'mean_temp_C': rng.normal(20, 5, size),
+            'wind_speed': 5.0,
+            'humidity': rng.uniform(40, 90, size),
+        })
+        df.loc[:29, 'station'] = np.nan
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            groups = perform_analysis(df, group_by='station')['groups']
+        few = perform_analysis(df[df['station'].isin([1.0, 2.0, 3.0])], group_by='station')['groups']
+
+        # Assertions
+        self.assertEqual(groups['num_groups'], 399)
+        self.assertNotIn(None, groups['stations']['key'])
+        self.assertEqual(groups['series']['points_per_group'], 1)
+        self.assertTrue(groups['series']['truncated'])
+        self.assertEqual(len(groups['series']['key']), 100)
+        self.assertEqual(few['series']['points_per_group'], 10)
+        self.assertFalse(few['series']['truncated'])
+
+    def test_group_by_rejects_date_and_mixed_keys_sort(self):
+        """
+        Test group_by - Date/numeric columns are rejected up front; mixed-type station labels still group
+        """
+        csv_file = SimpleUploadedFile("a.csv", b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0")
+        serializer = FileUploadSerializer(data={'file': csv_file, 'group_by': 'date'})
+        df = pd.DataFrame({
+            'date': ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'],
+            'station': [101, 'A7', 101, None],
+            'mean_temp_C': [20.0, 21.0, 22.0, 23.0],
+            'wind_speed': [5.0, 5.0, 5.0, 5.0],
+            'humidity': [50.0, 60.0, 70.0, 80.0],
+        })
+
+        stations = perform_analysis(df, group_by='station')['groups']['stations']
+
+        # Assertions
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("Cannot group by 'date'", str(serializer.errors))
+        with self.assertRaises(ValueError):
+            canonical_params({'group_by': 'humidity'})
+        self.assertEqual(stations['key'], ['101', 'A7'])
+        self.assertEqual(stations['count'], [2, 1])
+
+    @override_settings(WEATHER_ANOMALY_CHUNK_SIZE=100, WEATHER_ANOMALY_MAX_RESULTS=2)
+    def test_perform_analysis_flags_seasonal_anomalies(self):
+        """
+        Test perform_analysis - Readings far from their monthly baseline are reported, capped
+        """
+        rng = np.random.default_rng(1)
+        dates = pd.date_range('2023-01-01', '2023-12-31')
+        temps = 10 + 10 * np.sin(np.arange(len(dates)) / 58) + rng.normal(0, 0.5, len(dates))
+        temps[[40, 200, 300]] += [15, -20, 25]
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'mean_temp_C': temps,
+            'wind_speed': 5.0,
+            'humidity': 60.0,
+        })
+
+        anomalies = perform_analysis(df)['anomalies']
+
+        # Assertions
+        self.assertEqual(anomalies['counts']['mean_temp_C'], 3)
+        self.assertEqual(anomalies['counts']['humidity'], 0)
+        self.assertEqual([a['date'] for a in anomalies['anomalies']], ['2023-10-28', '2023-07-20'])
+        self.assertTrue(anomalies['truncated'])
+
+    def test_grouped_running_stats_matches_batch(self):
+        """
+        Test GroupedRunningStats - Chunked updates give the same mean and std as one batch
+        """
+        rng = np.random.default_rng(2)
+        groups = rng.integers(0, 3, 1000)
+        values = rng.normal(100, 15, 1000)
+        running = GroupedRunningStats(3)
+        for start in range(0, 1000, 128):
+            running.update(groups[start:start + 128], values[start:start + 128])
+
+        # Assertions
+        for group in range(3):
+            self.assertAlmostEqual(running.mean[group], values[groups == group].mean(), places=8)
+            self.assertAlmostEqual(running.std()[group], values[groups == group].std(ddof=1), places=8)
+
+    def test_perform_analysis_data_quality_profile(self):
+        """
+        Test perform_analysis - Dropped rows are attributed to nulls, invalid numbers and bad dates
+        """
+        df = pd.DataFrame({
+            'date': ['2024-01-01', '2024-01-02', '2024-01-03', 'not a date', '2024-01-05', '2024-01-05'],
+            'mean_temp_C': ['20.0', None, 'n/a', '21.0', '22.0', '22.0'],
+            'wind_speed': [5.0, 5.0, 5.0, 5.0, 6.0, 6.0],
+            'humidity': [60.0, 61.0, 62.0, 63.0, 64.0, 64.0],
+        })
+
+        quality = perform_analysis(df)['data_quality']
+
+        # Assertions
+        self.assertEqual(quality['rows'], 6)
+        self.assertEqual(quality['valid_rows'], 3)
+        self.assertEqual(quality['dropped_rows'], {
+            'total': 3, 'missing_values': 1, 'invalid_numbers': 1, 'invalid_dates': 1,
+        })
+        self.assertEqual(quality['duplicate_rows'], 1)
+        self.assertEqual(quality['duplicate_dates'], 1)
+        temp = quality['columns']['mean_temp_C']
+        self.assertEqual((temp['nulls'], temp['invalid'], temp['min'], temp['max']), (1, 1, 20.0, 22.0))
+        self.assertEqual(quality['columns']['date']['unparseable'], 1)
+
+    def test_data_quality_quantiles_are_deterministic(self):
+        """
+        Test numeric_column_profile - Sketched quantiles are identical across runs on the same data
+        """
+        values = pd.Series(np.random.default_rng(3).normal(20, 5, 50000))
+
+        first = numeric_column_profile(values, values)
+        second = numeric_column_profile(values, values)
+
+        # Assertions
+        self.assertEqual(first['quantiles'], second['quantiles'])
+
+    def test_perform_analysis_parameters(self):
+        """
+        Test perform_analysis - Date range, chart resolution and sections follow the parameters
+        """
+        dates = pd.date_range('2024-01-01', periods=90)
+        df = pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'mean_temp_C': np.arange(90, dtype=float),
+            'wind_speed': 5.0,
+            'humidity': np.linspace(40, 80, 90),
+        })
+
+        result = perform_analysis(df, layout='columnar', params={
+            'start_date': '2024-02-01', 'end_date': '2024-02-29', 'chart_max_points': 10, 'sections': ['aggregates'],
+        })
+
+        # Assertions
+        self.assertEqual(result['num_records'], 29)
+        self.assertEqual(len(result['time_series_data']['date']), 10)
+        self.assertEqual(result['time_series_data']['date'][0], '2024-02-01')
+        self.assertIn('aggregates', result)
+        self.assertNotIn('anomalies', result)
+        self.assertNotIn('data_quality', result)
+        self.assertEqual(result['regression_analysis']['features'], ['humidity', 'mean_temp_C'])
+
+    def test_analysis_key_is_canonical(self):
+        """
+        Test analysis_key - Equivalent parameter sets share a key, different ones do not
+        """
+        content_hash = 'a' * 64
+
+        # Assertions
+        self.assertEqual(
+            analysis_key(content_hash, {}),
+            analysis_key(content_hash, {'sections': ['groups', 'anomalies', 'data_quality']}),
+        )
+        # The period and rolling series are opt-in
+        self.assertNotIn('aggregates', canonical_params({})['sections'])
+        self.assertNotEqual(
+            analysis_key(content_hash, {}),
+            analysis_key(content_hash, {'sections': ['rolling', 'groups', 'anomalies', 'data_quality', 'aggregates']}),
+        )
+        self.assertNotEqual(analysis_key(content_hash, {}), analysis_key(content_hash, {'chart_max_points': 50}))
+        self.assertNotEqual(analysis_key(content_hash, {}), analysis_key('b' * 64, {}))
+        # An explicit empty section list is its own analysis, not the default
+        self.assertEqual(canonical_params({'sections': []})['sections'], [])
+        self.assertNotEqual(analysis_key(content_hash, {}), analysis_key(content_hash, {'sections': []}))
+        self.assertEqual(canonical_params({'sections': None})['sections'], canonical_params({})['sections'])
+        with self.assertRaises(ValueError):
+            canonical_params({'sections': ['forecast']})
+        with self.assertRaises(ValueError):
+            canonical_params({'columns': []})
+
+    def test_kll_sketch_quantiles_within_rank_error(self):
+        """
+        Test KLLSketch - Quantiles of a large stream stay within ~1% rank error in bounded memory
+        """
+        values = np.random.default_rng(3).normal(size=200000)
+        sketch = KLLSketch(k=200, seed=0)
+        for start in range(0, len(values), 10000):
+            sketch.update(values[start:start + 10000])
+        qs = np.array([0.05, 0.5, 0.95])
+
+        estimates = sketch.quantiles(qs)
+
+        # Assertions
+        ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+        self.assertTrue(np.all(np.abs(ranks - qs) < 0.02))
+        self.assertLess(sum(len(level) for level in sketch.levels), 1000)
+
     @patch('weather_analysis.tasks.s3_client')
     @patch('weather_analysis.tasks.dynamodb_client')
-    @patch('weather_analysis.tasks.cache')
-    def test_run_weather_analysis_task_success(self, mock_cache, mock_dynamodb, mock_s3):
+    @patch('weather_analysis.tasks.result_cache')
+    def test_run_weather_analysis_task_success(self, mock_result_cache, mock_dynamodb, mock_s3):
         """
         Test run_weather_analysis - Celery task successfully executed
         """
@@ -198,23 +1007,22 @@ class TasksTestCase(TestCase):
         csv_content = b"date,mean_temp_C,wind_speed,humidity\n2024-01-01,25.5,10.2,65.0\n2024-01-02,26.0,12.5,70.0"
         
         # Mock S3 client - s3_client is a module-level variable
+        mock_s3.head_object.return_value = {'ContentLength': len(csv_content)}
         mock_s3.get_object.return_value = {'Body': BytesIO(csv_content)}
         
         # Mock DynamoDB client
         mock_dynamodb.put_item = MagicMock()
         mock_dynamodb.update_item = MagicMock()
         
-        # Mock cache - cache is a Django module
-        mock_cache.set = MagicMock()
-        
-        # Create task instance
-        task_instance = Mock()
-        task_instance.request = Mock()
-        task_instance.request.id = 'test-celery-id'
-        task_instance.update_state = MagicMock()
+        # Spool and checkpoints go to a scratch directory, checkpoint stages to LOCMEM
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        dataset_cache.clear()
         
-        # Execute task
-        result = run_weather_analysis(task_instance, job_id, s3_key)
+        # Execute task (run() binds the task itself as `self`)
+        with override_settings(CACHES=LOCMEM_CACHES, WEATHER_SPOOL_DIR=spool.name), \
+             patch.object(run_weather_analysis, 'update_state'):
+            result = run_weather_analysis.run(job_id, s3_key)
         
         # Assertions
         self.assertEqual(result['status'], 'SUCCESS')
@@ -223,8 +1031,12 @@ class TasksTestCase(TestCase):
         # Verify methods are called
         mock_s3.get_object.assert_called_once()
         mock_dynamodb.put_item.assert_called()
+        # One layout is stored; the other is converted on read
+        self.assertEqual(set(mock_dynamodb.put_item.call_args.kwargs['Item']), {'job_id', 'results_columnar'})
         mock_dynamodb.update_item.assert_called()
-        mock_cache.set.assert_called_once()
+        mock_result_cache.set.assert_called_once()
+        # The compute time is recorded for early (XFetch) refreshes of the entry
+        self.assertGreater(mock_result_cache.set.call_args.kwargs['delta'], 0)
         
     @patch('weather_analysis.tasks.s3_client')
     @patch('weather_analysis.tasks.dynamodb_client')
@@ -246,3 +1058,554 @@ class TasksTestCase(TestCase):
             
             # Verify exception message
             self.assertIn('AWS clients failed', str(context.exception))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CheckpointRetryTestCase(TestCase):
+    """Unit tests for task retries and checkpoints.py"""
+
+    def setUp(self):
+        cache.clear()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.settings_override = override_settings(WEATHER_SPOOL_DIR=spool.name, WEATHER_PREVIEW_ENABLED=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        dataset_cache.clear()
+
+    def test_is_retryable_error(self):
+        """
+        Test is_retryable_error - Throttling and 5xx errors are retried, validation errors are not
+        """
+        throttled = ClientError(
+            {'Error': {'Code': 'ProvisionedThroughputExceededException'}, 'ResponseMetadata': {'HTTPStatusCode': 400}},
+            'PutItem',
+        )
+        invalid = ClientError(
+            {'Error': {'Code': 'ValidationException'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}, 'PutItem'
+        )
+
+        # Assertions
+        self.assertTrue(is_retryable_error(throttled))
+        self.assertFalse(is_retryable_error(invalid))
+        self.assertTrue(is_retryable_error(redis.exceptions.ConnectionError()))
+        self.assertFalse(is_retryable_error(ValueError('bad data')))
+
+    @patch('weather_analysis.tasks.retry_countdown', return_value=0)
+    @patch('weather_analysis.tasks.s3_client')
+    @patch('weather_analysis.tasks.dynamodb_client')
+    def test_throttled_persist_retries_from_checkpoint(self, mock_dynamodb, mock_s3, mock_countdown):
+        """
+        Test run_weather_analysis - A throttled put_item is retried without downloading or parsing again
+        """
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n" + b"".join(
+            f"2024-01-{day:02d},{20 + day % 5},{day % 7},{50 + day % 9}\n".encode() for day in range(1, 29)
+        )
+        mock_s3.head_object.return_value = {'ContentLength': len(csv_content)}
+        mock_s3.get_object.side_effect = lambda **kwargs: {'Body': BytesIO(csv_content)}
+        mock_dynamodb.put_item.side_effect = [
+            ClientError({'Error': {'Code': 'ThrottlingException'}}, 'PutItem'),
+            {},
+        ]
+        job_id = 'b' * 64
+
+        with patch.object(run_weather_analysis, 'update_state'), \
+             patch('weather_analysis.tasks.read_weather_file', wraps=read_weather_file) as mock_read, \
+             patch('weather_analysis.tasks.perform_analysis', wraps=perform_analysis) as mock_analysis:
+            result = run_weather_analysis.apply(args=(job_id, 'uploads/retry.csv'), task_id='retry-task')
+
+        # Assertions
+        self.assertEqual(result.get(), {'status': 'SUCCESS', 'job_id': job_id})
+        self.assertEqual(mock_dynamodb.put_item.call_count, 2)
+        self.assertEqual(mock_s3.head_object.call_count, 1)
+        self.assertEqual(mock_read.call_count, 1)
+        self.assertEqual(mock_analysis.call_count, 1)
+        self.assertIsNone(JobCheckpoint(job_id).stage)
+        self.assertIsNotNone(result_cache.get(job_id))
+
+    def test_sweep_stale_checkpoints(self):
+        """
+        Test sweep_stale_checkpoints - Directories of abandoned jobs are removed once past the checkpoint timeout
+        """
+        abandoned, active = JobCheckpoint('c' * 64), JobCheckpoint('d' * 64)
+        abandoned.save_results({'records': '{}'})
+        active.save_results({'records': '{}'})
+        expired = time.time() - 2 * 86400
+        os.utime(abandoned.directory, (expired, expired))
+
+        with self.settings(WEATHER_CHECKPOINT_TIMEOUT=86400):
+            removed = sweep_stale_checkpoints(force=True)
+
+        # Assertions
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(abandoned.directory))
+        self.assertEqual(active.load_results(), {'records': '{}'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DatasetCacheTestCase(TestCase):
+    """Unit tests for dataset_cache.py"""
+
+    def setUp(self):
+        cache.clear()
+        dataset_cache.clear()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.settings_override = override_settings(WEATHER_SPOOL_DIR=spool.name, WEATHER_PREVIEW_ENABLED=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    @patch('weather_analysis.tasks.s3_client')
+    @patch('weather_analysis.tasks.dynamodb_client')
+    def test_reanalysis_reuses_parsed_frame(self, mock_dynamodb, mock_s3):
+        """
+        Test run_weather_analysis - New parameter sets on a file reuse the parsed frame, widening it when needed
+        """
+        csv_content = b"date,mean_temp_C,wind_speed,humidity,station\n" + b"".join(
+            f"2024-01-{day:02d},{20 + day % 5},{day % 7},{50 + day % 9},s{day % 2}\n".encode() for day in range(1, 29)
+        )
+        mock_s3.head_object.return_value = {'ContentLength': len(csv_content)}
+        mock_s3.get_object.side_effect = lambda **kwargs: {'Body': BytesIO(csv_content)}
+        s3_key = f"uploads/{'c' * 64}.csv"
+        runs = [{}, {'sections': ['aggregates']}, {'group_by': 'station'}, {'group_by': 'station', 'chart_max_points': 5}]
+
+        with patch.object(run_weather_analysis, 'update_state'), \
+             patch('weather_analysis.tasks.read_weather_file', wraps=read_weather_file) as mock_read:
+            for params in runs:
+                job_id = analysis_key('c' * 64, params)
+                result = run_weather_analysis.apply(args=(job_id, s3_key, None, params))
+                self.assertEqual(result.get()['status'], 'SUCCESS')
+
+        # Assertions
+        self.assertEqual(mock_read.call_count, 2)
+        self.assertIn('station', mock_read.call_args.kwargs['columns'])
+        self.assertEqual(dataset_cache.stats()['entries'], 1)
+        grouped = json.loads(result_cache.get(analysis_key('c' * 64, runs[2])))
+        plain = json.loads(result_cache.get(analysis_key('c' * 64, {})))
+        self.assertIn('groups', grouped)
+        self.assertEqual(grouped['report_summary'], plain['report_summary'])
+
+    def test_route_analysis_task_affinity(self):
+        """
+        Test route_analysis_task - Jobs on the same file share a queue; routing is off by default
+        """
+        name = 'weather_analysis.tasks.run_weather_analysis'
+        s3_key = f"uploads/{'d' * 64}.csv"
+
+        # Assertions
+        self.assertIsNone(route_analysis_task(name, ('job-1', s3_key), {}, {}))
+        with override_settings(WEATHER_AFFINITY_QUEUES=4):
+            route = route_analysis_task(name, ('job-1', s3_key), {}, {})
+            self.assertEqual(route, route_analysis_task(name, ('job-2', s3_key, 'station'), {}, {}))
+            self.assertRegex(route['queue'], r'^weather_analysis\.affinity\.[0-3]$')
+            self.assertIsNone(route_analysis_task('config.celery.debug_task', (), {}, {}))
+
+
+class LoadTestTestCase(TestCase):
+    """Unit tests for loadtest.py"""
+
+    def test_parse_size_mix_and_latency_summary(self):
+        """
+        Test parse_size_mix and latency_summary - Weighted sizes parse and percentiles are in milliseconds
+        """
+        mix = parse_size_mix('16KB:6, 2mb')
+        summary = latency_summary([0.001 * n for n in range(1, 101)])
+
+        # Assertions
+        self.assertEqual(mix, [('16KB', 16384, 6.0), ('2MB', 2 * 1024 * 1024, 1.0)])
+        self.assertEqual(summary['p50'], 50.5)
+        self.assertEqual(summary['max'], 100.0)
+        self.assertIsNone(latency_summary([])['p95'])
+        with self.assertRaises(ValueError):
+            parse_size_mix('16XB')
+
+    @skipUnless(importlib.util.find_spec('moto') and importlib.util.find_spec('fakeredis'), "moto and fakeredis are required")
+    @override_settings(WEATHER_DOWNLOAD_PART_BYTES=4096)
+    def test_run_load_test_offline(self):
+        """
+        Test run_load_test - Journeys run against moto and fakeredis and every endpoint is reported,
+        with the task's ranged S3 GETs counted against the worker
+        """
+        report = run_load_test(users=2, iterations=2, size_mix='8KB', file_pool=1, workers=2,
+                               list_every=1, delete_ratio=0.0)
+
+        # Assertions
+        endpoints = report['endpoints']
+        self.assertEqual(endpoints['upload']['requests'], 4)
+        self.assertEqual(endpoints['status']['status_codes'], {'200': 4})
+        self.assertEqual(endpoints['job-statuses']['requests'], 4)
+        self.assertEqual(endpoints['delete']['requests'], 0)
+        self.assertIn('redis.EVAL', endpoints['upload']['backend_calls'])
+        self.assertEqual(endpoints['job-statuses']['backend_calls'], {'dynamodb.Scan': 4})
+        self.assertGreaterEqual(report['tasks']['count'], 1)
+        self.assertEqual(report['tasks']['failures'], 0)
+        self.assertIn('dynamodb.PutItem', report['tasks']['backend_calls'])
+        self.assertGreaterEqual(report['tasks']['backend_calls']['s3.GetObject'], 2)
+        self.assertNotIn('s3.GetObject', report['background_calls'])
+        self.assertIsNotNone(endpoints['status']['latency_ms']['p95'])
+
+    @skipUnless(importlib.util.find_spec('moto') and importlib.util.find_spec('fakeredis'), "moto and fakeredis are required")
+    def test_mb_scale_upload_results_are_persisted(self):
+        """
+        Test run_weather_analysis - Results of 0.5-2 MB uploads stay within DynamoDB's 400 KB item limit
+        """
+        uploads = [
+            (weather_csv(512 * 1024, seed=1), {}),
+            (weather_csv(2 * 1024 ** 2, seed=2), {'sections': 'aggregates,rolling,anomalies,data_quality'}),
+        ]
+        stored = []
+        with offline_backends(BackendCallCounter(), workers=1, eager=True, rate_limit=False):
+            client = APIClient()
+            for n, (content, params) in enumerate(uploads):
+                upload = client.post('/api/v1/upload/', {
+                    'file': SimpleUploadedFile(f'weather-{n}.csv', content, content_type='text/csv'), **params,
+                })
+                job_id = upload.json()['job_id']
+                item = views.dynamodb_client.get_item(
+                    TableName=settings.DYNAMODB_RESULTS_TABLE_NAME, Key={'job_id': {'S': job_id}},
+                )['Item']
+                # Served from JobResults (and S3), not from the cache the task filled
+                result_cache.clear_local()
+                cache.clear()
+                status_response = client.get(f'/api/v1/status/{job_id}/')
+                stored.append((job_id, item, status_response))
+            last_job_id, last_item, _ = stored[-1]
+            client.delete(f'/api/v1/delete/{last_job_id}/')
+            remaining = views.s3_client.list_objects_v2(Bucket=settings.AWS_S3_BUCKET_NAME, Prefix='results/')
+
+        # Assertions
+        for (job_id, item, status_response), (content, _) in zip(stored, uploads):
+            self.assertLess(sum(len(value['S']) for value in item.values()), 400 * 1024)
+            self.assertEqual(status_response.status_code, 200)
+            self.assertEqual(status_response.json()['results']['num_records'], content.count(b'\n') - 1)
+        self.assertIn('results_columnar', stored[0][1])
+        self.assertEqual(last_item['results_s3_key']['S'], f'results/{last_job_id}.json')
+        self.assertIn('aggregates', stored[-1][2].json()['results'])
+        self.assertEqual(remaining['KeyCount'], 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfilingTestCase(TestCase):
+    """Unit tests for profiling.py and the job profile endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        dataset_cache.clear()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.settings_override = override_settings(WEATHER_SPOOL_DIR=spool.name, WEATHER_PREVIEW_ENABLED=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_sampling_profiler_speedscope(self):
+        """
+        Test SamplingProfiler - Samples of a busy thread name its hot function in a speedscope file
+        """
+        def busy_loop():
+            deadline = time.perf_counter() + 0.15
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        busy_loop()
+        profiler.stop()
+        speedscope = profiler.speedscope('test')
+
+        # Assertions
+        frames = speedscope['shared']['frames']
+        sampled = speedscope['profiles'][0]
+        self.assertEqual(sampled['type'], 'sampled')
+        self.assertEqual(len(sampled['samples']), len(sampled['weights']))
+        self.assertGreater(profiler.sample_count, 10)
+        hot = [frames[stack[-1]]['name'] for stack in sampled['samples']]
+        self.assertIn('busy_loop', hot)
+        self.assertIsNone(JobProfile('a' * 64).start().save(MagicMock(), MagicMock()))
+
+    def test_overlapping_job_profiles_share_tracemalloc(self):
+        """
+        Test JobProfile - Overlapping profiles report no peak memory and stop tracemalloc only after the last one
+        """
+        first = JobProfile('a' * 64, enabled=True).start()
+        second = JobProfile('b' * 64, enabled=True).start()
+        first.mark('parsed')
+        first.stop()
+        still_tracing = tracemalloc.is_tracing()
+        second.mark('parsed')
+        second.stop()
+        alone = JobProfile('c' * 64, enabled=True).start()
+        data = [bytes(1024 * 1024)]
+        alone.stop()
+        del data
+
+        # Assertions
+        self.assertTrue(still_tracing)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(first.stages[0]['peak_memory_bytes'])
+        self.assertIsNone(first.summary()['peak_memory_bytes'])
+        self.assertIsNone(second.summary()['peak_memory_bytes'])
+        self.assertGreaterEqual(alone.summary()['peak_memory_bytes'], 1024 * 1024)
+
+    @patch('weather_analysis.views.s3_client')
+    @patch('weather_analysis.views.dynamodb_client')
+    @patch('weather_analysis.tasks.s3_client')
+    @patch('weather_analysis.tasks.dynamodb_client')
+    def test_profiled_task_and_profile_endpoint(self, mock_dynamodb, mock_s3, mock_view_dynamodb, mock_view_s3):
+        """
+        Test run_weather_analysis and JobProfileView - A profiled job stores a speedscope file that the API serves
+        """
+        csv_content = b"date,mean_temp_C,wind_speed,humidity\n" + b"".join(
+            f"2024-01-{day:02d},{20 + day % 5},{day % 7},{50 + day % 9}\n".encode() for day in range(1, 29)
+        )
+        mock_s3.head_object.return_value = {'ContentLength': len(csv_content)}
+        mock_s3.get_object.side_effect = lambda **kwargs: {'Body': BytesIO(csv_content)}
+        job_id = 'a' * 64
+
+        with patch.object(run_weather_analysis, 'update_state'):
+            result = run_weather_analysis.apply(args=(job_id, f"uploads/{'a' * 64}.csv", None, {}, True))
+
+        self.assertEqual(result.get()['status'], 'SUCCESS')
+        stored = [call.kwargs for call in mock_s3.put_object.call_args_list]
+        self.assertEqual([kwargs['Key'] for kwargs in stored], [f"profiles/{job_id}.speedscope.json"])
+        summary_json = mock_dynamodb.update_item.call_args.kwargs['ExpressionAttributeValues'][':profile']['S']
+        summary = json.loads(summary_json)
+        self.assertEqual(
+            [stage['stage'] for stage in summary['stages']], ['downloaded', 'parsed', 'analyzed', 'persisted', 'finished']
+        )
+        self.assertGreater(summary['peak_memory_bytes'], 0)
+
+        mock_view_dynamodb.get_item.return_value = {'Item': {'job_id': {'S': job_id}, 'profile': {'S': summary_json}}}
+        mock_view_s3.get_object.return_value = {'Body': BytesIO(stored[0]['Body'])}
+        response = self.client.get(f'/api/v1/jobs/{job_id}/profile/')
+        summary_response = self.client.get(f'/api/v1/jobs/{job_id}/profile/?summary=true')
+        mock_view_dynamodb.get_item.return_value = {'Item': {'job_id': {'S': job_id}}}
+        missing = self.client.get(f'/api/v1/jobs/{job_id}/profile/')
+
+        # Assertions
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(json.loads(response.content)['profiles'][0]['type'], 'sampled')
+        self.assertEqual(summary_response.json()['s3_key'], f"profiles/{job_id}.speedscope.json")
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ReadersTestCase(TestCase):
+    """Unit tests for readers.py"""
+
+    def test_sample_csv_blocks_keeps_whole_lines_across_file(self):
+        """
+        Test sample_csv_blocks - Blocks are spread over the file and cut at line boundaries
+        """
+        lines = [f"2024-01-{i % 28 + 1:02d},{i},5.0,60.0" for i in range(2000)]
+        content = ("date,mean_temp_C,wind_speed,humidity\n" + "\n".join(lines) + "\n").encode()
+
+        sample, fraction = sample_csv_blocks(content, blocks=4, block_bytes=200)
+
+        # Assertions
+        df = pd.read_csv(BytesIO(sample))
+        self.assertEqual(list(df.columns), ['date', 'mean_temp_C', 'wind_speed', 'humidity'])
+        self.assertTrue(all(line in lines for line in sample.decode().splitlines()[1:]))
+        self.assertGreater(df['mean_temp_C'].max(), 1500)
+        self.assertAlmostEqual(fraction, (len(sample) - content.index(b'\n') - 1) / (len(content) - content.index(b'\n') - 1))
+
+    @override_settings(WEATHER_PREVIEW_EXCEL_MAX_ROWS=100)
+    def test_read_weather_sample_streams_leading_excel_rows(self):
+        """
+        Test read_weather_sample - An .xlsx preview streams only its leading rows with openpyxl, never calamine
+        """
+        dates = pd.date_range('2000-01-01', periods=5000)
+        buffer = BytesIO()
+        pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'mean_temp_C': np.arange(len(dates), dtype=float),
+        }).to_excel(buffer, index=False)
+
+        with patch('weather_analysis.readers.CalamineWorkbook') as calamine:
+            df, fraction = read_weather_sample(buffer.getvalue(), 'xlsx', columns=['date', 'mean_temp_C'])
+
+        # Assertions
+        self.assertEqual(len(df), 100)
+        self.assertEqual(df['date'].iloc[-1], '2000-04-09')
+        self.assertIsNone(fraction)
+        self.assertIsNone(create_preview('a' * 64, bytes(1024 * 1024), 'xls'))
+        calamine.from_object.assert_not_called()
+
+    def test_download_to_spool_ranged_parts_and_reuse(self):
+        """
+        Test download_to_spool - Parallel ranged GETs assemble the file, which is then reused
+        """
+        content = b"date,mean_temp_C,wind_speed,humidity\n" + b"2024-01-01,25.5,10.2,65.0\n" * 50
+
+        def get_object(Bucket, Key, Range):
+            start, end = (int(v) for v in Range.split('=')[1].split('-'))
+            return {'Body': BytesIO(content[start:end + 1])}
+
+        mock_s3 = MagicMock()
+        mock_s3.head_object.return_value = {'ContentLength': len(content)}
+        mock_s3.get_object.side_effect = get_object
+
+        with tempfile.TemporaryDirectory() as spool, \
+                override_settings(WEATHER_SPOOL_DIR=spool, WEATHER_DOWNLOAD_PART_BYTES=100):
+            path = download_to_spool(mock_s3, 'bucket', 'uploads/abc.csv')
+            again = download_to_spool(mock_s3, 'bucket', 'uploads/abc.csv')
+            with open(path, 'rb') as f:
+                downloaded = f.read()
+            df = read_weather_file(path, 'csv', columns=['date', 'mean_temp_C'])
+
+        # Assertions
+        self.assertEqual(downloaded, content)
+        self.assertEqual(again, path)
+        self.assertEqual(mock_s3.get_object.call_count, -(-len(content) // 100))
+        mock_s3.head_object.assert_called_once()
+        self.assertEqual(list(df.columns), ['date', 'mean_temp_C'])
+        self.assertEqual(len(df), 50)
+
+    def test_read_excel_multi_sheet_projects_columns(self):
+        """
+        Test read_weather_file - The first sheet by default; with '*' every sheet with the columns, concatenated
+        """
+        buffer = BytesIO()
+        with pd.ExcelWriter(buffer) as writer:
+            pd.DataFrame({
+                'date': ['2024-01-01', '2024-01-02'],
+                'mean_temp_C': [25.5, 26.0],
+                'wind_speed': [10.2, 12.5],
+                'humidity': [65.0, 70.0],
+                'station': ['A', 'A'],
+            }).to_excel(writer, sheet_name='station_a', index=False)
+            pd.DataFrame({'notes': ['metadata only']}).to_excel(writer, sheet_name='notes', index=False)
+            pd.DataFrame({
+                'humidity': [60.0],
+                'date': ['2024-01-03'],
+                'mean_temp_C': [24.8],
+                'wind_speed': [9.8],
+            }).to_excel(writer, sheet_name='station_b', index=False)
+
+        columns = ['date', 'humidity', 'mean_temp_C', 'wind_speed']
+        first = read_weather_file(buffer.getvalue(), 'xlsx', columns=columns)
+        df = read_weather_file(buffer.getvalue(), 'xlsx', columns=columns, sheets=['*'])
+        named = read_weather_file(buffer.getvalue(), 'xlsx', columns=columns, sheets=['station_b'])
+
+        # Assertions
+        self.assertEqual(list(df.columns), columns)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(named['date'].tolist(), ['2024-01-03'])
+        self.assertEqual(perform_analysis(df)['num_records'], 3)
+        self.assertNotEqual(analysis_key('a' * 64, {}), analysis_key('a' * 64, {'sheets': ['*']}))
+        with self.assertRaises(ValueError):
+            read_weather_file(buffer.getvalue(), 'xlsx', columns=columns, sheets=['station_c'])
+
+    @patch('weather_analysis.readers.CalamineWorkbook', None)
+    def test_read_excel_openpyxl_opens_workbook_once(self):
+        """
+        Test read_weather_file - Without calamine, every sheet is streamed from one openpyxl workbook
+        """
+        import openpyxl
+
+        buffer = BytesIO()
+        with pd.ExcelWriter(buffer) as writer:
+            pd.DataFrame({'notes': ['metadata only']}).to_excel(writer, sheet_name='notes', index=False)
+            for day in (1, 2, 3):
+                pd.DataFrame({
+                    'date': [f'2024-01-0{day}'],
+                    'mean_temp_C': [20.0 + day],
+                }).to_excel(writer, sheet_name=f'station_{day}', index=False)
+
+        with patch('openpyxl.load_workbook', wraps=openpyxl.load_workbook) as load_workbook:
+            df = read_weather_file(buffer.getvalue(), 'xlsx', columns=['date', 'mean_temp_C'], sheets='*')
+            missing = read_weather_file(buffer.getvalue(), 'xlsx', columns=['humidity'], sheets='*')
+
+        # Assertions
+        self.assertEqual(df['mean_temp_C'].tolist(), [21.0, 22.0, 23.0])
+        self.assertEqual(list(missing.columns), ['notes'])
+        self.assertEqual(load_workbook.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResultCacheTestCase(TestCase):
+    """Unit tests for result_cache.py"""
+
+    def setUp(self):
+        cache.clear()
+        result_cache.clear_local()
+
+    def test_byte_budget_lru_evicts_least_recently_used(self):
+        """
+        Test ByteBudgetLRU - Eviction is driven by total bytes, not entry count
+        """
+        lru = ByteBudgetLRU(max_bytes=10)
+        lru.set('a', b'1234')
+        lru.set('b', b'1234')
+        lru.get('a')
+        lru.set('c', b'1234')  # 12 bytes > 10: evicts 'b', the least recently used
+
+        # Assertions
+        self.assertEqual(lru.get('a'), b'1234')
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.stats()['evictions'], 1)
+        self.assertEqual(lru.stats()['bytes'], 8)
+        self.assertFalse(lru.set('big', b'x' * 11))
+
+    def test_two_tier_get_and_invalidate(self):
+        """
+        Test TwoTierResultCache - Redis hits populate the local tier and invalidation clears both
+        """
+        job_id = 'e' * 64
+        cache.set(result_cache_key(job_id), b'{"status":"SUCCESS"}')
+
+        self.assertEqual(result_cache.get(job_id), b'{"status":"SUCCESS"}')
+        cache.delete(result_cache_key(job_id))
+        # Served from the in-process tier even though Redis no longer has it
+        self.assertEqual(result_cache.get(job_id), b'{"status":"SUCCESS"}')
+
+        result_cache.invalidate(job_id)
+
+        # Assertions
+        self.assertIsNone(result_cache.get(job_id))
+        self.assertGreaterEqual(result_cache.stats()['local']['hits'], 1)
+
+    @override_settings(WEATHER_RESULT_CACHE_MAX_VALUE_BYTES=200)
+    def test_encode_entry_compresses_and_caps_size(self):
+        """
+        Test encode_entry - Values are compressed, and reduced to summary fields above the cap
+        """
+        small = json.dumps({'status': 'SUCCESS', 'time_series_data': [{'mean_temp_C': 25.5}] * 100})
+        payload, is_summary, _, _ = decode_entry(encode_entry(small, timeout=60))
+        self.assertEqual(payload.decode(), small)
+        self.assertFalse(is_summary)
+        self.assertLess(len(encode_entry(small, timeout=60)), len(small))
+
+        large = json.dumps({
+            'status': 'SUCCESS',
+            'num_records': 5000,
+            'time_series_data': [{'date': f'2024-01-{i % 28 + 1:02d}', 'mean_temp_C': i * 0.37} for i in range(5000)],
+        })
+        payload, is_summary, _, _ = decode_entry(encode_entry(large, timeout=60))
+
+        # Assertions
+        self.assertTrue(is_summary)
+        self.assertEqual(json.loads(payload), {'status': 'SUCCESS', 'num_records': 5000, 'truncated': True})
+        # Summary-only entries are not served as full results
+        job_id = 'f' * 64
+        cache.set(result_cache_key(job_id), encode_entry(large, timeout=60))
+        self.assertIsNone(result_cache.get(job_id))
+        self.assertIsNotNone(result_cache.get(job_id, allow_summary=True))
+
+    def test_hot_entry_is_refreshed_early_by_one_reader(self):
+        """
+        Test TwoTierResultCache - An entry due for early expiration is reloaded once, under the lock
+        """
+        job_id = '0' * 64
+        # A very slow producer (large delta) makes an early refresh certain
+        cache.set(result_cache_key(job_id), encode_entry(b'{"v":1}', timeout=60, delta=1e6))
+        loader = MagicMock(return_value=b'{"v":2}')
+
+        refreshed = result_cache.get(job_id, loader=loader)
+        served_locally = result_cache.get(job_id, loader=loader)
+
+        # Assertions
+        self.assertEqual(refreshed, b'{"v":2}')
+        self.assertEqual(served_locally, b'{"v":2}')
+        loader.assert_called_once()
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import FileUploadView, AnalysisStatusView, ListJobStatusesView, DeleteJobView
+from .views import FileUploadView, AnalysisStatusView, ListJobStatusesView, DeleteJobView, CacheStatsView, JobProfileView
 
 urlpatterns = [
     # file upload endpoint
@@ -10,4 +10,8 @@ urlpatterns = [
     path('job-statuses/', ListJobStatusesView.as_view(), name='job-statuses'),
     # delete job endpoint
     path('delete/<str:job_id>/', DeleteJobView.as_view(), name='delete-job'),
+    # job profile download endpoint
+    path('jobs/<str:job_id>/profile/', JobProfileView.as_view(), name='job-profile'),
+    # result cache statistics endpoint
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
 ]
\ No newline at end of file
@@ -1,18 +1,27 @@
 import os
 import hashlib
-import json
 import boto3
+import orjson
 import time 
 from datetime import datetime, timedelta 
 
 from django.conf import settings
-from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_header_parameters
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from celery.result import AsyncResult
-from .tasks import run_weather_analysis
+from .tasks import run_weather_analysis, records_to_columnar, columnar_to_records, encode_results, results_s3_key
+from .result_cache import result_cache, get_preview, discard_preview, RESULT_LAYOUTS, DEFAULT_RESULT_LAYOUT
+from .preview import create_preview
+from .cdn import purge_job_from_cdn
+from .params import analysis_key
+from .profiling import profile_s3_key, should_profile
 from .serializers import FileUploadSerializer, JobStatusSerializer, AnalysisResultSerializer
+from .middleware import strip_encoding_suffix
+from .admission import client_identifier, consume_upload_token, check_queue_admission
 import traceback
 import sys
 
@@ -41,16 +50,205 @@ s3_client, dynamodb_client = init_aws_clients()
 
 # Helper functions
 def get_file_hash(file_content: bytes) -> str:
-    """Calculate SHA256 hash of file content as Job ID."""
+    """SHA-256 of the file content: the upload's content hash, one input of the job ID (see analysis_key)."""
     if not file_content:
         raise ValueError("File content is empty or invalid for hashing.")
     return hashlib.sha256(file_content).hexdigest()
 
 
+def resolve_result_layout(layout=None, accepted_media_type=None) -> str:
+    """
+    Validate a requested time series layout, taken from an explicit `layout`
+    parameter or an Accept media type parameter (application/json; layout=columnar).
+    """
+    if not layout and accepted_media_type:
+        layout = parse_header_parameters(accepted_media_type)[1].get('layout')
+    layout = (layout or DEFAULT_RESULT_LAYOUT).lower()
+    if layout not in RESULT_LAYOUTS:
+        raise ValueError(f"Unsupported layout '{layout}'. Allowed values: {', '.join(RESULT_LAYOUTS)}")
+    return layout
+
+
+def get_result_layout(request) -> str:
+    """Time series layout requested by the client, from the query/form data or Accept header."""
+    return resolve_result_layout(
+        request.query_params.get('layout') or request.data.get('layout'),
+        getattr(request, 'accepted_media_type', None),
+    )
+
+
+UPLOAD_CONTENT_TYPES = {
+    '.csv': 'text/csv',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.xls': 'application/vnd.ms-excel'
+}
+
+# JobResults items hold one encoded result, in the columnar layout (the more
+# compact one); the records layout is converted from it on read. Results over
+# WEATHER_RESULT_ITEM_MAX_BYTES are stored in S3 and the item holds their key.
+# Items written before carry the records layout in `results`.
+RESULTS_ATTRIBUTE = 'results_columnar'
+RESULTS_ATTRIBUTE_LAYOUT = 'columnar'
+RESULTS_S3_KEY_ATTRIBUTE = 'results_s3_key'
+LEGACY_RESULTS_ATTRIBUTE = 'results'
+
+
+def results_projection() -> str:
+    """
+    Only the stored result is read; job_id tells an item that lacks it (written
+    before the columnar layout existed) apart from a missing item.
+    """
+    return f"job_id, {RESULTS_ATTRIBUTE}, {RESULTS_S3_KEY_ATTRIBUTE}"
+
+
+def results_pointer(results_item: dict):
+    """S3 key of a result too large for its JobResults item, or None if the item holds it."""
+    return results_item.get(RESULTS_S3_KEY_ATTRIBUTE, {}).get('S')
+
+
+def convert_result_payload(payload: str, stored_layout: str, layout: str) -> str:
+    """An encoded result, re-encoded in `layout` when it was stored in another one."""
+    if stored_layout == layout:
+        return payload
+    convert = records_to_columnar if layout == 'columnar' else columnar_to_records
+    return encode_results(convert(orjson.loads(payload)))
+
+
+def results_from_item(results_item: dict, layout: str):
+    """Encoded result in `layout` from a JobResults item, or None if the item predates RESULTS_ATTRIBUTE."""
+    payload = results_item.get(RESULTS_ATTRIBUTE, {}).get('S')
+    if payload is None:
+        return None
+    return convert_result_payload(payload, RESULTS_ATTRIBUTE_LAYOUT, layout)
+
+
+def results_from_legacy_item(results_item: dict, layout: str) -> str:
+    """Encoded result in `layout` from an item that only carries the records-layout `results`."""
+    payload = results_item.get(LEGACY_RESULTS_ATTRIBUTE, {}).get('S')
+    if not payload:
+        raise ValueError("Results data attribute missing in JobResults table item.")
+    return convert_result_payload(payload, 'records', layout)
+
+
+def load_results_from_dynamodb(job_id: str, layout: str) -> str:
+    """Fetch the encoded result for (job_id, layout) from the JobResults table."""
+    dynamodb_results_response = dynamodb_client.get_item(
+        TableName=settings.DYNAMODB_RESULTS_TABLE_NAME, 
+        Key={'job_id': {'S': job_id}},
+        ProjectionExpression=results_projection(),
+    )
+    
+    results_item = dynamodb_results_response.get('Item')
+    
+    if not results_item:
+        raise ValueError("Analysis results not found in JobResults table.")
+    s3_key = results_pointer(results_item)
+    if s3_key:
+        stored = s3_client.get_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=s3_key)['Body'].read()
+        return convert_result_payload(stored.decode(), RESULTS_ATTRIBUTE_LAYOUT, layout)
+    payload = results_from_item(results_item, layout)
+    if payload is not None:
+        return payload
+
+    # Fall back to the records layout only for items that predate the stored one
+    legacy_item = dynamodb_client.get_item(
+        TableName=settings.DYNAMODB_RESULTS_TABLE_NAME,
+        Key={'job_id': {'S': job_id}},
+        ProjectionExpression=LEGACY_RESULTS_ATTRIBUTE,
+    ).get('Item') or {}
+    return results_from_legacy_item(legacy_item, layout)
+
+
+def stored_job_objects(job_id: str, metadata: dict) -> list:
+    """
+    (name, S3 key) of each object a deleted job may have left besides the upload.
+    Profiles are recorded in the metadata item; an offloaded result is not (the
+    task can finish before the upload writes that item), so its key is always
+    listed: deleting a missing key succeeds.
+    """
+    objects = [('profile', profile_s3_key(job_id))] if 'profile' in metadata else []
+    return objects + [('result', results_s3_key(job_id))]
+
+
+def wants_blocking_status(wait_param) -> bool:
+    """The status endpoint blocks until the job finishes unless called with ?wait=false."""
+    return (wait_param or 'true').lower() not in ('0', 'false', 'no')
+
+
+def pending_status_data(job_id: str, current_status: str, layout: str) -> dict:
+    """Non-blocking status of an unfinished job, with its approximate preview when one exists."""
+    response_data = {"status": current_status, "job_id": job_id}
+    preview_payload = get_preview(job_id, layout)
+    if preview_payload:
+        response_data.update({
+            "message": "Analysis in progress. Showing an approximate preview from a sample of the file.",
+            "preview": orjson.Fragment(preview_payload),
+        })
+    return response_data
+
+
+def admission_denied_response(decision):
+    response = Response(
+        {"error": decision.reason, "retry_after": decision.retry_after, "queue_depth": decision.queue_depth},
+        status=decision.status,
+    )
+    response['Retry-After'] = str(decision.retry_after)
+    return response
+
+
+def result_etag(job_id: str, layout: str) -> str:
+    """
+    Strong ETag of a completed result. The job_id is the analysis key (content
+    hash, parameters and engine version), so the result for a given
+    (job_id, layout) never changes.
+    """
+    if layout == DEFAULT_RESULT_LAYOUT:
+        return f'"{job_id}"'
+    return f'"{job_id}.{layout}"'
+
+
+def etag_matches(if_none_match, etag: str, result_exists: bool = False) -> bool:
+    """
+    If-None-Match check (weak comparison), ignoring compression suffixes. `*`
+    matches only once the result is known to exist, i.e. after it was found.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            if result_exists:
+                return True
+            continue
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if strip_encoding_suffix(candidate) == etag:
+            return True
+    return False
+
+
+def set_result_cache_headers(response, etag: str):
+    """
+    Results never change, so browsers and the CDN may keep them (immutable).
+    They can be deleted (DeleteJobView), so shared caches hold them for only
+    WEATHER_RESULT_SHARED_MAX_AGE unless purged sooner (see cdn.py).
+    """
+    response['ETag'] = etag
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=getattr(settings, 'WEATHER_RESULT_MAX_AGE', 86400),
+        s_maxage=getattr(settings, 'WEATHER_RESULT_SHARED_MAX_AGE', 300),
+        immutable=True,
+    )
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
 class FileUploadView(APIView):
     """
     Handle file upload, record Job Metadata, and start Celery task.
-    Returns job_id (file hash) and celery_id.
+    Returns job_id (analysis key over the content hash and parameters) and celery_id.
     """
     def post(self, request, *args, **kwargs):
         if not s3_client or not dynamodb_client:
@@ -65,35 +263,55 @@ class FileUploadView(APIView):
                     "details": serializer.errors
                 }, status=400)
 
+            try:
+                layout = get_result_layout(request)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+
+            # Per-client token bucket, charged only for valid uploads and before any real work
+            rate_decision = consume_upload_token(client_identifier(request))
+            if not rate_decision.allowed:
+                return admission_denied_response(rate_decision)
+
             file_obj = serializer.validated_data['file']
+            params = serializer.validated_data['params']
             file_content = file_obj.read()
             file_extension = os.path.splitext(file_obj.name)[1].lower()
 
-            # Generate job ID, check cache, upload to S3 and start Celery task
-            job_id = get_file_hash(file_content)
-            s3_key = f"uploads/{job_id}{file_extension}"
+            # Generate job ID, check cache, upload to S3 and start Celery task.
+            # The job is one analysis of the file (content hash + parameters);
+            # the upload itself stays keyed by content, so re-analyses share it.
+            content_hash = get_file_hash(file_content)
+            job_id = analysis_key(content_hash, params)
+            s3_key = f"uploads/{content_hash}{file_extension}"
 
-            cache_key = f"analysis_result_{job_id}"
-            cached_result = cache.get(cache_key)
+            # Results too large for Redis are cached as summaries; the status
+            # endpoint serves the full result from DynamoDB.
+            cached_result = result_cache.get(job_id, layout, allow_summary=True)
             
             if cached_result:
                 return Response(
                     {
                         "job_id": job_id,
+                        "content_hash": content_hash,
+                        "params": params,
                         "status": "SUCCESS",
                         "message": "📋 File already analyzed within 24 hours. Results retrieved from cache.",
-                        "results": cached_result,
+                        "results": orjson.Fragment(cached_result),
                         "from_cache": True,
                     },
                     status=status.HTTP_200_OK,
                 )
 
-            content_type_map = {
-                '.csv': 'text/csv',
-                '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                '.xls': 'application/vnd.ms-excel'
-            }
-            content_type = content_type_map.get(file_extension, file_obj.content_type or "application/octet-stream")
+            # Backpressure: refuse new work when the analysis queue is saturated
+            queue_decision = check_queue_admission()
+            if not queue_decision.allowed:
+                return admission_denied_response(queue_decision)
+
+            # Approximate result from a bounded sample, shown until the exact one lands
+            preview_payloads = create_preview(job_id, file_content, file_extension, params)
+
+            content_type = UPLOAD_CONTENT_TYPES.get(file_extension, file_obj.content_type or "application/octet-stream")
 
             s3_client.put_object(
                 Bucket=settings.AWS_S3_BUCKET_NAME,
@@ -102,7 +320,8 @@ class FileUploadView(APIView):
                 ContentType=content_type,
             )
 
-            task = run_weather_analysis.delay(job_id, s3_key)
+            profile = should_profile(serializer.validated_data['profile'])
+            task = run_weather_analysis.delay(job_id, s3_key, params['group_by'], params, profile)
             dynamodb_client.put_item(
                 TableName=settings.DYNAMODB_METADATA_TABLE_NAME, 
                 Item={
@@ -111,19 +330,30 @@ class FileUploadView(APIView):
                     'status': {'S': task.status}, 
                     'timestamp': {'S': str(int(time.time()))},
                     's3_key': {'S': s3_key},
+                    'content_hash': {'S': content_hash},
+                    'params': {'S': orjson.dumps(params).decode()},
                 }
             )
 
-            return Response(
-                {
-                    "job_id": job_id,       # 文件哈希 (前端使用的主键)
-                    "celery_id": task.id,   # Celery ID (后端查询实时状态)
-                    "status": task.status,
-                    "message": "✅ File uploaded to S3 and Celery job started successfully.",
-                    "from_cache": False,
-                },
-                status=status.HTTP_202_ACCEPTED,
-            )
+            response_data = {
+                "job_id": job_id,       # 分析键: 文件哈希 + 参数 (前端使用的主键)
+                "content_hash": content_hash,
+                "params": params,
+                "celery_id": task.id,   # Celery ID (后端查询实时状态)
+                "status": task.status,
+                "message": "✅ File uploaded to S3 and Celery job started successfully.",
+                "from_cache": False,
+                "profile": profile,
+            }
+            if queue_decision.estimated_start_seconds:
+                # Accepted under load: tell the client roughly when work will begin
+                response_data.update({
+                    "queue_depth": queue_decision.queue_depth,
+                    "estimated_start_seconds": queue_decision.estimated_start_seconds,
+                })
+            if preview_payloads:
+                response_data["preview"] = orjson.Fragment(preview_payloads[layout])
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             print(f"[FileUpload ERROR] {type(e).__name__}: {e}")
@@ -136,7 +366,7 @@ class FileUploadView(APIView):
 
 class AnalysisStatusView(APIView):
     """
-    查询分析状态：阻塞模式。
+    查询分析状态：阻塞模式 (?wait=false 时为非阻塞模式，返回近似预览)。
     使用 job_id (文件哈希) 查找对应的 celery_id，阻塞等待任务完成，然后从 JobResults 获取结果。
     """
     def get(self, request, job_id, *args, **kwargs):
@@ -150,6 +380,31 @@ class AnalysisStatusView(APIView):
                 "error": "Invalid job ID format.",
                 "details": job_serializer.errors
             }, status=400)
+
+        try:
+            layout = get_result_layout(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        # A client holding this ETag already has the result, which never changes
+        etag = result_etag(job_id, layout)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return set_result_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        # Completed results are immutable, so a cache hit needs no Celery or DynamoDB lookup
+        cached_result = result_cache.get(
+            job_id, layout, loader=lambda: load_results_from_dynamodb(job_id, layout)
+        )
+        if cached_result:
+            if etag_matches(request.headers.get('If-None-Match'), etag, result_exists=True):
+                return set_result_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+            response_data = {
+                "status": "SUCCESS",
+                "job_id": job_id,
+                "message": "Analysis completed successfully (Fetched from cache).",
+                "results": orjson.Fragment(cached_result),
+            }
+            return set_result_cache_headers(Response(response_data, status=status.HTTP_200_OK), etag)
         
         try:
             # Query job status and return results
@@ -170,6 +425,10 @@ class AnalysisStatusView(APIView):
             celery_task_result = AsyncResult(celery_id)
 
             if not celery_task_result.ready():
+                if not wants_blocking_status(request.query_params.get('wait')):
+                    return Response(
+                        pending_status_data(job_id, celery_task_result.status, layout), status=status.HTTP_200_OK
+                    )
                 celery_task_result.wait(timeout=None, interval=1) 
             
             current_status = celery_task_result.status
@@ -179,27 +438,19 @@ class AnalysisStatusView(APIView):
             }
 
             if current_status == 'SUCCESS':
-                dynamodb_results_response = dynamodb_client.get_item(
-                    TableName=settings.DYNAMODB_RESULTS_TABLE_NAME, 
-                    Key={'job_id': {'S': job_id}} 
+                results_json_string = result_cache.get_or_load(
+                    job_id, layout, loader=lambda: load_results_from_dynamodb(job_id, layout)
                 )
-                
-                results_item = dynamodb_results_response.get('Item')
-                
-                if not results_item:
-                    raise ValueError("Analysis results not found in JobResults table.")
-
-                results_json_string = results_item.get('results', {}).get('S')
-                if not results_json_string:
-                     raise ValueError("Results data attribute missing in JobResults table item.")
-
-                final_analysis_results = json.loads(results_json_string)
+                if etag_matches(request.headers.get('If-None-Match'), etag, result_exists=True):
+                    return set_result_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+                # Already JSON: embedded verbatim by the ORJSON renderer
+                final_analysis_results = orjson.Fragment(results_json_string)
 
                 response_data.update({
                     "message": "Analysis completed successfully (Fetched from JobResults).",
                     "results": final_analysis_results
                 })
-                return Response(response_data, status=status.HTTP_200_OK)
+                return set_result_cache_headers(Response(response_data, status=status.HTTP_200_OK), etag)
 
             elif current_status == 'FAILURE':
                 error_details = str(celery_task_result.result)
@@ -289,11 +540,12 @@ class DeleteJobView(APIView):
             }, status=400)
         
         try:
-            # Delete from JobMetadata table
-            dynamodb_client.delete_item(
+            # Delete from JobMetadata table; the old item tells whether a profile was stored
+            metadata = dynamodb_client.delete_item(
                 TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
-                Key={'job_id': {'S': job_id}}
-            )
+                Key={'job_id': {'S': job_id}},
+                ReturnValues='ALL_OLD',
+            ).get('Attributes', {})
             
             # Delete from JobResults table
             dynamodb_client.delete_item(
@@ -301,9 +553,18 @@ class DeleteJobView(APIView):
                 Key={'job_id': {'S': job_id}}
             )
             
-            # Delete from Redis cache
-            cache_key = f"analysis_result_{job_id}"
-            cache.delete(cache_key)
+            # Delete from Redis and every process' local result cache
+            result_cache.invalidate(job_id)
+            discard_preview(job_id)
+            # Only once the result is gone, so the CDN cannot refetch it
+            purge_job_from_cdn(job_id)
+
+            # Delete the job's profile and offloaded result, if any; the job is gone either way
+            for name, s3_key in (stored_job_objects(job_id, metadata) if s3_client else []):
+                try:
+                    s3_client.delete_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=s3_key)
+                except Exception as e:
+                    print(f"[DELETE JOB] Failed to delete {name} of {job_id}: {type(e).__name__}: {e}")
             
             return Response(
                 {"message": f"Job {job_id} deleted successfully."},
@@ -316,4 +577,64 @@ class DeleteJobView(APIView):
             return Response(
                 {"error": f"Failed to delete job: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class JobProfileView(APIView):
+    """
+    Download the profile recorded for a job run with profile=true (or sampled by
+    WEATHER_PROFILE_SAMPLE_RATE): a speedscope file for https://www.speedscope.app.
+    ?summary=true returns the duration, peak memory and per-stage breakdown instead.
+    """
+    def get(self, request, job_id, *args, **kwargs):
+        if not s3_client or not dynamodb_client:
+            return Response({"error": "AWS clients are not initialized. Check server settings."}, status=500)
+
+        job_serializer = JobStatusSerializer(data={'job_id': job_id, 'status': 'PENDING', 'timestamp': 0})
+        if not job_serializer.is_valid():
+            return Response({
+                "error": "Invalid job ID format.",
+                "details": job_serializer.errors
+            }, status=400)
+
+        try:
+            item = dynamodb_client.get_item(
+                TableName=settings.DYNAMODB_METADATA_TABLE_NAME,
+                Key={'job_id': {'S': job_id}},
+                ProjectionExpression='job_id, #p',
+                ExpressionAttributeNames={'#p': 'profile'},
+            ).get('Item')
+            if not item:
+                return Response({"error": f"Job ID {job_id} not found."}, status=404)
+            summary_json = item.get('profile', {}).get('S')
+            if not summary_json:
+                return Response(
+                    {"error": f"No profile recorded for job {job_id}. Upload with profile=true to record one; "
+                              f"it is available once the analysis finishes."},
+                    status=404,
+                )
+
+            summary = orjson.loads(summary_json)
+            if (request.query_params.get('summary') or '').lower() in ('1', 'true', 'yes'):
+                return Response(summary, status=status.HTTP_200_OK)
+
+            profile_object = s3_client.get_object(Bucket=settings.AWS_S3_BUCKET_NAME, Key=summary['s3_key'])
+            response = HttpResponse(profile_object['Body'].read(), content_type='application/json')
+            response['Content-Disposition'] = f'attachment; filename="{job_id}.speedscope.json"'
+            return response
+
+        except Exception as e:
+            print(f"[PROFILE FETCH ERROR] {type(e).__name__}: {e}")
+            traceback.print_exc(file=sys.stdout)
+            return Response(
+                {"error": f"Failed to retrieve job profile: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss/eviction counters of this process' two-tier result cache.
+    """
+    def get(self, request, *args, **kwargs):
+        return Response(result_cache.stats(), status=status.HTTP_200_OK)